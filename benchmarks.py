@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+
+"""
+Benchmarks for the Python tools in this repository, kept out of the tools themselves.
+
+    ./benchmarks.py                          # run them all
+    ./benchmarks.py startup --baseline REV   # compare cold starts with an older commit
+
+The fixtures come from the tools' unit test modules.
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def _time_call(func, repeat: int = 5) -> float:
+    """
+    Time a callable and return the best wall clock time of a number of runs.
+
+    Args:
+        func: The callable to time.
+        repeat (int): The number of runs.
+
+    Returns:
+        float: The best run time in seconds.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def _median(values: List[float]) -> float:
+    return sorted(values)[len(values) // 2]
+
+def load_baseline(revision: str, path: str, replacements: Dict[str, str]) -> types.ModuleType:
+    """
+    Load a file as it was at an older commit, with its hard-coded system paths pointed at a fixture.
+
+    Args:
+        revision (str): The git revision.
+        path (str): The file, relative to the repository.
+        replacements (Dict[str, str]): Source snippets to replace, each must occur in the file.
+
+    Returns:
+        types.ModuleType: The loaded module.
+    """
+    source = subprocess.run(["git", "-C", HERE, "show", f"{revision}:{path}"], capture_output=True, text=True, check=True).stdout
+    for old, new in replacements.items():
+        if old not in source:
+            raise ValueError(f"{old!r} is not in {revision}:{path}")
+        source = source.replace(old, new)
+    module = types.ModuleType(f"{os.path.splitext(os.path.basename(path))[0]}_{revision}")
+    exec(compile(source, f"{revision}:{path}", "exec"), module.__dict__)
+    return module
+
+def benchmark_link_probe(baseline: Optional[str] = None, counts: Tuple[int, ...] = (10, 100, 300, 1000)) -> None:
+    """
+    Benchmark the in-process sysfs link probe against a fake sysfs tree of N interfaces, next to
+    the baseline's get_active_network_interfaces, which runs ls and then ifconfig once per device.
+    The fake devices don't exist, so there ifconfig fails after doing the same fork and exec.
+
+    Args:
+        baseline (Optional[str]): A git revision to compare with.
+        counts (Tuple[int, ...]): The interface counts to benchmark.
+    """
+    from network_services import is_link_active, read_sysfs_link_states
+    from test_network_services import make_fake_sysfs
+
+    print(f"{'interfaces':>10} {'sysfs probe':>14} {'per device':>12} {baseline or 'baseline':>12}")
+    for count in counts:
+        with tempfile.TemporaryDirectory() as root:
+            make_fake_sysfs(root, count)
+            probe = _time_call(lambda: [name for name, link in read_sysfs_link_states(root).items() if is_link_active(link)])
+            baseline_text = f"{'-':>12}"
+            if baseline:
+                old = load_baseline(baseline, "check_network_services.py", {'"/sys/class/net"': repr(root)})
+                baseline_text = f"{_time_call(old.get_active_network_interfaces, repeat=1) * 1000:10.1f}ms"
+        print(f"{count:>10} {probe * 1000:12.2f}ms {probe / count * 1e6:10.2f}us {baseline_text}")
+
+def benchmark_lease_parsing(baseline: Optional[str] = None, counts: Tuple[int, ...] = (1000, 10000, 50000)) -> None:
+    """
+    Benchmark lease file parsing on synthetic dhclient lease histories, cold and cached, next to
+    the baseline's get_dhcp_server. That scans the file line by line and stops at the first
+    dhcp-server-identifier, which is the oldest lease's and so usually the wrong server.
+
+    Args:
+        baseline (Optional[str]): A git revision to compare with.
+        counts (Tuple[int, ...]): The lease counts to benchmark.
+    """
+    from network_services import _LEASE_CACHE, parse_lease_file, select_lease
+    from test_network_services import make_dhclient_leases
+
+    print(f"{'leases':>8} {'size':>9} {'cold parse':>12} {'cached':>10} {baseline or 'baseline':>12}")
+    for count in counts:
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, "dhclient.eth0.leases")
+            make_dhclient_leases(path, count)
+            size = os.path.getsize(path)
+
+            def cold():
+                _LEASE_CACHE.pop(path, None)
+                select_lease(parse_lease_file(path), "eth0")
+
+            cold_time = _time_call(cold, repeat=3)
+            cached_time = _time_call(lambda: select_lease(parse_lease_file(path), "eth0"), repeat=100)
+            _LEASE_CACHE.pop(path, None)
+            baseline_text = f"{'-':>12}"
+            if baseline:
+                old = load_baseline(baseline, "check_network_services.py",
+                                    {'f"/var/lib/dhcp/dhclient.{interface}.leases"': f'f"{root}/dhclient.{{interface}}.leases"'})
+                baseline_text = f"{_time_call(lambda: old.get_dhcp_server('eth0'), repeat=3) * 1e6:10.1f}us"
+        print(f"{count:>8} {size / 1e6:7.1f}MB {cold_time * 1000:10.1f}ms {cached_time * 1e6:8.1f}us {baseline_text}")
+
+def benchmark_highlight_matching(counts: tuple = (10, 100, 1000), line_count: int = 5000) -> None:
+    """
+    Benchmarks the per-pattern loop against a PatternSet, without and with its literal prefilter.
+
+    Args:
+        counts (tuple): The pattern counts to benchmark.
+        line_count (int): The number of log lines to highlight per run, about 5% of which match.
+    """
+    from highlight_patterns import PatternSet, highlight_line
+    from test_highlight_patterns import make_benchmark_lines, make_benchmark_patterns
+
+    reset_color = "\033[0m"
+    print(f"{'patterns':>8} {'loop lines/s':>14} {'combined lines/s':>17} {'prefiltered lines/s':>20} {'speedup':>8}")
+    for count in counts:
+        patterns = make_benchmark_patterns(count)
+        combined = PatternSet(patterns, prefilter=False)
+        prefiltered = PatternSet(patterns)
+        lines = make_benchmark_lines(line_count, count)
+        expected = [highlight_line(line, patterns, reset_color) for line in lines]
+        for pattern_set in (combined, prefiltered):
+            if [highlight_line(line, pattern_set, reset_color) for line in lines] != expected:
+                raise AssertionError(f"PatternSet output differs from the loop at {count} patterns")
+
+        loop_time = _time_call(lambda: [highlight_line(line, patterns, reset_color) for line in lines], repeat=1 if count >= 1000 else 3)
+        combined_time = _time_call(lambda: [highlight_line(line, combined, reset_color) for line in lines], repeat=3)
+        prefiltered_time = _time_call(lambda: [highlight_line(line, prefiltered, reset_color) for line in lines], repeat=3)
+        print(f"{count:>8} {line_count / loop_time:>14,.0f} {line_count / combined_time:>17,.0f} "
+              f"{line_count / prefiltered_time:>20,.0f} {loop_time / prefiltered_time:>7.1f}x")
+
+def benchmark_highlight_io(size_mb: int = 64, pattern_count: int = 100) -> None:
+    """
+    Benchmarks process_input() and process_binary() against a plain copy of the same file.
+
+    Args:
+        size_mb (int): The size of the log file in MB, about 1% of whose lines match.
+        pattern_count (int): The number of patterns.
+    """
+    from highlight_patterns import BLOCK_SIZE, PatternSet, encode_patterns, process_binary, process_input, required_literal
+    from test_highlight_patterns import make_benchmark_lines, make_benchmark_patterns
+
+    # A pattern without a required literal makes every line a candidate, see PatternSet.candidate_lines()
+    patterns = PatternSet([pattern for pattern in make_benchmark_patterns(pattern_count) if required_literal(pattern[0])])
+    lines = make_benchmark_lines(20000, pattern_count, hit_rate=0.01)
+    chunk = ('\n'.join(lines) + '\n').encode('utf-8')
+    logging.getLogger().setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, 'input.log')
+        with open(path, 'wb') as file:
+            for _ in range(max(1, size_mb * 1000000 // len(chunk))):
+                file.write(chunk)
+        size = os.path.getsize(path) / 1e6
+
+        def run(process, mode):
+            with open(path, 'r' + mode) as input_stream, open(os.devnull, 'w' + mode) as output_stream:
+                process(input_stream, output_stream)
+
+        runs = (
+            ('copy', lambda i, o: shutil.copyfileobj(i, o, BLOCK_SIZE), 'b'),
+            ('process_input', lambda i, o: process_input(i, o, patterns, "\033[0m"), ''),
+            ('process_binary', lambda i, o: process_binary(i, o, encode_patterns(patterns), b"\033[0m"), 'b'),
+        )
+        print(f"{size:.0f}MB, {len(patterns)} patterns")
+        for name, process, mode in runs:
+            elapsed = _time_call(lambda: run(process, mode), repeat=1)
+            print(f"{name:>15} {size / elapsed:8.1f} MB/s")
+    logging.getLogger().setLevel(logging.INFO)
+
+def benchmark_highlight_jobs(size_mb: int = 64, pattern_count: int = 100) -> None:
+    """
+    Benchmarks process_parallel() at increasing numbers of worker processes.
+
+    Args:
+        size_mb (int): The size of the log file in MB, about 5% of whose lines match.
+        pattern_count (int): The number of patterns.
+    """
+    from highlight_patterns import process_parallel
+    from test_highlight_patterns import make_benchmark_lines, make_benchmark_patterns
+
+    patterns = make_benchmark_patterns(pattern_count)
+    chunk = ('\n'.join(make_benchmark_lines(20000, pattern_count)) + '\n').encode('utf-8')
+    cpus = os.cpu_count() or 1
+    logging.getLogger().setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as root:
+        path = Path(root) / 'input.log'
+        with path.open('wb') as file:
+            for _ in range(max(1, size_mb * 1000000 // len(chunk))):
+                file.write(chunk)
+        size = path.stat().st_size / 1e6
+
+        print(f"{size:.0f}MB, {pattern_count} patterns, {cpus} CPUs")
+        print(f"{'jobs':>5} {'MB/s':>8} {'speedup':>8}")
+        baseline = None
+        for jobs in sorted({1, 2, 4, cpus}):
+            with open(os.devnull, 'wb') as output_stream:
+                elapsed = _time_call(lambda: process_parallel(path, output_stream, patterns, "\033[0m", jobs), repeat=1)
+            baseline = baseline or elapsed
+            print(f"{jobs:>5} {size / elapsed:8.1f} {baseline / elapsed:7.1f}x")
+    logging.getLogger().setLevel(logging.INFO)
+
+def benchmark_highlight_startup(counts: tuple = (10, 100, 1000, 5000), repeat: int = 5) -> None:
+    """
+    Benchmarks how long highlight_patterns.py takes to highlight one line from a cold interpreter, with and without the pattern cache.
+
+    Args:
+        counts (tuple): The pattern counts to benchmark.
+        repeat (int): The number of runs, the fastest is reported.
+    """
+    from test_highlight_patterns import make_benchmark_config
+
+    print(f"{'patterns':>8} {'--no-cache':>11} {'cached':>9}")
+    for count in counts:
+        with tempfile.TemporaryDirectory() as root:
+            config_dir = Path(root) / 'config'
+            make_benchmark_config(config_dir, count)
+            env = dict(os.environ, XDG_CACHE_HOME=str(Path(root) / 'cache'))
+            command = [sys.executable, os.path.join(HERE, 'staging', 'highlight_patterns.py'), '--config-dir', str(config_dir)]
+
+            def run(*extra):
+                subprocess.run(command + list(extra), input=b"Oct 17 rtr1 %SYS-5-CONFIG_I: Configured\n",
+                               env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+
+            uncached = _time_call(lambda: run('--no-cache'), repeat=repeat)
+            run()  # Fills the cache
+            cached = _time_call(run, repeat=repeat)
+        print(f"{count:>8} {uncached * 1000:9.0f}ms {cached * 1000:7.0f}ms")
+
+def measure_startup(command: List[str], env: Optional[Dict[str, str]] = None, cwd: Optional[str] = None) -> Tuple[float, float]:
+    """
+    Measure one cold start of a Python command with -X importtime.
+
+    Args:
+        command (List[str]): The script and its arguments, run with the current interpreter.
+        env (Optional[Dict[str, str]]): Extra environment variables.
+        cwd (Optional[str]): The working directory.
+
+    Returns:
+        Tuple[float, float]: The wall time and the time spent importing, in ms.
+    """
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime"] + command, capture_output=True, text=True,
+                            env={**os.environ, **(env or {})}, cwd=cwd)
+    wall = (time.perf_counter() - start) * 1000
+    imports = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _self, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "):
+            imports += int(cumulative)
+    return wall, imports / 1000
+
+def benchmark_startup(baseline: Optional[str] = None, repeat: int = 15) -> None:
+    """
+    Benchmark the cold start of the scripts that run every few seconds, once with their
+    bytecode cached and once compiled on every run (PYTHONDONTWRITEBYTECODE or a
+    read-only checkout). Runs of the baseline and the working tree are interleaved.
+
+    Args:
+        baseline (Optional[str]): A git revision to compare with.
+        repeat (int): The number of runs of each, the median is reported.
+    """
+    plugins = "xbar-plugins"
+    commands = {
+        "check_network_services.py --help": (["check_network_services.py", "--help"], {}),
+        "001-internet-connectivity.2s.py": ([os.path.join(plugins, "001-internet-connectivity.2s.py")], {"PING_ADDRESS": "127.0.0.1"}),
+        "001-ssh.1m.py": ([os.path.join(plugins, "001-ssh.1m.py"), "-i", os.devnull, "-s", os.devnull], {}),
+    }
+    with tempfile.TemporaryDirectory() as root:
+        # Both trees are copied without any __pycache__, the compiled runs go first
+        # and the cached ones write the bytecode they then reuse.
+        trees = {}
+        if baseline:
+            trees[baseline] = os.path.join(root, "baseline")
+            os.makedirs(trees[baseline])
+            archive = subprocess.run(["git", "-C", HERE, "archive", baseline], capture_output=True, check=True).stdout
+            subprocess.run(["tar", "-x", "-C", trees[baseline]], input=archive, check=True)
+        trees["working tree"] = os.path.join(root, "working")
+        shutil.copytree(HERE, trees["working tree"], ignore=shutil.ignore_patterns(".git", "__pycache__"))
+
+        print(f"{'command':<34} {'bytecode':<9} {'tree':<13} {'wall':>9} {'imports':>9}")
+        for name, (command, env) in commands.items():
+            for mode in ("compiled", "cached"):
+                mode_env = {**env, "PYTHONDONTWRITEBYTECODE": "1" if mode == "compiled" else ""}
+                runs = {label: ([], []) for label in trees if os.path.exists(os.path.join(trees[label], command[0]))}
+                if mode == "cached":
+                    for label in runs:
+                        measure_startup(command, env=mode_env, cwd=trees[label])
+                for _ in range(repeat):
+                    for label, (walls, imports) in runs.items():
+                        wall, imported = measure_startup(command, env=mode_env, cwd=trees[label])
+                        walls.append(wall)
+                        imports.append(imported)
+                for label, (walls, imports) in runs.items():
+                    print(f"{name:<34} {mode:<9} {label:<13} {_median(walls):7.1f}ms {_median(imports):7.1f}ms")
+
+BENCHMARKS = {
+    "leases": lambda args: benchmark_lease_parsing(args.baseline),
+    "links": lambda args: benchmark_link_probe(args.baseline),
+    "startup": lambda args: benchmark_startup(args.baseline),
+    "highlight-io": lambda args: benchmark_highlight_io(),
+    "highlight-jobs": lambda args: benchmark_highlight_jobs(),
+    "highlight-matching": lambda args: benchmark_highlight_matching(),
+    "highlight-startup": lambda args: benchmark_highlight_startup(),
+}
+
+def main() -> None:
+    """
+    Main function to parse arguments and run the benchmarks.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the Python tools in this repository.")
+    parser.add_argument("benchmarks", nargs="*", metavar="NAME",
+                        help=f"Benchmarks to run ({', '.join(sorted(BENCHMARKS))}), all of them by default")
+    parser.add_argument("--baseline", metavar="REV", help="Git revision to compare with")
+    args = parser.parse_args()
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(unknown)}")
+
+    sys.path[:0] = [HERE, os.path.join(HERE, "staging")]
+    # The tools log every step at debug level, time the work rather than the logging
+    logging.disable(logging.DEBUG)
+    for name in args.benchmarks or BENCHMARKS:
+        print(f"== {name}")
+        BENCHMARKS[name](args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1712 @@
+#!/usr/bin/env python3
+
+# The code behind check_network_services.py. It lives in an importable module so
+# Python keeps its bytecode in __pycache__ instead of compiling it on every run.
+# Only what every run needs is imported up front, the rest where it's used,
+# as this runs from status bars and monitoring every few seconds. typing takes
+# as long to import as logging, so annotations are left unevaluated and it is
+# only imported by type checkers.
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import socket
+import struct
+import sys
+import threading
+import time
+import logging
+from functools import partial
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    import http.server
+    import socketserver
+    from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Constants for indicators
+DEFAULT_ALL_OK = "\033[32m✦\033[0m"
+DEFAULT_O_SHIT = "\033[31m✧\033[0m"
+FUN_MODE_ALL_OK = "👌"
+FUN_MODE_O_SHIT = "💩"
+
+# DHCP lease files; {interface} is filled in, systemd-networkd names them by ifindex
+DHCP_LEASE_GLOBS = [
+    "/var/lib/dhcp/dhclient.{interface}.leases",
+    "/var/lib/dhcp/dhclient-*-{interface}.lease",
+    "/var/lib/dhclient/dhclient-*-{interface}.lease",
+    "/var/lib/dhclient/dhclient-{interface}.leases",
+    "/var/lib/NetworkManager/dhclient-*-{interface}.lease",
+    "/var/lib/NetworkManager/internal-*-{interface}.lease",
+    "/var/lib/dhcpcd/{interface}.lease",
+    "/var/lib/dhcpcd5/dhcpcd-{interface}.lease",
+    "/var/db/dhcpcd/{interface}.lease",
+]
+NETWORKD_LEASE_DIR = "/run/systemd/netif/leases"
+DHCLIENT_LEASE_RE = re.compile(r"^lease \{([^}]*)\}", re.MULTILINE)
+DHCLIENT_FIELD_RE = re.compile(r"^\s*(interface|option dhcp-server-identifier|expire)\s+([^;]*);", re.MULTILINE)
+BOOTP_OPTIONS_OFFSET = 240
+DHCP_MAGIC_COOKIE = b"\x63\x82\x53\x63"
+DHCP_OPTION_PAD = 0
+DHCP_OPTION_LEASE_TIME = 51
+DHCP_OPTION_SERVER_IDENTIFIER = 54
+DHCP_OPTION_END = 255
+# Parsed lease files keyed by path: ((inode, mtime, size), leases)
+_LEASE_CACHE: Dict[str, Tuple[tuple, List[dict]]] = {}
+
+# Reachability probing
+RESOLV_CONF = "/etc/resolv.conf"
+PROBE_TIMEOUT = 1
+PROBE_DEADLINE = 3
+MAX_PROBE_WORKERS = 32
+
+# Fleet mode
+FLEET_PORT = 9753
+FLEET_TIMEOUT = 5
+FLEET_CACHE_TTL = 2
+MAX_FLEET_WORKERS = 256
+
+# Prometheus exporter
+EXPORTER_INTERVAL = 15
+METRICS_PREFIX = "check_network_services"
+METRICS = {
+    "interface_up": ("gauge", "Whether the interface is up with a carrier."),
+    "gateway_reachable": ("gauge", "Whether the default gateway accepted a TCP connection on port 80."),
+    "dns_up": ("gauge", "Whether the nameserver answered NOERROR."),
+    "dns_latency_seconds": ("gauge", "Time until the nameserver answered, per query type."),
+    "dhcp_server_info": ("gauge", "The DHCP server the interface got its lease from."),
+    "collection_duration_seconds": ("gauge", "How long the last collection took."),
+    "last_collection_timestamp_seconds": ("gauge", "When the last collection finished."),
+}
+
+# DNS wire format
+DNS_TYPE_A = 1
+DNS_TYPE_AAAA = 28
+DNS_TYPE_NAMES = {DNS_TYPE_A: "A", DNS_TYPE_AAAA: "AAAA"}
+DNS_CLASS_IN = 1
+DNS_FLAG_QR = 0x8000
+DNS_FLAG_TC = 0x0200
+DNS_FLAG_RD = 0x0100
+DNS_RCODE_NOERROR = 0
+
+# Linux link state sources
+SYSFS_NET_DIR = "/sys/class/net"
+NETLINK_ROUTE = 0
+NLMSGHDR_LEN = 16
+IFINFOMSG_LEN = 16
+IFADDRMSG_LEN = 8
+RTMSG_LEN = 12
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 0x2
+NLMSG_DONE = 0x3
+RTM_GETLINK = 18
+RTM_GETADDR = 22
+RTM_GETROUTE = 26
+IFLA_IFNAME = 3
+IFLA_OPERSTATE = 16
+IFLA_CARRIER = 33
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+RTA_OIF = 4
+RTA_GATEWAY = 5
+RTA_TABLE = 15
+RT_TABLE_MAIN = 254
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+RTMGRP_IPV6_IFADDR = 0x100
+RTF_GATEWAY = 0x2
+IFF_UP = 0x1
+IFF_LOOPBACK = 0x8
+# RFC 2863 operational states, as used by IFLA_OPERSTATE and sysfs operstate
+OPERSTATES = {0: "unknown", 1: "notpresent", 2: "down", 3: "lowerlayerdown", 4: "testing", 5: "dormant", 6: "up"}
+
+# Global variables for indicators
+ALL_OK = DEFAULT_ALL_OK
+O_SHIT = DEFAULT_O_SHIT
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG, format='[%(levelname)s] %(message)s')
+logger = logging.getLogger()
+
+def set_status_indicators(fun_mode: bool) -> None:
+    """
+    Set global status indicators based on whether fun mode is enabled.
+
+    Args:
+        fun_mode (bool): Whether fun mode is enabled.
+    """
+    global ALL_OK, O_SHIT
+    if fun_mode:
+        ALL_OK = FUN_MODE_ALL_OK
+        O_SHIT = FUN_MODE_O_SHIT
+    else:
+        ALL_OK = DEFAULT_ALL_OK
+        O_SHIT = DEFAULT_O_SHIT
+
+def _netlink_dump(msg_type: int, payload: bytes) -> Iterator[Tuple[int, bytes]]:
+    """
+    Send a single rtnetlink dump request and yield every reply message.
+
+    Args:
+        msg_type (int): The rtnetlink request type, e.g. RTM_GETLINK.
+        payload (bytes): The family specific request header.
+
+    Yields:
+        Tuple[int, bytes]: The message type and the message body (without nlmsghdr).
+    """
+    with socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE) as sock:
+        sock.bind((0, 0))
+        header = struct.pack("=IHHII", NLMSGHDR_LEN + len(payload), msg_type, NLM_F_REQUEST | NLM_F_DUMP, 1, 0)
+        sock.sendall(header + payload)
+        while True:
+            data = sock.recv(65536)
+            offset = 0
+            while offset + NLMSGHDR_LEN <= len(data):
+                length, reply_type, _flags, _seq, _pid = struct.unpack_from("=IHHII", data, offset)
+                if length < NLMSGHDR_LEN:
+                    return
+                if reply_type == NLMSG_DONE:
+                    return
+                if reply_type == NLMSG_ERROR:
+                    error = struct.unpack_from("=i", data, offset + NLMSGHDR_LEN)[0]
+                    raise OSError(-error, os.strerror(-error))
+                yield reply_type, data[offset + NLMSGHDR_LEN:offset + length]
+                offset += (length + 3) & ~3
+
+def _parse_rtattrs(data: bytes, offset: int) -> Dict[int, bytes]:
+    """
+    Parse a chain of rtnetlink attributes into a dictionary keyed by attribute type.
+
+    Args:
+        data (bytes): The message body.
+        offset (int): Where the attributes start within the body.
+
+    Returns:
+        Dict[int, bytes]: Attribute payloads keyed by attribute type.
+    """
+    attrs = {}
+    while offset + 4 <= len(data):
+        length, attr_type = struct.unpack_from("=HH", data, offset)
+        if length < 4:
+            break
+        attrs[attr_type] = data[offset + 4:offset + length]
+        offset += (length + 3) & ~3
+    return attrs
+
+def read_netlink_link_states() -> Dict[str, dict]:
+    """
+    Read the link state of every interface with one RTM_GETLINK dump.
+
+    Returns:
+        Dict[str, dict]: Link state (operstate, carrier, flags) keyed by interface name.
+    """
+    links = {}
+    for _msg_type, body in _netlink_dump(RTM_GETLINK, struct.pack("=BxHiII", socket.AF_UNSPEC, 0, 0, 0, 0)):
+        _family, _type, index, flags, _change = struct.unpack_from("=BxHiII", body)
+        attrs = _parse_rtattrs(body, IFINFOMSG_LEN)
+        if IFLA_IFNAME not in attrs:
+            continue
+        name = attrs[IFLA_IFNAME].rstrip(b"\0").decode()
+        operstate = attrs.get(IFLA_OPERSTATE, b"\0")[0]
+        carrier = attrs.get(IFLA_CARRIER, b"\0")[0]
+        links[name] = {
+            "index": index,
+            "operstate": OPERSTATES.get(operstate, "unknown"),
+            "carrier": carrier,
+            "flags": flags,
+        }
+    return links
+
+def read_sysfs_link_states(sysfs_dir: str = SYSFS_NET_DIR) -> Dict[str, dict]:
+    """
+    Read the link state of every interface from sysfs in a single directory pass.
+
+    Args:
+        sysfs_dir (str): The sysfs network class directory.
+
+    Returns:
+        Dict[str, dict]: Link state (operstate, carrier, flags) keyed by interface name.
+    """
+    def read_attr(path: str) -> str:
+        try:
+            with open(path, "r") as file:
+                return file.read().strip()
+        except OSError:
+            # carrier raises EINVAL while the link is administratively down
+            return ""
+
+    links = {}
+    with os.scandir(sysfs_dir) as entries:
+        for entry in entries:
+            base = entry.path
+            carrier = read_attr(f"{base}/carrier")
+            flags = read_attr(f"{base}/flags")
+            links[entry.name] = {
+                "index": int(read_attr(f"{base}/ifindex") or 0),
+                "operstate": read_attr(f"{base}/operstate") or "unknown",
+                "carrier": int(carrier) if carrier.isdigit() else 0,
+                "flags": int(flags, 16) if flags else 0,
+            }
+    return links
+
+def is_link_active(link: dict) -> bool:
+    """
+    Decide whether a link is active, i.e. administratively up with a carrier, and not a loopback.
+
+    Args:
+        link (dict): Link state as returned by read_netlink_link_states() or read_sysfs_link_states().
+
+    Returns:
+        bool: Whether the link is active.
+    """
+    if link["flags"] & IFF_LOOPBACK or not link["flags"] & IFF_UP:
+        return False
+    # Virtual devices (tun, wireguard, ...) often report "unknown" but do have a carrier
+    return link["operstate"] == "up" or (link["operstate"] == "unknown" and link["carrier"] == 1)
+
+def get_linux_link_states() -> Dict[str, dict]:
+    """
+    Retrieve the link state of every interface on Linux, preferring rtnetlink and falling back to sysfs.
+
+    Returns:
+        Dict[str, dict]: Link state keyed by interface name.
+    """
+    try:
+        return read_netlink_link_states()
+    except OSError as e:
+        logger.debug(f"rtnetlink unavailable ({e}), falling back to {SYSFS_NET_DIR}")
+        return read_sysfs_link_states()
+
+def get_active_network_interfaces() -> List[str]:
+    """
+    Retrieve a list of active network interfaces. Cross-platform support for Linux, macOS, and Windows.
+
+    On Linux the link state of every interface is read in-process in a single pass.
+    On macOS each device is checked with ifconfig.
+
+    Returns:
+        List[str]: A list of active network interface names.
+    """
+    logger.debug("Getting list of network services")
+    if os.name == "posix" and os.uname().sysname != "Darwin":
+        try:
+            links = get_linux_link_states()
+        except OSError as e:
+            logger.error(f"Error reading network interfaces: {e}")
+            return []
+        logger.debug(f"Link states: {links}")
+        active_interfaces = [name for name, link in links.items() if is_link_active(link)]
+        logger.debug(f"Active interfaces: {active_interfaces}")
+        return active_interfaces
+
+    import subprocess
+    try:
+        if os.name == "posix":
+            services = subprocess.check_output(
+                ["networksetup", "-listnetworkserviceorder"], text=True
+            )
+            devices = [
+                line.split()[-1].strip(")")
+                for line in services.splitlines()
+                if "Device:" in line and line.split()[-1] != "Device: )"
+            ]
+        elif os.name == "nt":
+            devices = subprocess.check_output(
+                ["netsh", "interface", "show", "interface"], text=True
+            ).splitlines()
+            # netsh has already filtered on state, there's no ifconfig to ask
+            return [line.split()[-1] for line in devices if "Connected" in line]
+        else:
+            raise OSError("Unsupported operating system")
+
+        logger.debug(f"Devices found: {devices}")
+        active_interfaces = []
+        for device in devices:
+            logger.debug(f"Checking status of device: {device}")
+            ifconfig_output = subprocess.run(
+                ["ifconfig", device], capture_output=True, text=True
+            )
+            if "status: active" in ifconfig_output.stdout:
+                logger.debug(f"Device {device} is active")
+                active_interfaces.append(device)
+            else:
+                logger.debug(f"Device {device} is not active")
+        logger.debug(f"Active interfaces: {active_interfaces}")
+        return active_interfaces
+    except (subprocess.CalledProcessError, OSError) as e:
+        logger.error(f"Error getting network interfaces: {e}")
+        return []
+
+def _netmask_to_prefix(netmask: str) -> int:
+    """
+    Convert a netmask in dotted quad (255.255.255.0) or hex (0xffffff00) notation to a prefix length.
+
+    Args:
+        netmask (str): The netmask.
+
+    Returns:
+        int: The prefix length.
+    """
+    if netmask.startswith("0x"):
+        return bin(int(netmask, 16)).count("1")
+    return sum(bin(int(octet)).count("1") for octet in netmask.split("."))
+
+def _new_snapshot_entry() -> dict:
+    return {"ip": None, "cidr": None, "gateway": None, "addresses": [], "ipv6": []}
+
+def _add_address(snapshot: Dict[str, dict], interface: str, address: str, prefix: int) -> None:
+    entry = snapshot.setdefault(interface, _new_snapshot_entry())
+    if ":" in address:
+        entry["ipv6"].append(f"{address}/{prefix}")
+        return
+    entry["addresses"].append(f"{address}/{prefix}")
+    # The first IPv4 address is the primary one, like the first "inet" line of ifconfig
+    if entry["ip"] is None:
+        entry["ip"] = address
+        entry["cidr"] = str(prefix)
+
+def _add_default_gateway(snapshot: Dict[str, dict], interface: str, gateway: str) -> None:
+    entry = snapshot.setdefault(interface, _new_snapshot_entry())
+    if entry["gateway"] is None:
+        entry["gateway"] = gateway
+
+def read_netlink_snapshot() -> Dict[str, dict]:
+    """
+    Collect all addresses and default routes with one RTM_GETLINK, RTM_GETADDR and RTM_GETROUTE dump each.
+
+    Returns:
+        Dict[str, dict]: Addresses and default gateway keyed by interface name.
+    """
+    names = {link["index"]: name for name, link in read_netlink_link_states().items()}
+    snapshot = {}
+    for _msg_type, body in _netlink_dump(RTM_GETADDR, struct.pack("=BBBBI", socket.AF_UNSPEC, 0, 0, 0, 0)):
+        family, prefix, _flags, _scope, index = struct.unpack_from("=BBBBI", body)
+        attrs = _parse_rtattrs(body, IFADDRMSG_LEN)
+        # IFA_ADDRESS is the peer on point-to-point links, IFA_LOCAL is always our own address
+        raw = attrs.get(IFA_LOCAL, attrs.get(IFA_ADDRESS))
+        if raw is None or index not in names:
+            continue
+        _add_address(snapshot, names[index], socket.inet_ntop(family, raw), prefix)
+    for _msg_type, body in _netlink_dump(RTM_GETROUTE, struct.pack("=BBBBBBBBI", socket.AF_INET, 0, 0, 0, 0, 0, 0, 0, 0)):
+        family, dst_len, _src_len, _tos, table, _protocol, _scope, _type, _flags = struct.unpack_from("=BBBBBBBBI", body)
+        attrs = _parse_rtattrs(body, RTMSG_LEN)
+        if RTA_TABLE in attrs:
+            table = struct.unpack("=I", attrs[RTA_TABLE])[0]
+        if dst_len != 0 or table != RT_TABLE_MAIN or RTA_GATEWAY not in attrs or RTA_OIF not in attrs:
+            continue
+        index = struct.unpack("=I", attrs[RTA_OIF])[0]
+        if index in names:
+            _add_default_gateway(snapshot, names[index], socket.inet_ntop(family, attrs[RTA_GATEWAY]))
+    return snapshot
+
+def read_procfs_snapshot(proc_dir: str = "/proc/net") -> Dict[str, dict]:
+    """
+    Collect all addresses and default routes from /proc/net/route, /proc/net/fib_trie and /proc/net/if_inet6.
+
+    fib_trie lists our local addresses but not their interface, so each one is
+    matched against the connected routes in the routing table instead.
+
+    Args:
+        proc_dir (str): The procfs network directory.
+
+    Returns:
+        Dict[str, dict]: Addresses and default gateway keyed by interface name.
+    """
+    def hex_to_ip(value: str) -> int:
+        # /proc/net/route is in host byte order
+        return struct.unpack("!I", struct.pack("=I", int(value, 16)))[0]
+
+    snapshot = {}
+    connected = []
+    with open(f"{proc_dir}/route", "r") as file:
+        next(file)
+        for line in file:
+            fields = line.split()
+            interface, destination, gateway, flags, mask = fields[0], hex_to_ip(fields[1]), hex_to_ip(fields[2]), int(fields[3], 16), hex_to_ip(fields[7])
+            if destination == 0 and mask == 0 and flags & RTF_GATEWAY:
+                _add_default_gateway(snapshot, interface, socket.inet_ntoa(struct.pack("!I", gateway)))
+            elif not flags & RTF_GATEWAY:
+                connected.append((bin(mask).count("1"), destination, mask, interface))
+    connected.sort(reverse=True)
+
+    local_addresses = []
+    with open(f"{proc_dir}/fib_trie", "r") as file:
+        previous = ""
+        for line in file:
+            if line.strip() == "/32 host LOCAL":
+                address = previous.split()[-1]
+                if address not in local_addresses:
+                    local_addresses.append(address)
+            previous = line
+    for address in local_addresses:
+        value = struct.unpack("!I", socket.inet_aton(address))[0]
+        for prefix, destination, mask, interface in connected:
+            if value & mask == destination:
+                _add_address(snapshot, interface, address, prefix)
+                break
+
+    try:
+        with open(f"{proc_dir}/if_inet6", "r") as file:
+            for line in file:
+                raw, _index, prefix, _scope, _flags, interface = line.split()
+                _add_address(snapshot, interface, socket.inet_ntop(socket.AF_INET6, bytes.fromhex(raw)), int(prefix, 16))
+    except FileNotFoundError:
+        pass  # IPv6 disabled
+    return snapshot
+
+def read_ifconfig_snapshot() -> Dict[str, dict]:
+    """
+    Collect all addresses and default routes from one ifconfig and one netstat -nr run.
+
+    Returns:
+        Dict[str, dict]: Addresses and default gateway keyed by interface name.
+    """
+    import subprocess
+    try:
+        ifconfig_output = subprocess.check_output(["ifconfig"], text=True)
+        netstat_output = subprocess.check_output(["netstat", "-nr"], text=True)
+    except subprocess.CalledProcessError as e:
+        raise OSError(f"{e.cmd[0]} failed with exit code {e.returncode}") from e
+
+    snapshot = {}
+    interface = None
+    for line in ifconfig_output.splitlines():
+        if line and not line[0].isspace():
+            interface = line.split(":")[0]
+            continue
+        fields = line.split()
+        if interface is None or len(fields) < 2:
+            continue
+        if fields[0] == "inet" and "netmask" in fields:
+            _add_address(snapshot, interface, fields[1], _netmask_to_prefix(fields[fields.index("netmask") + 1]))
+        elif fields[0] == "inet6" and "prefixlen" in fields:
+            _add_address(snapshot, interface, fields[1].split("%")[0], int(fields[fields.index("prefixlen") + 1]))
+
+    for line in netstat_output.splitlines():
+        fields = line.split()
+        if not line.startswith("default") or len(fields) < 2:
+            continue
+        for field in fields[2:]:
+            if field in snapshot:
+                _add_default_gateway(snapshot, field, fields[1])
+                break
+    return snapshot
+
+def collect_network_snapshot() -> Dict[str, dict]:
+    """
+    Collect the addresses, netmasks and default gateways of all interfaces in one go.
+
+    Returns:
+        Dict[str, dict]: Addresses and default gateway keyed by interface name.
+    """
+    try:
+        if os.name == "posix" and os.uname().sysname != "Darwin":
+            try:
+                snapshot = read_netlink_snapshot()
+            except OSError as e:
+                logger.debug(f"rtnetlink unavailable ({e}), falling back to /proc/net")
+                snapshot = read_procfs_snapshot()
+        elif os.name == "posix":
+            snapshot = read_ifconfig_snapshot()
+        else:
+            raise OSError("Unsupported operating system")
+    except (OSError, ValueError) as e:
+        logger.error(f"Error collecting network snapshot: {e}")
+        return {}
+    logger.debug(f"Network snapshot: {snapshot}")
+    return snapshot
+
+def get_interface_details(interface: str, snapshot: Optional[Dict[str, dict]] = None) -> Tuple[str, str, str]:
+    """
+    Retrieve the IP address, CIDR notation, and default gateway for a given interface.
+
+    Args:
+        interface (str): The network interface name.
+        snapshot (Optional[Dict[str, dict]]): A snapshot from collect_network_snapshot(), collected if not given.
+
+    Returns:
+        Tuple[str, str, str]: IP address, CIDR notation, and default gateway.
+    """
+    if snapshot is None:
+        snapshot = collect_network_snapshot()
+    try:
+        entry = snapshot.get(interface)
+        if entry is None or entry["ip"] is None:
+            raise ValueError("No IP address found for interface")
+        if entry["gateway"] is None:
+            raise ValueError("No gateway found for interface")
+        logger.debug(f"Interface: {interface}, IP: {entry['ip']}, CIDR: {entry['cidr']}, Gateway: {entry['gateway']}")
+        return entry["ip"], entry["cidr"], entry["gateway"]
+    except ValueError as e:
+        logger.error(f"Error parsing interface details for {interface}: {e}")
+        return (None, None, None)
+
+def find_lease_files(interface: str) -> List[str]:
+    """
+    Find the DHCP lease files for an interface, across dhclient, dhcpcd, NetworkManager and systemd-networkd.
+
+    Args:
+        interface (str): The network interface name.
+
+    Returns:
+        List[str]: Existing lease file paths.
+    """
+    import glob
+
+    paths = []
+    for pattern in DHCP_LEASE_GLOBS:
+        paths.extend(sorted(glob.glob(pattern.format(interface=glob.escape(interface)))))
+    try:
+        index = socket.if_nametoindex(interface)
+        paths.extend(glob.glob(f"{NETWORKD_LEASE_DIR}/{index}"))
+    except OSError:
+        pass
+    return paths
+
+def _parse_dhclient_time(value: str) -> Optional[float]:
+    # "2 2024/06/25 12:00:00" (UTC), "epoch 1719316800" or "never"
+    import calendar
+    fields = value.split()
+    if not fields or fields[0] == "never":
+        return None
+    if fields[0] == "epoch":
+        return float(fields[1])
+    year, month, day = fields[1].split("/")
+    hour, minute, second = fields[2].split(":")
+    return calendar.timegm((int(year), int(month), int(day), int(hour), int(minute), int(second)))
+
+def parse_dhclient_leases(data: str) -> List[dict]:
+    """
+    Parse an ISC dhclient lease file, which dhclient appends every new lease to.
+
+    Args:
+        data (str): The lease file contents.
+
+    Returns:
+        List[dict]: The leases in file order, with interface, server and expires (epoch seconds, None for never).
+    """
+    leases = []
+    for block in DHCLIENT_LEASE_RE.finditer(data):
+        fields = dict(DHCLIENT_FIELD_RE.findall(block.group(1)))
+        server = fields.get("option dhcp-server-identifier")
+        if server is None:
+            continue
+        interface = fields.get("interface", "").strip('"') or None
+        leases.append({"interface": interface, "server": server, "expires": _parse_dhclient_time(fields.get("expire", "never"))})
+    return leases
+
+def parse_dhcpcd_lease(data: bytes, mtime: float) -> List[dict]:
+    """
+    Parse a dhcpcd lease file, which is the raw BOOTP reply.
+
+    Args:
+        data (bytes): The lease file contents.
+        mtime (float): When the lease was written, as the lease time counts from there.
+
+    Returns:
+        List[dict]: The lease, if the reply carries a server identifier.
+    """
+    if len(data) < BOOTP_OPTIONS_OFFSET or data[BOOTP_OPTIONS_OFFSET - 4:BOOTP_OPTIONS_OFFSET] != DHCP_MAGIC_COOKIE:
+        return []
+    options = {}
+    offset = BOOTP_OPTIONS_OFFSET
+    while offset < len(data) and data[offset] != DHCP_OPTION_END:
+        if data[offset] == DHCP_OPTION_PAD:
+            offset += 1
+            continue
+        if offset + 1 >= len(data):
+            break
+        code, length = data[offset], data[offset + 1]
+        options[code] = data[offset + 2:offset + 2 + length]
+        offset += 2 + length
+    server = options.get(DHCP_OPTION_SERVER_IDENTIFIER)
+    if server is None or len(server) != 4:
+        return []
+    lease_time = options.get(DHCP_OPTION_LEASE_TIME)
+    expires = None
+    if lease_time is not None and len(lease_time) == 4 and lease_time != b"\xff\xff\xff\xff":
+        expires = mtime + struct.unpack("!I", lease_time)[0]
+    return [{"interface": None, "server": socket.inet_ntoa(server), "expires": expires}]
+
+def parse_networkd_lease(data: str, mtime: float) -> List[dict]:
+    """
+    Parse a systemd-networkd (or NetworkManager internal client) KEY=VALUE lease file.
+
+    Args:
+        data (str): The lease file contents.
+        mtime (float): When the lease was written, as the lifetime counts from there.
+
+    Returns:
+        List[dict]: The lease, if it names a server.
+    """
+    fields = dict(line.split("=", 1) for line in data.splitlines() if "=" in line and not line.startswith("#"))
+    server = fields.get("SERVER_ADDRESS")
+    if not server:
+        return []
+    lifetime = fields.get("LIFETIME")
+    expires = mtime + int(lifetime) if lifetime and lifetime.isdigit() else None
+    return [{"interface": None, "server": server, "expires": expires}]
+
+def parse_lease_file(path: str) -> List[dict]:
+    """
+    Parse a lease file of any supported format, reusing the previous result while the file is unchanged.
+
+    The cache is keyed by path and validated against inode, mtime and size, so
+    unchanged (possibly multi-megabyte) lease histories are never re-read.
+
+    Args:
+        path (str): The lease file path.
+
+    Returns:
+        List[dict]: The leases in the file, oldest first.
+    """
+    stat = os.stat(path)
+    fingerprint = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    cached = _LEASE_CACHE.get(path)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+    with open(path, "rb") as file:
+        data = file.read()
+    if data[BOOTP_OPTIONS_OFFSET - 4:BOOTP_OPTIONS_OFFSET] == DHCP_MAGIC_COOKIE:
+        leases = parse_dhcpcd_lease(data, stat.st_mtime)
+    else:
+        text = data.decode("utf-8", errors="replace")
+        if "lease {" in text:
+            leases = parse_dhclient_leases(text)
+        else:
+            leases = parse_networkd_lease(text, stat.st_mtime)
+    _LEASE_CACHE[path] = (fingerprint, leases)
+    return leases
+
+def select_lease(leases: List[dict], interface: str, now: Optional[float] = None) -> Optional[dict]:
+    """
+    Pick the most recent unexpired lease for an interface.
+
+    Args:
+        leases (List[dict]): Leases, oldest first.
+        interface (str): The network interface name; leases for other interfaces are skipped.
+        now (Optional[float]): The current time in epoch seconds.
+
+    Returns:
+        Optional[dict]: The lease, or None if every lease has expired.
+    """
+    if now is None:
+        now = time.time()
+    for lease in reversed(leases):
+        if lease["interface"] not in (None, interface):
+            continue
+        if lease["expires"] is None or lease["expires"] > now:
+            return lease
+    return None
+
+def get_dhcp_server(interface: str) -> str:
+    """
+    Retrieve the DHCP server address for a given interface. Cross-platform support for Linux, macOS, and Windows.
+
+    Args:
+        interface (str): The network interface name.
+
+    Returns:
+        str: The DHCP server address.
+    """
+    logger.debug(f"Getting DHCP server for interface: {interface}")
+    if os.name == "posix" and os.uname().sysname != "Darwin":
+        try:
+            lease_files = find_lease_files(interface)
+            if not lease_files:
+                raise FileNotFoundError(f"DHCP lease file not found for interface {interface}")
+            leases = []
+            for lease_file in lease_files:
+                leases.extend(parse_lease_file(lease_file))
+        except FileNotFoundError as e:
+            logger.error(f"Error finding DHCP lease file for {interface}: {e}")
+            return "DHCP lease file not found"
+        # Across files and clients, the lease that runs the longest is the most recent one
+        leases.sort(key=lambda lease: float("inf") if lease["expires"] is None else lease["expires"])
+        lease = select_lease(leases, interface)
+        return lease["server"] if lease is not None else "No DHCP server found"
+
+    import subprocess
+    try:
+        if os.name == "posix":
+            dhcp_server = subprocess.check_output(
+                ["ipconfig", "getpacket", interface], text=True
+            ).splitlines()
+            for line in dhcp_server:
+                if "server_identifier" in line:
+                    return line.split()[-1]
+        elif os.name == "nt":
+            dhcp_server = subprocess.check_output(
+                ["netsh", "interface", "ip", "show", "config", "name=", interface], text=True
+            ).splitlines()
+            for line in dhcp_server:
+                if "DHCP Server" in line:
+                    return line.split(":")[-1].strip()
+        else:
+            raise OSError("Unsupported operating system")
+        return "No DHCP server found"
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Error getting DHCP server for {interface}: {e}")
+        return "Error retrieving DHCP server"
+
+def read_nameservers(resolv_conf: str = RESOLV_CONF) -> List[str]:
+    """
+    Read the nameservers listed in resolv.conf.
+
+    Args:
+        resolv_conf (str): Path to resolv.conf.
+
+    Returns:
+        List[str]: The nameserver addresses, in order.
+    """
+    try:
+        with open(resolv_conf, "r") as file:
+            lines = file.readlines()
+        return [line.split()[1] for line in lines if line.startswith("nameserver")]
+    except FileNotFoundError:
+        return []
+
+def probe_tcp(host: str, port: int, timeout: float = PROBE_TIMEOUT) -> bool:
+    """
+    Check whether a TCP connection can be established to a host.
+
+    Args:
+        host (str): The host to connect to.
+        port (int): The TCP port.
+        timeout (float): The connect timeout in seconds.
+
+    Returns:
+        bool: Whether the connection succeeded.
+    """
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+def build_dns_query(fqdn: str, qtype: int, query_id: int) -> bytes:
+    """
+    Build a recursive DNS query in wire format.
+
+    Args:
+        fqdn (str): The fully qualified domain name to lookup.
+        qtype (int): The query type, e.g. DNS_TYPE_A.
+        query_id (int): The 16 bit query ID.
+
+    Returns:
+        bytes: The query message.
+    """
+    header = struct.pack("!HHHHHH", query_id, DNS_FLAG_RD, 1, 0, 0, 0)
+    qname = b"".join(bytes([len(label)]) + label for label in (part.encode("idna") for part in fqdn.rstrip(".").split(".")) if label)
+    return header + qname + b"\0" + struct.pack("!HH", qtype, DNS_CLASS_IN)
+
+def _skip_dns_name(data: bytes, offset: int) -> int:
+    while True:
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            return offset + 2  # compression pointer
+        offset += 1 + length
+        if length == 0:
+            return offset
+
+def parse_dns_response(data: bytes, query_id: int, qtype: int) -> dict:
+    """
+    Parse the parts of a DNS response we care about.
+
+    Args:
+        data (bytes): The response message.
+        query_id (int): The ID of the query the response should answer.
+        qtype (int): The query type, answers of other types (e.g. CNAMEs) are skipped.
+
+    Returns:
+        dict: The rcode, whether the response was truncated, and the answered addresses.
+
+    Raises:
+        ValueError: If the message is not a response to our query.
+    """
+    if len(data) < 12:
+        raise ValueError("Short DNS response")
+    response_id, flags, qdcount, ancount, _nscount, _arcount = struct.unpack_from("!HHHHHH", data)
+    if response_id != query_id or not flags & DNS_FLAG_QR:
+        raise ValueError("DNS response does not match query")
+    offset = 12
+    for _ in range(qdcount):
+        offset = _skip_dns_name(data, offset) + 4
+    addresses = []
+    for _ in range(ancount):
+        offset = _skip_dns_name(data, offset)
+        rtype, _rclass, _ttl, rdlength = struct.unpack_from("!HHIH", data, offset)
+        offset += 10
+        if rtype == qtype == DNS_TYPE_A and rdlength == 4:
+            addresses.append(socket.inet_ntop(socket.AF_INET, data[offset:offset + 4]))
+        elif rtype == qtype == DNS_TYPE_AAAA and rdlength == 16:
+            addresses.append(socket.inet_ntop(socket.AF_INET6, data[offset:offset + 16]))
+        offset += rdlength
+    return {"rcode": flags & 0xF, "truncated": bool(flags & DNS_FLAG_TC), "addresses": addresses}
+
+def _query_dns_tcp(address: tuple, family: int, query: bytes, timeout: float) -> bytes:
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(address)
+        sock.sendall(struct.pack("!H", len(query)) + query)
+        response = b""
+        while len(response) < 2 or len(response) < 2 + struct.unpack_from("!H", response)[0]:
+            data = sock.recv(65535)
+            if not data:
+                raise ConnectionError("DNS server closed the TCP connection")
+            response += data
+        return response[2:]
+
+def query_nameserver(nameserver: str, fqdn: str, qtypes: Tuple[int, ...] = (DNS_TYPE_A, DNS_TYPE_AAAA),
+                     timeout: float = PROBE_TIMEOUT, port: int = 53) -> dict:
+    """
+    Query one specific nameserver directly, bypassing the system resolver.
+
+    All query types are sent at once over a single UDP socket and the answers
+    collected as they arrive. A truncated answer is retried over TCP.
+
+    Args:
+        nameserver (str): The nameserver address.
+        fqdn (str): The fully qualified domain name to lookup.
+        qtypes (Tuple[int, ...]): The query types to send.
+        timeout (float): Seconds to wait for all answers.
+        port (int): The nameserver port.
+
+    Returns:
+        dict: Whether the server answered NOERROR, the answer latency in ms, the rcode,
+              the transport used and the addresses found, per query type name.
+    """
+    family, _type, _proto, _canonname, address = socket.getaddrinfo(nameserver, port, type=socket.SOCK_DGRAM, flags=socket.AI_NUMERICHOST)[0]
+    # Consecutive IDs from one random start, so no two of the queries share one
+    first_id = int.from_bytes(os.urandom(2), "big")
+    pending = {(first_id + offset) & 0xFFFF: qtype for offset, qtype in enumerate(qtypes)}
+    queries = {query_id: build_dns_query(fqdn, qtype, query_id) for query_id, qtype in pending.items()}
+    answers = {}
+    start = time.perf_counter()
+    with socket.socket(family, socket.SOCK_DGRAM) as sock:
+        sock.connect(address)
+        for query in queries.values():
+            sock.send(query)
+        while pending:
+            remaining = timeout - (time.perf_counter() - start)
+            if remaining <= 0:
+                break
+            sock.settimeout(remaining)
+            try:
+                data = sock.recv(4096)
+            except socket.timeout:
+                break
+            except OSError as e:
+                # ICMP port unreachable and friends; nothing more will arrive
+                logger.debug(f"DNS query to {nameserver} failed: {e}")
+                break
+            query_id = struct.unpack_from("!H", data)[0] if len(data) >= 2 else None
+            if query_id not in pending:
+                continue
+            qtype = pending[query_id]
+            try:
+                parsed = parse_dns_response(data, query_id, qtype)
+                transport = "udp"
+                if parsed["truncated"]:
+                    data = _query_dns_tcp(address, family, queries[query_id], max(remaining, 0.1))
+                    parsed = parse_dns_response(data, query_id, qtype)
+                    transport = "tcp"
+            except (ValueError, struct.error, IndexError, OSError) as e:
+                logger.debug(f"Bad DNS response from {nameserver}: {e}")
+                continue
+            del pending[query_id]
+            answers[DNS_TYPE_NAMES[qtype]] = {
+                "rcode": parsed["rcode"],
+                "latency_ms": round((time.perf_counter() - start) * 1000, 2),
+                "transport": transport,
+                "addresses": parsed["addresses"],
+            }
+    for qtype in pending.values():
+        answers[DNS_TYPE_NAMES[qtype]] = {"rcode": None, "latency_ms": None, "transport": None, "addresses": []}
+    latencies = [answer["latency_ms"] for answer in answers.values() if answer["latency_ms"] is not None]
+    return {
+        "ok": any(answer["rcode"] == DNS_RCODE_NOERROR for answer in answers.values()),
+        "latency_ms": max(latencies) if latencies else None,
+        "answers": {DNS_TYPE_NAMES[qtype]: answers[DNS_TYPE_NAMES[qtype]] for qtype in qtypes},
+    }
+
+def probe_nameserver(nameserver: str, fqdn: str) -> dict:
+    """
+    Probe a nameserver with query_nameserver(), reporting errors as a failed probe.
+
+    Args:
+        nameserver (str): The nameserver address.
+        fqdn (str): The fully qualified domain name to lookup.
+
+    Returns:
+        dict: The query_nameserver() result.
+    """
+    try:
+        return query_nameserver(nameserver, fqdn)
+    except (OSError, UnicodeError) as e:
+        logger.debug(f"DNS query to {nameserver} failed: {e}")
+        return {"ok": False, "latency_ms": None, "answers": {}}
+
+def run_probes(probes: Dict[tuple, Callable[[], Any]], deadline: float = PROBE_DEADLINE) -> Dict[tuple, Any]:
+    """
+    Run reachability probes concurrently, bounded by one global deadline.
+
+    Probes are keyed by what they check, e.g. ("tcp", "192.0.2.1", 80), so a
+    target shared by several interfaces is only probed once. A probe that has
+    not finished when the deadline passes is reported as None.
+
+    Args:
+        probes (Dict[tuple, Callable[[], Any]]): Probe callables keyed by target.
+        deadline (float): Seconds to wait for all probes together.
+
+    Returns:
+        Dict[tuple, Any]: The probe results keyed like the probes.
+    """
+    if not probes:
+        return {}
+    pending = list(probes.items())[::-1]
+    finished = {}
+    stop = time.monotonic() + deadline
+
+    def worker() -> None:
+        # list.pop() and a dict store are atomic, so the workers need no lock
+        while time.monotonic() < stop:
+            try:
+                key, probe = pending.pop()
+            except IndexError:
+                return
+            try:
+                finished[key] = probe()
+            except Exception as e:
+                logger.debug(f"Probe {key} failed: {e}")
+                finished[key] = None
+
+    # Daemon threads, so a straggler past the deadline holds up neither the run
+    # nor the interpreter exit; its socket timeout reaps it eventually
+    workers = [threading.Thread(target=worker, daemon=True) for _ in range(min(MAX_PROBE_WORKERS, len(probes)))]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join(max(0.0, stop - time.monotonic()))
+    finished = dict(finished)
+    results = {}
+    for key in probes:
+        if key not in finished:
+            logger.debug(f"Probe {key} missed the {deadline}s deadline")
+        results[key] = finished.get(key)
+    logger.debug(f"Probe results: {results}")
+    return results
+
+def gateway_probe_key(gateway: str) -> tuple:
+    return ("tcp", gateway, 80)
+
+def dns_probe_key(nameserver: str, fqdn: str) -> tuple:
+    return ("dns", nameserver, fqdn)
+
+def check_dns_servers(fqdn: str, terse: bool, probe_results: Optional[Dict[tuple, Any]] = None,
+                      nameservers: Optional[List[str]] = None) -> List[dict]:
+    """
+    Check DNS servers for their resolution status of a given FQDN.
+
+    Args:
+        fqdn (str): The fully qualified domain name to lookup.
+        terse (bool): Whether to use terse output format.
+        probe_results (Optional[Dict[tuple, Any]]): Results from run_probes(), probed here if not given.
+        nameservers (Optional[List[str]]): The nameservers to check, read from resolv.conf if not given.
+
+    Returns:
+        List[dict]: List of DNS check results.
+    """
+    if nameservers is None:
+        nameservers = read_nameservers()
+    if probe_results is None:
+        probe_results = run_probes({dns_probe_key(nameserver, fqdn): partial(probe_nameserver, nameserver, fqdn) for nameserver in nameservers})
+
+    results = []
+    for nameserver in nameservers:
+        probe = probe_results.get(dns_probe_key(nameserver, fqdn)) or {"ok": False, "latency_ms": None, "answers": {}}
+        if probe["ok"]:
+            status_text = "OK" if not terse else ALL_OK
+        else:
+            status_text = "Failure" if not terse else O_SHIT
+        results.append({"nameserver": nameserver, "status": status_text, "fqdn_queried": fqdn,
+                        "latency_ms": probe["latency_ms"], "answers": probe["answers"]})
+    return results
+
+def collect_results(args: argparse.Namespace, active_interfaces: Optional[List[str]] = None,
+                    snapshot: Optional[Dict[str, dict]] = None, nameservers: Optional[List[str]] = None,
+                    dhcp_servers: Optional[Dict[str, str]] = None) -> dict:
+    """
+    Collect interface details and run every requested reachability probe in one concurrent batch.
+
+    Long-running callers can pass in what they already know; anything not given is collected.
+
+    Args:
+        args (argparse.Namespace): The parsed command line arguments.
+        active_interfaces (Optional[List[str]]): Result of get_active_network_interfaces().
+        snapshot (Optional[Dict[str, dict]]): Result of collect_network_snapshot().
+        nameservers (Optional[List[str]]): Result of read_nameservers().
+        dhcp_servers (Optional[Dict[str, str]]): DHCP servers keyed by interface, missing ones are looked up.
+
+    Returns:
+        dict: The results, with "interfaces" and "dns" lists.
+    """
+    if active_interfaces is None:
+        active_interfaces = get_active_network_interfaces()
+    if snapshot is None:
+        snapshot = collect_network_snapshot()
+    if nameservers is None:
+        nameservers = read_nameservers()
+    if dhcp_servers is None:
+        dhcp_servers = {}
+    results = {"interfaces": [], "dns": []}
+
+    for interface in active_interfaces:
+        ip, cidr, gateway = get_interface_details(interface, snapshot)
+        if not ip or not cidr or not gateway:
+            continue
+        dhcp_server = None
+        if args.dhcp:
+            if interface not in dhcp_servers:
+                dhcp_servers[interface] = get_dhcp_server(interface)
+            dhcp_server = dhcp_servers[interface]
+        interface_result = {"interface": interface, "ip": ip, "cidr": cidr, "gateway": gateway, "gateway_status": None, "dhcp_server": dhcp_server}
+        results["interfaces"].append(interface_result)
+
+    probes = {}
+    if args.gateway:
+        for iface in results["interfaces"]:
+            probes[gateway_probe_key(iface["gateway"])] = partial(probe_tcp, iface["gateway"], 80)
+    if args.dns:
+        for nameserver in nameservers:
+            probes[dns_probe_key(nameserver, args.fqdn)] = partial(probe_nameserver, nameserver, args.fqdn)
+    probe_results = run_probes(probes, args.deadline)
+
+    if args.gateway:
+        for iface in results["interfaces"]:
+            iface["gateway_status"] = "OK" if probe_results.get(gateway_probe_key(iface["gateway"])) else "Failure"
+    if args.dns:
+        results["dns"].extend(check_dns_servers(args.fqdn, args.terse, probe_results, nameservers))
+    return results
+
+def _indicator(status: Optional[str]) -> str:
+    return ALL_OK if status == "OK" else O_SHIT
+
+def render_verbose(results: dict, args: argparse.Namespace) -> str:
+    """
+    Render results in the default one-item-per-line format.
+
+    Args:
+        results (dict): Results from collect_results().
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        str: The rendered output.
+    """
+    lines = []
+    for iface in results["interfaces"]:
+        if args.interface:
+            lines.append(f"Interface: {iface['interface']}")
+        if args.ip:
+            lines.append(f"IP: {iface['ip']}")
+        if args.ip_subnet:
+            lines.append(f"IP/Subnet: {iface['ip']}/{iface['cidr']}")
+        if args.gateway:
+            lines.append(f"Gateway: {iface['gateway']} {_indicator(iface['gateway_status'])}")
+        if args.dhcp:
+            lines.append(f"DHCP Server: {iface['dhcp_server']}")
+    for dns in results["dns"]:
+        latency = f" ({dns['latency_ms']:.0f} ms)" if dns["latency_ms"] is not None else ""
+        lines.append(f"DNS: {dns['nameserver']} {_indicator(dns['status'])}{latency}")
+    return "\n".join(lines)
+
+def render_terse(results: dict, args: argparse.Namespace) -> str:
+    """
+    Render results as a single semicolon separated line.
+
+    Args:
+        results (dict): Results from collect_results().
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        str: The rendered output.
+    """
+    terse_output = []
+    for iface in results["interfaces"]:
+        if args.gateway and not (args.interface or args.ip or args.ip_subnet):
+            terse_output.append(f"gw: {iface['gateway']} {_indicator(iface['gateway_status'])}")
+        else:
+            if args.interface:
+                terse_output.append(f"if: {iface['interface']}")
+            if args.ip or args.ip_subnet:
+                terse_output.append(f"ip: {iface['ip']}/{iface['cidr']}")
+            if args.gateway:
+                terse_output.append(f"gw: {iface['gateway']} {_indicator(iface['gateway_status'])}")
+            if args.dhcp:
+                terse_output.append(f"dhcp: {iface['dhcp_server']}")
+    for dns in results["dns"]:
+        terse_output.append(f"dns: {dns['nameserver']} {dns['status']}")
+    return "; ".join(terse_output)
+
+def _file_fingerprint(path: str) -> Optional[tuple]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+def open_netlink_monitor() -> Optional[socket.socket]:
+    """
+    Subscribe to rtnetlink link, address and route change notifications.
+
+    Returns:
+        Optional[socket.socket]: A non-blocking netlink socket, or None where rtnetlink isn't available.
+    """
+    try:
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+    except (AttributeError, OSError) as e:
+        logger.debug(f"rtnetlink notifications unavailable ({e}), rescanning interfaces every tick")
+        return None
+    sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE | RTMGRP_IPV6_IFADDR))
+    sock.setblocking(False)
+    return sock
+
+def _drain(sock: socket.socket) -> bool:
+    changed = False
+    while True:
+        try:
+            changed |= bool(sock.recv(65536))
+        except BlockingIOError:
+            return changed
+        except OSError as e:
+            # ENOBUFS: we missed events, so treat it as a change
+            logger.debug(f"rtnetlink monitor overrun: {e}")
+            return True
+
+def _delta_key(entry: dict) -> dict:
+    # Latencies change every tick, only report them alongside a real change
+    return {key: value for key, value in entry.items() if key not in ("latency_ms", "answers")}
+
+def diff_results(previous: dict, current: dict) -> dict:
+    """
+    Compare two results dicts and return what changed.
+
+    Args:
+        previous (dict): The previous results from collect_results().
+        current (dict): The current results from collect_results().
+
+    Returns:
+        dict: Changed or added entries in "interfaces" and "dns" lists, and the
+              interface names and nameservers that disappeared in "removed".
+    """
+    delta = {"interfaces": [], "dns": [], "removed": []}
+    for section, key in (("interfaces", "interface"), ("dns", "nameserver")):
+        before = {entry[key]: _delta_key(entry) for entry in previous[section]}
+        after = {entry[key] for entry in current[section]}
+        delta[section] = [entry for entry in current[section] if before.get(entry[key]) != _delta_key(entry)]
+        delta["removed"].extend(name for name in before if name not in after)
+    return delta
+
+def watch(args: argparse.Namespace) -> None:
+    """
+    Re-evaluate every interval in one long-lived process and print only what changed.
+
+    Interface state is only rescanned after an rtnetlink notification, resolv.conf
+    and lease files only after their inode, mtime or size changed. The gateway and
+    DNS probes run every tick, as they are what's being watched.
+
+    Args:
+        args (argparse.Namespace): The parsed command line arguments, args.watch being the interval in seconds.
+    """
+    import json
+
+    monitor = open_netlink_monitor()
+    previous = {"interfaces": [], "dns": []}
+    active_interfaces = snapshot = nameservers = None
+    resolv_fingerprint = None
+    dhcp_servers = {}
+    lease_fingerprints = {}
+    try:
+        while True:
+            tick = time.monotonic()
+            if active_interfaces is None or monitor is None or _drain(monitor):
+                logger.debug("Rescanning interfaces")
+                active_interfaces = get_active_network_interfaces()
+                snapshot = collect_network_snapshot()
+            fingerprint = _file_fingerprint(RESOLV_CONF)
+            if nameservers is None or fingerprint != resolv_fingerprint:
+                logger.debug(f"Rereading {RESOLV_CONF}")
+                resolv_fingerprint = fingerprint
+                nameservers = read_nameservers()
+            if args.dhcp:
+                for interface in active_interfaces:
+                    fingerprints = [_file_fingerprint(path) for path in find_lease_files(interface)]
+                    if lease_fingerprints.get(interface) != fingerprints:
+                        lease_fingerprints[interface] = fingerprints
+                        dhcp_servers.pop(interface, None)
+
+            results = collect_results(args, active_interfaces, snapshot, nameservers, dhcp_servers)
+            delta = diff_results(previous, results)
+            previous = results
+            if delta["interfaces"] or delta["dns"] or delta["removed"]:
+                if args.json:
+                    print(json.dumps({"time": time.strftime("%Y-%m-%dT%H:%M:%S%z"), **delta}), flush=True)
+                else:
+                    render = render_terse if args.terse else render_verbose
+                    output = [render(delta, args)] + [f"gone: {name}" for name in delta["removed"]]
+                    print(("; " if args.terse else "\n").join(line for line in output if line), flush=True)
+
+            remaining = args.watch - (time.monotonic() - tick)
+            if remaining > 0:
+                time.sleep(remaining)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if monitor is not None:
+            monitor.close()
+
+def parse_fleet_address(address: str) -> Tuple[int, Any]:
+    """
+    Parse an agent address: "unix:/path/to.sock", "host", "host:port" or "[v6 address]:port".
+
+    Args:
+        address (str): The address.
+
+    Returns:
+        Tuple[int, Any]: The socket family and the address to bind or connect to.
+    """
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:"):]
+    host, port = address, FLEET_PORT
+    if address.startswith("["):
+        host, _, rest = address[1:].partition("]")
+        if rest.startswith(":"):
+            port = int(rest[1:])
+    elif address.count(":") == 1:
+        host, port = address.split(":")
+        port = int(port)
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    return family, (host, port)
+
+class ResultsCache:
+    """
+    Serve collect_results() to many readers, collecting at most once per TTL.
+    """
+    def __init__(self, args: argparse.Namespace, ttl: float, collect: Optional[Callable[[], dict]] = None):
+        self.ttl = ttl
+        self.collect = collect or partial(collect_results, args)
+        self.lock = threading.Lock()
+        self.results = None
+        self.collected_at = 0.0
+
+    def get(self) -> dict:
+        with self.lock:
+            if self.results is None or time.monotonic() - self.collected_at >= self.ttl:
+                self.results = self.collect()
+                self.collected_at = time.monotonic()
+            return self.results
+
+def make_agent_server(address: str, cache: ResultsCache) -> socketserver.BaseServer:
+    """
+    Create an agent server that hands out the cached results.
+
+    The protocol is one line per request and one JSON line per reply, for as
+    long as the collector keeps the connection open.
+
+    Args:
+        address (str): Where to listen, see parse_fleet_address().
+        cache (ResultsCache): Where the results come from.
+
+    Returns:
+        socketserver.BaseServer: The server, call serve_forever() on it.
+    """
+    import json
+    import socketserver
+
+    class AgentHandler(socketserver.StreamRequestHandler):
+        def handle(self) -> None:
+            for line in self.rfile:
+                request = line.strip().decode(errors="replace")
+                if request == "GET":
+                    reply = {"host": socket.gethostname(), "results": cache.get()}
+                elif request == "QUIT":
+                    return
+                else:
+                    reply = {"error": f"Unknown request: {request}"}
+                self.wfile.write(json.dumps(reply).encode() + b"\n")
+                self.wfile.flush()
+
+    family, bind_address = parse_fleet_address(address)
+    if family == socket.AF_UNIX:
+        if os.path.exists(bind_address):
+            os.unlink(bind_address)
+        base = socketserver.UnixStreamServer
+    else:
+        base = socketserver.TCPServer
+
+    class AgentServer(socketserver.ThreadingMixIn, base):
+        address_family = family
+        daemon_threads = True
+        allow_reuse_address = family != socket.AF_UNIX
+
+    return AgentServer(bind_address, AgentHandler)
+
+class FleetCollector:
+    """
+    Fan out to many agents concurrently, keeping one connection per agent open between sweeps.
+    """
+    def __init__(self, agents: List[str], timeout: float = FLEET_TIMEOUT, max_workers: int = MAX_FLEET_WORKERS):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.agents = agents
+        self.timeout = timeout
+        self.connections = {}
+        self.executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(agents))))
+
+    def _connect(self, agent: str):
+        family, address = parse_fleet_address(agent)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(address)
+        except OSError:
+            sock.close()
+            raise
+        return sock, sock.makefile("rwb")
+
+    def _drop(self, agent: str) -> None:
+        connection = self.connections.pop(agent, None)
+        if connection is not None:
+            sock, stream = connection
+            stream.close()
+            sock.close()
+
+    def fetch(self, agent: str) -> dict:
+        """
+        Fetch the results of one agent, reconnecting once if a kept-alive connection was reset or closed.
+
+        Args:
+            agent (str): The agent address.
+
+        Returns:
+            dict: The agent reply, or an "error" entry.
+        """
+        import json
+
+        for attempt in range(2):
+            reused = agent in self.connections
+            try:
+                if not reused:
+                    self.connections[agent] = self._connect(agent)
+                sock, stream = self.connections[agent]
+                sock.settimeout(self.timeout)
+                stream.write(b"GET\n")
+                stream.flush()
+                line = stream.readline()
+                if not line:
+                    raise ConnectionError("Agent closed the connection")
+                return json.loads(line)
+            except (OSError, ValueError) as e:
+                self._drop(agent)
+                # Only a reset or EOF means a kept-alive connection went stale, retrying
+                # after a timeout would just double the wait for a slow agent
+                if not reused or attempt or not isinstance(e, ConnectionError):
+                    return {"error": str(e) or type(e).__name__}
+        return {"error": "unreachable"}
+
+    def sweep(self) -> dict:
+        """
+        Fetch every agent concurrently and merge the replies.
+
+        Returns:
+            dict: Replies keyed by agent address, plus a summary.
+        """
+        start = time.perf_counter()
+        futures = {agent: self.executor.submit(self.fetch, agent) for agent in self.agents}
+        hosts = {agent: future.result() for agent, future in futures.items()}
+        failed = sum(1 for reply in hosts.values() if "error" in reply)
+        return {
+            "hosts": hosts,
+            "summary": {"agents": len(hosts), "ok": len(hosts) - failed, "failed": failed,
+                        "elapsed_ms": round((time.perf_counter() - start) * 1000, 2)},
+        }
+
+    def close(self) -> None:
+        for agent in list(self.connections):
+            self._drop(agent)
+        self.executor.shutdown()
+
+def run_agent(args: argparse.Namespace) -> None:
+    """
+    Serve this host's results to fleet collectors until interrupted.
+
+    Args:
+        args (argparse.Namespace): The parsed command line arguments, args.agent being the listen address.
+    """
+    server = make_agent_server(args.agent, ResultsCache(args, ttl=args.cache_ttl))
+    logger.info(f"Agent listening on {args.agent}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def run_collector(args: argparse.Namespace) -> None:
+    """
+    Sweep the agents once, or every args.watch seconds, printing the merged report as JSON.
+
+    Args:
+        args (argparse.Namespace): The parsed command line arguments, args.collect being the agent addresses.
+    """
+    import json
+
+    collector = FleetCollector(args.collect, timeout=args.deadline)
+    try:
+        while True:
+            tick = time.monotonic()
+            report = collector.sweep()
+            if not args.watch:
+                print(json.dumps(report, indent=2))
+                return
+            print(json.dumps(report), flush=True)
+            time.sleep(max(0.0, args.watch - (time.monotonic() - tick)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        collector.close()
+
+def _is_ip_address(value: Optional[str]) -> bool:
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            socket.inet_pton(family, value or "")
+            return True
+        except OSError:
+            pass
+    return False
+
+def _metric_labels(**labels: Any) -> str:
+    escaped = (f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34)).replace(chr(10), chr(92) + "n")}"' for name, value in labels.items())
+    return "{" + ",".join(escaped) + "}"
+
+def render_metrics(results: dict, links: Optional[Dict[str, dict]] = None, duration: Optional[float] = None,
+                   timestamp: Optional[float] = None) -> str:
+    """
+    Render results in the Prometheus text exposition format.
+
+    Args:
+        results (dict): Results from collect_results().
+        links (Optional[Dict[str, dict]]): Link states keyed by interface, so that down interfaces are exported too.
+        duration (Optional[float]): How long the collection took, in seconds.
+        timestamp (Optional[float]): When the collection finished, in epoch seconds.
+
+    Returns:
+        str: The metrics.
+    """
+    families = {name: [] for name in METRICS}
+    up = {iface["interface"]: 1 for iface in results["interfaces"]}
+    for name, link in (links or {}).items():
+        if not link["flags"] & IFF_LOOPBACK:
+            up.setdefault(name, int(is_link_active(link)))
+    for name, value in sorted(up.items()):
+        families["interface_up"].append((_metric_labels(interface=name), value))
+    for iface in results["interfaces"]:
+        if iface["gateway_status"] is not None:
+            families["gateway_reachable"].append((_metric_labels(interface=iface["interface"], gateway=iface["gateway"]), int(iface["gateway_status"] == "OK")))
+        if _is_ip_address(iface["dhcp_server"]):
+            families["dhcp_server_info"].append((_metric_labels(interface=iface["interface"], server=iface["dhcp_server"]), 1))
+    for dns in results["dns"]:
+        families["dns_up"].append((_metric_labels(nameserver=dns["nameserver"], fqdn=dns["fqdn_queried"]), int(dns["status"] == "OK")))
+        for qtype, answer in dns["answers"].items():
+            if answer["latency_ms"] is not None:
+                families["dns_latency_seconds"].append((_metric_labels(nameserver=dns["nameserver"], fqdn=dns["fqdn_queried"], qtype=qtype), answer["latency_ms"] / 1000))
+    if duration is not None:
+        families["collection_duration_seconds"].append(("", round(duration, 6)))
+    if timestamp is not None:
+        families["last_collection_timestamp_seconds"].append(("", round(timestamp, 3)))
+
+    lines = []
+    for name, (metric_type, help_text) in METRICS.items():
+        if not families[name]:
+            continue
+        lines.append(f"# HELP {METRICS_PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {METRICS_PREFIX}_{name} {metric_type}")
+        lines.extend(f"{METRICS_PREFIX}_{name}{labels} {value}" for labels, value in families[name])
+    return "\n".join(lines) + "\n"
+
+class MetricsExporter:
+    """
+    Collect on a background schedule and keep the rendered metrics, so a scrape never waits for a probe.
+    """
+    def __init__(self, collect: Callable[[], Tuple[dict, Optional[Dict[str, dict]]]], interval: float):
+        self.collect = collect
+        self.interval = interval
+        self.metrics = b""
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def refresh(self) -> None:
+        start = time.perf_counter()
+        try:
+            results, links = self.collect()
+        except Exception as e:
+            # Keep serving the last good metrics rather than nothing
+            logger.error(f"Metrics collection failed: {e}")
+            return
+        self.metrics = render_metrics(results, links, time.perf_counter() - start, time.time()).encode()
+
+    def run(self) -> None:
+        tick = time.monotonic()
+        while not self.stop_event.wait(max(0.0, self.interval - (time.monotonic() - tick))):
+            tick = time.monotonic()
+            self.refresh()
+
+    def start(self) -> None:
+        # The first collection happens before we start answering scrapes
+        self.refresh()
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+
+def make_metrics_server(address: str, exporter: MetricsExporter) -> http.server.ThreadingHTTPServer:
+    """
+    Create an HTTP server answering /metrics from the exporter's cached metrics.
+
+    Args:
+        address (str): Where to listen, host:port.
+        exporter (MetricsExporter): Where the metrics come from.
+
+    Returns:
+        http.server.ThreadingHTTPServer: The server, call serve_forever() on it.
+    """
+    import http.server
+
+    class MetricsHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = exporter.metrics
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            logger.debug(f"{self.address_string()} {format % args}")
+
+    family, bind_address = parse_fleet_address(address)
+
+    class MetricsServer(http.server.ThreadingHTTPServer):
+        address_family = family
+
+    return MetricsServer(bind_address, MetricsHandler)
+
+def run_exporter(args: argparse.Namespace) -> None:
+    """
+    Serve Prometheus metrics until interrupted, collecting every args.watch (or EXPORTER_INTERVAL) seconds.
+
+    Args:
+        args (argparse.Namespace): The parsed command line arguments, args.exporter being the listen address.
+    """
+    def collect() -> Tuple[dict, Optional[Dict[str, dict]]]:
+        links = get_linux_link_states() if os.name == "posix" and os.uname().sysname != "Darwin" else None
+        return collect_results(args), links
+
+    args.terse = False
+    exporter = MetricsExporter(collect, args.watch or EXPORTER_INTERVAL)
+    exporter.start()
+    server = make_metrics_server(args.exporter, exporter)
+    logger.info(f"Exporting metrics on http://{args.exporter}/metrics")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        exporter.stop()
+        server.server_close()
+
+def main() -> None:
+    """
+    Main function to execute the script logic based on command line arguments.
+    """
+    global DEBUG_MODE
+
+    parser = argparse.ArgumentParser(description="Network and DNS Information Script")
+    parser.add_argument("--interface", action="store_true", help="Output current interface")
+    parser.add_argument("--ip", action="store_true", help="Output current IP")
+    parser.add_argument("--ip-subnet", action="store_true", help="Output current IP and subnet")
+    parser.add_argument("--gateway", action="store_true", help="Output current gateway")
+    parser.add_argument("--dhcp", action="store_true", help="Output current DHCP server")
+    parser.add_argument("--dns", action="store_true", help="Perform DNS tests")
+    parser.add_argument("--fun-mode", action="store_true", help="Use fun mode with emojis")
+    parser.add_argument("--fqdn", type=str, default="google.com", help="FQDN for DNS lookup")
+    parser.add_argument("--debug", action="store_true", help="Enable debug mode")
+    parser.add_argument("--json", action="store_true", help="Output results in JSON format")
+    parser.add_argument("--terse", action="store_true", help="Use terse output format")
+    parser.add_argument("--deadline", type=float, default=PROBE_DEADLINE, help=f"Seconds to wait for all reachability probes together (default: {PROBE_DEADLINE})")
+    parser.add_argument("--watch", type=float, metavar="INTERVAL", help="Keep running, re-evaluating every INTERVAL seconds and printing only changes")
+    parser.add_argument("--agent", type=str, metavar="ADDRESS", help="Serve results to fleet collectors on host:port or unix:/path")
+    parser.add_argument("--collect", type=str, nargs="+", metavar="AGENT", help="Collect results from fleet agents concurrently and print a merged JSON report")
+    parser.add_argument("--cache-ttl", type=float, default=FLEET_CACHE_TTL, help=f"Seconds an agent reuses collected results for (default: {FLEET_CACHE_TTL})")
+    parser.add_argument("--exporter", type=str, metavar="ADDRESS", help="Serve Prometheus metrics on host:port/metrics, collecting every --watch seconds")
+    parser.add_argument("--self-test", action="store_true", help="Run unit tests")
+
+    args = parser.parse_args()
+
+    if args.self_test:
+        import unittest
+        unittest.main(module="test_network_services", argv=[sys.argv[0]])
+
+    # Set debug mode if the flag is provided
+    DEBUG_MODE = args.debug
+    if DEBUG_MODE:
+        logger.setLevel(logging.DEBUG)
+    else:
+        logger.setLevel(logging.INFO)
+
+    # Set status indicators based on fun mode
+    set_status_indicators(args.fun_mode)
+
+    # If no specific flags are provided, output all information except IP (to avoid redundancy)
+    if not (args.interface or args.ip or args.ip_subnet or args.gateway or args.dhcp or args.dns):
+        args.interface = args.ip_subnet = args.gateway = args.dhcp = args.dns = True
+
+    if args.collect:
+        run_collector(args)
+        return
+
+    if args.agent:
+        run_agent(args)
+        return
+
+    if args.exporter:
+        run_exporter(args)
+        return
+
+    if args.watch:
+        watch(args)
+        return
+
+    results = collect_results(args)
+
+    if args.json:
+        import json
+        print(json.dumps(results, indent=2))
+    elif args.terse:
+        print(render_terse(results, args))
+    else:
+        output = render_verbose(results, args)
+        if output:
+            print(output)
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        logger.error(f"An unexpected error occurred: {e}")
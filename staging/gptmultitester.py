@@ -3,75 +3,1318 @@
 # I would like a Python 3 script that has a prepulated multidimensional array with PORT NUMBER and PORT USAGE, e.g. "80","http";"443","https". The script should expect a target host or IPv4 address as a command line argument and give a help screen if it does not receive one. If it receives a valid command line argument, it should then proceed to: 1) Output the target on screen and do a DNS A lookup/reverse PTR lookup and print this in a parenthesis. 2) Try to reach the given target using conn.request, given a separate multidimensional array. 3) For each member of its multidimensional array it should try to reach it via raw sockets. The script should accept several hostnames and/or IPs. Also, I should like to be able to serve this script command line arguments that add port numbers to either conn.request (e.g. "-c 123,456" or "--curl 123,456") or raw sockets (e.g. "-p 789,123" or "--ports 789,123"), and an option for a retry timer in seconds (e.g. "-r 10" or "--retry 10"). Failure and success messages should be abstracted to variables that can be shared and should be in the form of emojis. Use try/catch to avoid crashes.
 
 import argparse
-import socket
+import asyncio
+import errno
+import heapq
 import http.client
+import ipaddress
+import os
+import random
+import socket
+import ssl
+import sys
 import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 
 # Multidimensional array of port numbers and usage
 PORTS = [("80", "http"), ("443", "https"), ("22", "ssh")]
+# Port of the HTTP request made to every target, --curl adds more
+HTTP_PORT = 80
+# HTTP ports spoken to over TLS
+HTTPS_PORTS = {443, 8443}
+# Most bytes of a response body read to keep its connection open, the longest response line and the most headers
+HTTP_BODY_LIMIT = 64 * 1024
+HTTP_LINE_LIMIT = 64 * 1024
+HTTP_MAX_HEADERS = 100
+# Seconds an idle HTTP connection is kept for the next probe of its server, and the most kept at once
+HTTP_IDLE_TIMEOUT = 30
+HTTP_MAX_IDLE = 100
 
 # Failure and success messages with emojis
 SUCCESS_MESSAGE = "✅ Success!"
 FAILURE_MESSAGE = "❌ Failure!"
 
+# Seconds a single probe may take
+PROBE_TIMEOUT = 2
+# HTTP and DNS probes in flight at once, over all targets
+CONCURRENCY = 100
+# Most TCP connects in flight at once, if the open file limit allows, and the file descriptors kept free for the rest
+MAX_OPEN_SOCKETS = 4096
+FD_RESERVE = 64
+# connect_ex() results of a non-blocking connect that is under way
+CONNECT_PENDING = {errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN, getattr(errno, 'WSAEWOULDBLOCK', errno.EWOULDBLOCK)}
+UNREACHABLE_ERRORS = {errno.EHOSTUNREACH, errno.ENETUNREACH, errno.ENETDOWN, getattr(errno, 'EHOSTDOWN', errno.EHOSTUNREACH)}
+# Seconds DNS answers are kept; the system resolver does not tell their real TTL
+DNS_TTL = 300
+# Threads doing blocking DNS lookups at once
+DNS_WORKERS = 32
+# getaddrinfo() errors that answer that a name has no such address, as opposed to a failed lookup
+NO_ADDRESS_ERRORS = {getattr(socket, name) for name in ('EAI_NONAME', 'EAI_NODATA', 'EAI_ADDRFAMILY') if hasattr(socket, name)}
+# Spread of --interval runs around their schedule, as a fraction of the interval, and how many
+# intervals apart the runs of a failing probe get at most
+MONITOR_JITTER = 0.1
+MONITOR_MAX_BACKOFF = 8
+# Seconds the --benchmark listeners take to answer an HTTP request
+BENCHMARK_LATENCY = 0.01
+
+
+class RateLimiter:
+    """
+    Spaces out the probes of one target to at most rate per second; 0 means no limit.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_slot = 0
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        slot = max(now, self.next_slot)
+        self.next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+def fd_budget(reserved=0):
+    """
+    Raises the soft open file limit towards the hard limit as far as MAX_OPEN_SOCKETS needs,
+    and returns how many sockets a scan may keep open at once for raw connects, besides the
+    reserved ones it has open otherwise, such as HTTP connections.
+    """
+    try:
+        import resource
+    except ImportError:
+        # select() on Windows takes at most 512 sockets
+        return max(1, 500 - reserved)
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = MAX_OPEN_SOCKETS + FD_RESERVE + reserved
+    if hard != resource.RLIM_INFINITY:
+        wanted = min(wanted, hard)
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+            soft = wanted
+        except (ValueError, OSError):
+            pass
+    if soft == resource.RLIM_INFINITY:
+        return MAX_OPEN_SOCKETS
+    return max(1, min(MAX_OPEN_SOCKETS, soft - FD_RESERVE - reserved))
+
+
+def connect_state(error):
+    """
+    Names the outcome of a TCP connect from its error number: open, refused, filtered (no
+    answer), unreachable, or the error itself.
+    """
+    if error == 0:
+        return "open"
+    if error == errno.ECONNREFUSED:
+        return "refused"
+    if error == errno.ETIMEDOUT:
+        return "filtered"
+    if error in UNREACHABLE_ERRORS:
+        return "unreachable"
+    return os.strerror(error)
+
+
+class ConnectScanner:
+    """
+    Runs many non-blocking TCP connects at once on the event loop's selector (epoll on Linux).
+
+    Each connect is a bare non-blocking socket registered for writability; the selector reports
+    it as soon as the handshake completes or fails, and the socket is closed right then. A
+    connect with no answer after timeout counts as filtered. All connects share the one
+    timeout, so their deadlines expire in the order they started, from one queue and one
+    timer. At most max_open sockets are open; further connects wait for a free one.
+    """
+
+    def __init__(self, timeout=PROBE_TIMEOUT, max_open=None):
+        self.loop = asyncio.get_running_loop()
+        self.timeout = timeout
+        self.max_open = max_open or fd_budget()
+        self.open = {}
+        self.waiting = deque()
+        self.deadlines = deque()
+        self.timer = None
+
+    def connect(self, address):
+        """
+        Starts connecting to an (ip, port) address.
+
+        Returns:
+            A future with the connect_state() of the connect.
+        """
+        future = self.loop.create_future()
+        if len(self.open) < self.max_open:
+            self._start(address, future)
+        else:
+            self.waiting.append((address, future))
+        return future
+
+    def _start(self, address, future):
+        try:
+            sock = socket.socket(socket.AF_INET6 if ':' in address[0] else socket.AF_INET, socket.SOCK_STREAM)
+        except OSError as e:
+            future.set_result(connect_state(e.errno))
+            return
+        sock.setblocking(False)
+        error = sock.connect_ex(address)
+        if error not in CONNECT_PENDING:
+            sock.close()
+            future.set_result(connect_state(error))
+            return
+        fd = sock.fileno()
+        self.open[fd] = (sock, future)
+        self.loop.add_writer(fd, self._ready, fd)
+        self.deadlines.append((self.loop.time() + self.timeout, fd, sock))
+        if self.timer is None:
+            self.timer = self.loop.call_at(self.deadlines[0][0], self._expire)
+
+    def _finish(self, fd, state):
+        sock, future = self.open.pop(fd)
+        self.loop.remove_writer(fd)
+        sock.close()
+        if not future.done():
+            future.set_result(state)
+
+    def _ready(self, fd):
+        sock, _future = self.open[fd]
+        self._finish(fd, connect_state(sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)))
+        self._fill()
+
+    def _expire(self):
+        self.timer = None
+        now = self.loop.time()
+        while self.deadlines and self.deadlines[0][0] <= now:
+            _deadline, fd, sock = self.deadlines.popleft()
+            # The socket may be done already, and its fd reused by a later connect
+            if fd in self.open and self.open[fd][0] is sock:
+                self._finish(fd, "filtered")
+        self._fill()
+        if self.deadlines and self.timer is None:
+            self.timer = self.loop.call_at(self.deadlines[0][0], self._expire)
+
+    def _fill(self):
+        while self.waiting and len(self.open) < self.max_open:
+            address, future = self.waiting.popleft()
+            if not future.done():
+                self._start(address, future)
+
+    def close(self):
+        """
+        Closes every socket still connecting and cancels its future.
+        """
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        for fd in list(self.open):
+            self.open[fd][1].cancel()
+            self._finish(fd, None)
+        for _address, future in self.waiting:
+            future.cancel()
+        self.waiting.clear()
+        self.deadlines.clear()
+
+
+def build_probes(targets, raw_ports, curl_ports):
+    """
+    Lists every (target, kind, port, usage) to probe, in the order results are reported.
+
+    Every target gets a DNS lookup, an HTTP request to HTTP_PORT and the --curl ports, and a
+    TCP connect to each of PORTS and the --ports.
+    """
+    known = {int(port): usage for port, usage in PORTS}
+    tcp_ports = list(known) + [port for port in raw_ports if port not in known]
+    probes = []
+    for target in targets:
+        probes.append((target, 'dns', None, None))
+        for port in [HTTP_PORT] + [port for port in curl_ports if port != HTTP_PORT]:
+            probes.append((target, 'http', port, 'http'))
+        for port in tcp_ports:
+            probes.append((target, 'tcp', port, known.get(port, 'custom')))
+    return probes
+
+
+class Resolver:
+    """
+    Looks up A, AAAA and PTR records on a pool of threads and keeps the answers for ttl
+    seconds, so that the scans of a --retry loop do not look up the same names again.
+
+    Answers that a name has no such address are kept as well; failed lookups are not. The
+    same lookup asked for again while it runs is waited for rather than started twice.
+    """
+
+    def __init__(self, ttl=DNS_TTL, workers=DNS_WORKERS):
+        self.ttl = ttl
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='dns')
+        self.cache = {}
+        self.pending = {}
+
+    def query(self, kind, name):
+        """
+        Looks up the addresses (A or AAAA) or the PTR name of a name, blocking. Returns an
+        empty list or None if there are none, and raises socket.gaierror for names that
+        cannot be looked up, such as ones with an empty label.
+        """
+        if kind == 'PTR':
+            try:
+                return socket.gethostbyaddr(name)[0]
+            except socket.herror:
+                return None
+        family = socket.AF_INET if kind == 'A' else socket.AF_INET6
+        try:
+            infos = socket.getaddrinfo(name, None, family=family, type=socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            if e.errno in NO_ADDRESS_ERRORS:
+                return []
+            raise
+        except UnicodeError as e:
+            # The IDNA codec rejects empty labels and ones over 63 characters
+            raise socket.gaierror(socket.EAI_NONAME, f"invalid name {name!r}: {e.__cause__ or e}") from None
+        return list(dict.fromkeys(info[4][0] for info in infos))
+
+    async def lookup(self, kind, name, fresh=False):
+        """
+        Returns the cached answer to query(kind, name), or looks it up; always looks it up if
+        fresh, and caches the new answer.
+        """
+        key = (kind, name)
+        entry = self.cache.get(key)
+        if entry and entry[0] > time.monotonic() and not fresh:
+            return entry[1]
+        loop = asyncio.get_running_loop()
+        future = self.pending.get(key)
+        # A lookup left from the scan of an earlier event loop cannot be waited for
+        if future is None or future.get_loop() is not loop:
+            future = loop.run_in_executor(self.executor, self.query, kind, name)
+            self.pending[key] = future
+            future.add_done_callback(lambda done: self._store(key, done))
+        # Waiters that are cancelled leave the lookup running for the others
+        return await asyncio.shield(future)
+
+    def _store(self, key, future):
+        if self.pending.get(key) is future:
+            del self.pending[key]
+        if not future.cancelled() and future.exception() is None:
+            self.cache[key] = (time.monotonic() + self.ttl, future.result())
+
+    async def resolve(self, target, fresh=False):
+        """
+        Looks up the IPv4 and IPv6 addresses of a target at once, without the cache if fresh.
+
+        Returns:
+            The addresses, IPv4 ones first.
+
+        Raises:
+            OSError: The target has no address, or it could not be looked up.
+        """
+        try:
+            return [str(ipaddress.ip_address(target))]
+        except ValueError:
+            pass
+        answers = await asyncio.gather(self.lookup('A', target, fresh), self.lookup('AAAA', target, fresh),
+                                       return_exceptions=True)
+        addresses = [address for answer in answers if isinstance(answer, list) for address in answer]
+        if addresses:
+            return addresses
+        for answer in answers:
+            if isinstance(answer, BaseException):
+                raise answer
+        raise socket.gaierror(socket.EAI_NONAME, f"no address for {target}")
+
+    async def reverse_lookup(self, ip, fresh=False):
+        """
+        Looks up the PTR name of an address, or returns None if it has none.
+        """
+        return await self.lookup('PTR', ip, fresh)
+
+    def cancel(self):
+        """
+        Stops waiting for the lookups still running on this event loop, before it closes.
+        """
+        loop = asyncio.get_running_loop()
+        for key, future in list(self.pending.items()):
+            if future.get_loop() is loop:
+                future.cancel()
+                del self.pending[key]
+
+    def evict(self):
+        """
+        Drops the answers that are out of date.
+        """
+        now = time.monotonic()
+        for key in [key for key, (expires, _answer) in self.cache.items() if expires <= now]:
+            del self.cache[key]
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class HttpConnection:
+    """
+    An HTTP/1.1 connection, plain or TLS, that can carry one request after another.
+
+    TLS runs on an ssl.SSLObject over the plain stream rather than in the event loop's
+    transport, which cannot resume a TLS session.
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.tls = None
+        self.buffer = bytearray()
+        # Whether any of the response to the last request came in
+        self.received = False
+        self.timings = {'connect': None, 'tls': None, 'resumed': False}
+
+    @classmethod
+    async def open(cls, ip, port, host=None, context=None, session=None):
+        """
+        Connects to a server, and starts TLS with it if a context is given.
+
+        Args:
+            ip: The address to connect to.
+            port: The port to connect to.
+            host: The name the server's certificate must have.
+            context: The ssl.SSLContext to start TLS with, None for plain HTTP.
+            session: A TLS session of an earlier connection to resume.
+        """
+        started = time.monotonic()
+        reader, writer = await asyncio.open_connection(ip, port)
+        connection = cls(reader, writer)
+        connection.timings['connect'] = time.monotonic() - started
+        if context:
+            try:
+                await connection.start_tls(context, host, session)
+            except BaseException:
+                connection.close()
+                raise
+        return connection
+
+    async def start_tls(self, context, host, session=None):
+        started = time.monotonic()
+        self.incoming = ssl.MemoryBIO()
+        self.outgoing = ssl.MemoryBIO()
+        self.tls = context.wrap_bio(self.incoming, self.outgoing, server_hostname=host, session=session)
+        while True:
+            try:
+                self.tls.do_handshake()
+                break
+            except ssl.SSLWantReadError:
+                await self._flush()
+                data = await self.reader.read(65536)
+                if not data:
+                    raise ConnectionResetError("connection closed during TLS handshake")
+                self.incoming.write(data)
+        await self._flush()
+        self.timings['tls'] = time.monotonic() - started
+        self.timings['resumed'] = self.tls.session_reused
+
+    async def _flush(self):
+        data = self.outgoing.read()
+        if data:
+            self.writer.write(data)
+            await self.writer.drain()
+
+    async def _receive(self):
+        """
+        Returns the next bytes from the server, or b'' when it has closed the connection.
+        """
+        if not self.tls:
+            return await self.reader.read(65536)
+        while True:
+            try:
+                return self.tls.read(65536)
+            except ssl.SSLWantReadError:
+                # Reading may need to answer the server, e.g. with a key update
+                await self._flush()
+                data = await self.reader.read(65536)
+                if not data:
+                    return b''
+                self.incoming.write(data)
+            except ssl.SSLZeroReturnError:
+                return b''
+
+    async def _readline(self):
+        while True:
+            end = self.buffer.find(b"\n")
+            if end >= 0:
+                line = bytes(self.buffer[:end + 1])
+                del self.buffer[:end + 1]
+                return line
+            if len(self.buffer) > HTTP_LINE_LIMIT:
+                raise ConnectionError("response line too long")
+            data = await self._receive()
+            if not data:
+                raise ConnectionResetError("connection closed by the server")
+            self.received = True
+            self.buffer += data
+
+    async def _skip(self, size):
+        while len(self.buffer) < size:
+            data = await self._receive()
+            if not data:
+                raise ConnectionResetError("response cut short")
+            self.buffer += data
+        del self.buffer[:size]
+
+    async def _skip_chunked(self, limit):
+        """
+        Reads a chunked body, and returns whether it ended within limit bytes.
+        """
+        total = 0
+        while True:
+            line = await self._readline()
+            try:
+                size = int(line.split(b";")[0].strip(), 16)
+            except ValueError:
+                raise ConnectionError(f"bad chunk size: {line[:40]!r}") from None
+            if size == 0:
+                while (await self._readline()).strip():
+                    pass
+                return True
+            total += size
+            if total > limit:
+                return False
+            await self._skip(size + 2)
+
+    async def request(self, method, host, body_limit=HTTP_BODY_LIMIT):
+        """
+        Requests / and reads the response, and its body if it is at most body_limit bytes.
+
+        Returns:
+            The status and reason of the response, the seconds until its first byte came in,
+            and whether the connection can carry another request.
+
+        Raises:
+            ConnectionError: The server closed the connection or did not answer in HTTP.
+        """
+        if ':' in host:
+            host = f"[{host}]"
+        data = f"{method} / HTTP/1.1\r\nHost: {host}\r\nUser-Agent: gptmultitester\r\n\r\n".encode('ascii')
+        self.received = False
+        started = time.monotonic()
+        if self.tls:
+            self.tls.write(data)
+            await self._flush()
+        else:
+            self.writer.write(data)
+            await self.writer.drain()
+        first_byte = None
+        while True:
+            status_line = await self._readline()
+            if first_byte is None:
+                first_byte = time.monotonic() - started
+            parts = status_line.decode('latin-1').split(None, 2)
+            if len(parts) < 2 or not parts[0].startswith("HTTP/") or not parts[1].isdigit():
+                raise ConnectionError(f"not an HTTP response: {status_line[:40]!r}")
+            headers = {}
+            while True:
+                line = await self._readline()
+                if not line.strip():
+                    break
+                if len(headers) >= HTTP_MAX_HEADERS:
+                    raise ConnectionError("too many response headers")
+                name, _, value = line.decode('latin-1').partition(":")
+                name = name.strip().lower()
+                headers[name] = f"{headers[name]}, {value.strip()}" if name in headers else value.strip()
+            code = int(parts[1])
+            # Interim responses such as 103 Early Hints come before the real one
+            if not 100 <= code < 200 or code == 101:
+                break
+        tokens = headers.get('connection', "").lower()
+        keep_alive = "close" not in tokens and (parts[0] != "HTTP/1.0" or "keep-alive" in tokens)
+        if method == 'HEAD' or code in (101, 204, 304):
+            pass
+        elif "chunked" in headers.get('transfer-encoding', "").lower():
+            keep_alive = await self._skip_chunked(body_limit) and keep_alive
+        elif 'content-length' in headers:
+            try:
+                length = int(headers['content-length'])
+            except ValueError:
+                raise ConnectionError(f"bad Content-Length: {headers['content-length'][:40]!r}") from None
+            if length > body_limit:
+                keep_alive = False
+            else:
+                await self._skip(length)
+        else:
+            # The body runs until the server closes the connection
+            keep_alive = False
+        return " ".join(parts[1:]).strip(), first_byte, keep_alive
+
+    def closed(self):
+        return self.writer.is_closing() or self.reader.at_eof()
+
+    def close(self):
+        self.writer.close()
+
+
+class HttpPool:
+    """
+    Probes HTTP servers, keeping their connections open between probes, for the scans of a
+    --retry loop as well, and their TLS sessions to resume on new connections.
+
+    Args:
+        method: HEAD, or GET to read response bodies up to body_limit bytes.
+        body_limit: The most bytes of a body read; a longer one closes its connection.
+        context: The ssl.SSLContext for HTTPS, by default one that verifies certificates.
+        idle_timeout: The most seconds a connection is kept unused.
+        max_idle: The most connections kept unused at once, over all servers; the one unused
+            the longest is closed to make room.
+    """
+
+    def __init__(self, method='HEAD', body_limit=HTTP_BODY_LIMIT, context=None, idle_timeout=HTTP_IDLE_TIMEOUT,
+                 max_idle=HTTP_MAX_IDLE):
+        self.method = method
+        self.body_limit = body_limit
+        self.context = context
+        self.idle_timeout = idle_timeout
+        self.max_idle = max_idle
+        # The idle connections of each server, and of all servers in the order they fell idle
+        self.idle = {}
+        self.idle_order = OrderedDict()
+        self.sessions = {}
+
+    def _take(self, key):
+        """
+        Returns an idle connection for key that the server has not closed yet, or None.
+        """
+        connections = self.idle.get(key, [])
+        now = time.monotonic()
+        while connections:
+            connection = connections.pop()
+            idle_since = self.idle_order.pop(connection)
+            if now - idle_since < self.idle_timeout and not connection.closed():
+                return connection
+            connection.close()
+        return None
+
+    def _put(self, key, connection):
+        self.idle.setdefault(key, []).append(connection)
+        self.idle_order[connection] = time.monotonic()
+        while len(self.idle_order) > self.max_idle:
+            oldest, _idle_since = self.idle_order.popitem(last=False)
+            for connections in self.idle.values():
+                if oldest in connections:
+                    connections.remove(oldest)
+                    break
+            oldest.close()
+
+    async def probe(self, ip, host, port, tls=False):
+        """
+        Requests / from a server, on an idle connection to it if there is one.
+
+        Returns:
+            The status and reason of the response, and a dict of the seconds it took to
+            connect, start TLS (None on a reused connection or for plain HTTP) and get the
+            first byte of the response, and whether the connection was reused and its TLS
+            session resumed.
+        """
+        key = (ip, port, host, tls)
+        while True:
+            connection = self._take(key)
+            reused = connection is not None
+            if not reused:
+                if tls and self.context is None:
+                    # Loading the system certificates takes a while, so only when needed
+                    self.context = ssl.create_default_context()
+                connection = await HttpConnection.open(ip, port, host, self.context if tls else None,
+                                                       self.sessions.get((host, port)) if tls else None)
+            try:
+                status, first_byte, keep_alive = await connection.request(self.method, host, self.body_limit)
+            except ConnectionError:
+                connection.close()
+                # The server closed an idle connection before it saw the request
+                if reused and not connection.received:
+                    continue
+                raise
+            except BaseException:
+                connection.close()
+                raise
+            if connection.tls:
+                # TLS 1.3 sends its session tickets after the handshake, so take the session now
+                self.sessions[(host, port)] = connection.tls.session
+            if keep_alive and self.max_idle:
+                self._put(key, connection)
+            else:
+                connection.close()
+            timings = dict(connection.timings, first_byte=first_byte, reused=reused)
+            if reused:
+                timings.update(connect=None, tls=None, resumed=False)
+            return status, timings
+
+    def close(self):
+        for connection in self.idle_order:
+            connection.close()
+        self.idle.clear()
+        self.idle_order.clear()
+
+
+class Prober:
+    """
+    Runs single probes of resolved targets for scan() and Monitor, sharing the limits on
+    probes in flight, the per-target rate limits, and a ConnectScanner, Resolver and HttpPool.
+    """
+
+    def __init__(self, resolver, pool, concurrency=CONCURRENCY, rate=0, timeout=PROBE_TIMEOUT, max_open=None):
+        self.resolver = resolver
+        self.pool = pool
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.rate = rate
+        self.timeout = timeout
+        # HTTP probes in flight and idle HTTP connections hold sockets of their own
+        self.scanner = ConnectScanner(timeout, max_open or fd_budget(concurrency + pool.max_idle))
+        self.limiters = {}
+
+    async def probe(self, target, kind, port, ips, fresh=False):
+        """
+        Runs a probe of a target that resolved to ips; a dns probe looks up the PTR name
+        without the cache if fresh.
+
+        Returns:
+            Whether it succeeded, a detail (the addresses, the HTTP status, the connect_state()
+            or the error), the seconds it took and, for HTTP, the timings of HttpPool.probe().
+        """
+        ip = ips[0]
+        if target not in self.limiters:
+            self.limiters[target] = RateLimiter(self.rate)
+        await self.limiters[target].wait()
+        if kind == 'tcp':
+            started = time.monotonic()
+            state = await self.scanner.connect((ip, port))
+            return state == "open", state, time.monotonic() - started, None
+        async with self.semaphore:
+            started = time.monotonic()
+            try:
+                timings = None
+                if kind == 'dns':
+                    name = await asyncio.wait_for(self.resolver.reverse_lookup(ip, fresh), self.timeout)
+                    detail = ", ".join(ips + [name] if name else ips)
+                else:
+                    detail, timings = await asyncio.wait_for(self.pool.probe(ip, target, port, port in HTTPS_PORTS), self.timeout)
+            except asyncio.TimeoutError:
+                return False, "timed out", time.monotonic() - started, None
+            except ssl.SSLError as e:
+                return False, e.reason or str(e), time.monotonic() - started, None
+            except (OSError, ValueError) as e:
+                return False, os.strerror(e.errno) if getattr(e, 'errno', None) else str(e), time.monotonic() - started, None
+            return True, detail, time.monotonic() - started, timings
+
+    def close(self):
+        self.scanner.close()
+        self.resolver.cancel()
+
+
+def make_result(probe, ok, detail, seconds=0.0, timings=None):
+    target, kind, port, usage = probe
+    return {'target': target, 'kind': kind, 'port': port, 'usage': usage,
+            'ok': ok, 'detail': detail, 'seconds': seconds, 'timings': timings}
+
+
+async def scan(probes, concurrency=CONCURRENCY, rate=0, deadline=None, timeout=PROBE_TIMEOUT, report=None,
+               max_open=None, resolver=None, pool=None):
+    """
+    Runs all probes concurrently and returns their results in the order of probes.
+
+    All targets are resolved at once up front, and the other probes of a target wait for its
+    address, the first IPv4 one if it has any. At most
+    concurrency HTTP and DNS probes and max_open TCP connects are in flight, each target gets
+    at most rate probes per second, and probes still running after deadline seconds are
+    cancelled and reported as failures.
+
+    Args:
+        probes: The (target, kind, port, usage) tuples, see build_probes().
+        concurrency: The most HTTP and DNS probes in flight at once.
+        rate: The most probes per second per target, 0 for no limit.
+        deadline: The most seconds the whole scan may take, None for no limit.
+        timeout: The most seconds a single probe may take.
+        report: Called with each result as soon as it and all results before it are in.
+        max_open: The most TCP connects in flight at once, see ConnectScanner; by default as
+            many as the open file limit allows besides the HTTP connections.
+        resolver: The Resolver to look up targets with, so that its answers are kept between
+            scans; by default one for this scan only.
+        pool: The HttpPool to probe HTTP servers with, so that its connections are kept
+            between scans; by default one for this scan only.
+
+    Returns:
+        A list of result dicts with the probe's target, kind, port and usage, whether it
+        succeeded (ok), a detail (the address, the HTTP status, the connect_state() or the
+        error), its duration and, for HTTP, the timings of HttpPool.probe().
+    """
+    own_resolver = resolver is None
+    if own_resolver:
+        resolver = Resolver()
+    resolver.evict()
+    own_pool = pool is None
+    if own_pool:
+        pool = HttpPool()
+    prober = Prober(resolver, pool, concurrency, rate, timeout, max_open)
+    addresses = {}
+    for target, _kind, _port, _usage in probes:
+        if target not in addresses:
+            addresses[target] = asyncio.ensure_future(resolver.resolve(target))
+    results = [None] * len(probes)
+    reported = 0
+
+    def finish(index, ok, detail, seconds=0.0, timings=None):
+        nonlocal reported
+        results[index] = make_result(probes[index], ok, detail, seconds, timings)
+        while reported < len(results) and results[reported] is not None:
+            if report:
+                report(results[reported])
+            reported += 1
+
+    async def run(index):
+        target, kind, port, _usage = probes[index]
+        try:
+            ips = await addresses[target]
+        except OSError as e:
+            finish(index, False, f"cannot resolve: {e}" if kind == 'dns' else "not resolved")
+            return
+        finish(index, *await prober.probe(target, kind, port, ips))
+
+    tasks = [asyncio.ensure_future(run(index)) for index in range(len(probes))]
+    try:
+        if tasks:
+            _done, pending = await asyncio.wait(tasks, timeout=deadline)
+            for task in pending:
+                task.cancel()
+            for index, task in enumerate(tasks):
+                if task in pending:
+                    finish(index, False, "deadline exceeded")
+    finally:
+        leftover = [task for task in list(addresses.values()) + tasks if not task.done()]
+        for task in leftover:
+            task.cancel()
+        await asyncio.gather(*leftover, return_exceptions=True)
+        prober.close()
+        if own_resolver:
+            resolver.close()
+        if own_pool:
+            pool.close()
+    return results
+
+
+class Monitor:
+    """
+    Runs every probe again and again, each on a schedule of its own, until cancelled.
+
+    The next runs of all probes are kept in a heap. A probe first runs at a random point of its
+    first interval, so that the probes of many targets spread out, and then every interval
+    seconds after that point, give or take jitter * interval; the schedule does not shift with
+    how long runs take. A probe that fails waits twice as long before each next run, up to
+    max_backoff intervals, and goes back to its interval when it succeeds. Every run is a task
+    of its own, so a slow target delays no other; a run still going when the next is due
+    makes that one skipped. Probes of kind dns look their target up again on every run rather
+    than take the Resolver's cached answers.
+
+    Args:
+        probes: The (target, kind, port, usage) tuples, see build_probes().
+        prober: The Prober to run them with.
+        interval: The seconds between the runs of a probe.
+        intervals: Other intervals for some kinds of probes, e.g. {'dns': 300}.
+        jitter: The spread of runs around their schedule, as a fraction of the interval.
+        max_backoff: How many intervals apart the runs of a failing probe get at most.
+        report: Called with the first result of each probe, and with each result whose ok
+            differs from the one before.
+    """
+
+    def __init__(self, probes, prober, interval, intervals=None, jitter=MONITOR_JITTER, max_backoff=MONITOR_MAX_BACKOFF,
+                 report=None):
+        self.probes = probes
+        self.prober = prober
+        self.intervals = [(intervals or {}).get(kind, interval) for _target, kind, _port, _usage in probes]
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self.report = report
+        self.failures = [0] * len(probes)
+        self.last_ok = [None] * len(probes)
+        self.runs = 0
+        self.skipped = 0
+        self.running = {}
+        self.heap = []
+        self.wakeup = asyncio.Event()
+
+    def _schedule(self, index, nominal):
+        """
+        Puts the next run of a probe in the heap, at its nominal time give or take the jitter.
+        """
+        spread = self.jitter * self.intervals[index]
+        heapq.heappush(self.heap, (nominal + random.uniform(-spread, spread), nominal, index))
+        self.wakeup.set()
+
+    async def _run(self, index, nominal):
+        target, kind, port, _usage = probe = self.probes[index]
+        # The dns check asks the servers every time, and renews the answers other checks use
+        fresh = kind == 'dns'
+        result = None
+        try:
+            try:
+                ips = await self.prober.resolver.resolve(target, fresh)
+            except OSError as e:
+                result = make_result(probe, False, f"cannot resolve: {e}" if kind == 'dns' else "not resolved")
+            else:
+                result = make_result(probe, *await self.prober.probe(target, kind, port, ips, fresh))
+        except Exception as e:
+            # A probe that breaks counts as failed, it must not drop out of the schedule
+            result = make_result(probe, False, f"error: {e!r}")
+        finally:
+            if result is not None:
+                self.runs += 1
+                self.failures[index] = 0 if result['ok'] else self.failures[index] + 1
+            spacing = self.intervals[index] * min(2 ** self.failures[index], self.max_backoff)
+            nominal += spacing
+            now = asyncio.get_running_loop().time()
+            if nominal < now:
+                # Runs that would have been due while this one went on are skipped
+                missed = int((now - nominal) // spacing) + 1
+                self.skipped += missed
+                nominal += missed * spacing
+            self._schedule(index, nominal)
+        if result['ok'] != self.last_ok[index] and self.report:
+            self.report(result)
+        self.last_ok[index] = result['ok']
+
+    async def run(self, duration=None):
+        """
+        Runs the probes until cancelled, or for duration seconds.
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for index in range(len(self.probes)):
+            self._schedule(index, started + random.uniform(0, self.intervals[index]))
+        try:
+            while duration is None or loop.time() < started + duration:
+                now = loop.time()
+                while self.heap and self.heap[0][0] <= now:
+                    _due, nominal, index = heapq.heappop(self.heap)
+                    task = asyncio.ensure_future(self._run(index, nominal))
+                    self.running[index] = task
+                    task.add_done_callback(lambda _task, index=index: self.running.pop(index, None))
+                wait = self.heap[0][0] - now if self.heap else None
+                if duration is not None:
+                    wait = min(wait if wait is not None else duration, started + duration - now)
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            tasks = list(self.running.values())
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def format_timings(timings):
+    """
+    Formats the timings of an HTTP probe, e.g. "connect 2 ms, TLS 15 ms (resumed), first byte 40 ms".
+    """
+    parts = []
+    if timings['reused']:
+        parts.append("reused")
+    if timings['connect'] is not None:
+        parts.append(f"connect {timings['connect'] * 1000:.0f} ms")
+    if timings['tls'] is not None:
+        parts.append(f"TLS {timings['tls'] * 1000:.0f} ms" + (" (resumed)" if timings['resumed'] else ""))
+    parts.append(f"first byte {timings['first_byte'] * 1000:.0f} ms")
+    return ", ".join(parts)
+
+
+def format_result(result):
+    """
+    Formats a result as a line of output, or returns None for one that is not shown.
+    """
+    target, kind, port, usage = result['target'], result['kind'], result['port'], result['usage']
+    if kind == 'dns':
+        if result['ok']:
+            return f"{target} ({result['detail']})"
+        return f"{target}: {FAILURE_MESSAGE} ({result['detail']})"
+    if result['detail'] == "not resolved":
+        return None
+    if kind == 'http':
+        label = "HTTP response" if port == HTTP_PORT else f"HTTP response (port {port})"
+        if result['ok']:
+            return f"{label}: {result['detail']} ({format_timings(result['timings'])})"
+        return f"{label}: {FAILURE_MESSAGE} ({result['detail']})"
+    if result['ok']:
+        return f"Port {port} ({usage}): {SUCCESS_MESSAGE}"
+    return f"Port {port} ({usage}): {FAILURE_MESSAGE} ({result['detail']})"
+
+
+def print_result(result):
+    line = format_result(result)
+    if line:
+        print(line, flush=True)
+
+
+def print_change(result):
+    """
+    Prints a result of --interval monitoring with the time and its target.
+    """
+    line = format_result(result)
+    if line:
+        stamp = time.strftime('%Y-%m-%d %H:%M:%S')
+        print(f"{stamp} {line}" if result['kind'] == 'dns' else f"{stamp} {result['target']}: {line}", flush=True)
+
+
+def make_pool(args):
+    context = None
+    if args.insecure:
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    return HttpPool(args.method, context=context)
+
+
+async def run_monitor(probes, args):
+    """
+    Runs the probes of the command line options every --interval seconds until interrupted,
+    printing when they start or stop succeeding.
+    """
+    resolver = Resolver(args.dns_ttl)
+    pool = make_pool(args)
+    prober = Prober(resolver, pool, args.concurrency, args.rate, args.timeout, args.max_open)
+    monitor = Monitor(probes, prober, args.interval, dict(args.interval_for), args.jitter, args.max_backoff, print_change)
+    started = time.monotonic()
+    try:
+        await monitor.run()
+    finally:
+        prober.close()
+        pool.close()
+        resolver.close()
+        print(f"{monitor.runs} probes in {time.monotonic() - started:.0f}s, {monitor.skipped} runs skipped", flush=True)
+
+
+async def run_scans(probes, args):
+    """
+    Runs the scans of the command line options, retrying failed probes once if asked to, and
+    prints their results in order. All scans share one Resolver and one HttpPool.
+
+    Returns:
+        The number of probes run and the seconds they took, not counting the wait to retry.
+    """
+    resolver = Resolver(args.dns_ttl)
+    pool = make_pool(args)
+    count = 0
+    elapsed = 0
+    failed = 0
+    try:
+        for attempt in range(2 if args.retry else 1):
+            if attempt:
+                print(f"Retrying {failed} failed probes in {args.retry} seconds...", flush=True)
+                await asyncio.sleep(args.retry)
+            started = time.monotonic()
+            results = await scan(probes, args.concurrency, args.rate, args.deadline, args.timeout, print_result,
+                                 args.max_open, resolver, pool)
+            elapsed += time.monotonic() - started
+            count += len(results)
+            retried = [not result['ok'] and result['detail'] != "not resolved" for result in results]
+            failed = sum(retried)
+            if not failed:
+                break
+            # Retried probes are shown under their target's line again
+            targets = {result['target'] for result, retry in zip(results, retried) if retry}
+            probes = [probe for probe, retry in zip(probes, retried)
+                      if probe[0] in targets and (probe[1] == 'dns' or retry)]
+    finally:
+        pool.close()
+        resolver.close()
+    return count, elapsed
+
+
+class HttpResponder(asyncio.Protocol):
+    """
+    A local listener for --benchmark and --self-test that answers any request with 200 OK,
+    after latency seconds, and closes the connection unless keep_alive.
+    """
+
+    def __init__(self, latency=0, keep_alive=False):
+        self.latency = latency
+        self.keep_alive = keep_alive
+        self.buffer = b""
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.buffer += data
+        while b"\r\n\r\n" in self.buffer:
+            _request, self.buffer = self.buffer.split(b"\r\n\r\n", 1)
+            if self.latency:
+                asyncio.get_running_loop().call_later(self.latency, self.respond)
+            else:
+                self.respond()
+
+    def respond(self):
+        if self.transport.is_closing():
+            return
+        if self.keep_alive:
+            self.transport.write(b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n")
+        else:
+            self.transport.write(b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            self.transport.close()
+
+
+def benchmark(targets=200, latency=BENCHMARK_LATENCY):
+    """
+    Prints how many probes per second a scan of local listeners on 127.0.0.1 runs, one probe
+    at a time with blocking sockets as main() used to, and with the asyncio engine at several
+    concurrency limits. The listeners answer HTTP requests after latency seconds, like a
+    server some way off; connects to them complete at once. Then times connects to a port that
+    never answers, one at a time and all at once with ConnectScanner, and resolving targets
+    whose lookups take latency * 5 seconds, one at a time, on the Resolver's threads, and from
+    its cache, and HTTP probes of a server that closes every connection and of one that keeps
+    them open for the HttpPool. Last, has a Monitor run the probes of many targets every second
+    and tells how late their runs start.
+    """
+    http_port, *tcp_ports = [_free_port() for _ in range(4)]
+    probes = []
+    for _ in range(targets):
+        probes.append(('127.0.0.1', 'http', http_port, 'http'))
+        probes.extend(('127.0.0.1', 'tcp', port, 'bench') for port in tcp_ports)
+
+    def serial():
+        for _target, kind, port, _usage in probes:
+            if kind == 'http':
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=PROBE_TIMEOUT)
+                conn.request("GET", "/")
+                conn.getresponse()
+                conn.close()
+            else:
+                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+                    sock.settimeout(PROBE_TIMEOUT)
+                    sock.connect_ex(('127.0.0.1', port))
+
+    async def measure(concurrency):
+        loop = asyncio.get_running_loop()
+        servers = [await loop.create_server(lambda: HttpResponder(latency), '127.0.0.1', port, backlog=len(probes))
+                   for port in [http_port] + tcp_ports]
+        try:
+            started = time.perf_counter()
+            if concurrency:
+                results = await scan(probes, concurrency)
+                assert all(result['ok'] for result in results), [result for result in results if not result['ok']][:3]
+            else:
+                await loop.run_in_executor(None, serial)
+            return len(probes) / (time.perf_counter() - started)
+        finally:
+            for server in servers:
+                server.close()
+
+    print(f"{len(probes)} probes of 127.0.0.1, HTTP answered after {latency * 1000:.0f} ms")
+    print(f"{'engine':<24} {'probes/s':>10}")
+    print(f"{'serial, blocking':<24} {asyncio.run(measure(0)):>10,.0f}")
+    for concurrency in (1, 10, 100):
+        print(f"{f'asyncio, {concurrency} in flight':<24} {asyncio.run(measure(concurrency)):>10,.0f}")
+
+    # Ports that never answer: a listener whose backlog is full drops further connects
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(0)
+    address = listener.getsockname()
+    held = []
+    for _ in range(8):
+        sock = socket.socket()
+        sock.setblocking(False)
+        sock.connect_ex(address)
+        held.append(sock)
+    timeout = 0.2
+
+    def serial_filtered(count):
+        for _ in range(count):
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+                sock.settimeout(timeout)
+                sock.connect_ex(address)
+
+    async def scan_filtered(count):
+        results = await scan([('127.0.0.1', 'tcp', address[1], 'bench')] * count, timeout=timeout)
+        assert all(result['detail'] == "filtered" for result in results)
+
+    try:
+        print(f"\nConnects to a filtered port, {timeout * 1000:.0f} ms timeout")
+        print(f"{'engine':<24} {'connects':>10} {'seconds':>8}")
+        started = time.perf_counter()
+        serial_filtered(10)
+        print(f"{'serial, blocking':<24} {10:>10,} {time.perf_counter() - started:>8.2f}")
+        for count in (1000, 4000):
+            started = time.perf_counter()
+            asyncio.run(scan_filtered(count))
+            print(f"{'non-blocking connects':<24} {count:>10,} {time.perf_counter() - started:>8.2f}")
+    finally:
+        for sock in held:
+            sock.close()
+        listener.close()
+
+    async def measure_http(keep_alive, count=2000):
+        loop = asyncio.get_running_loop()
+        server = await loop.create_server(lambda: HttpResponder(keep_alive=keep_alive), '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            started = time.perf_counter()
+            results = await scan([('127.0.0.1', 'http', port, 'http')] * count, concurrency=10)
+            assert all(result['ok'] for result in results)
+            return count / (time.perf_counter() - started)
+        finally:
+            server.close()
+
+    print("\nHTTP probes of one server, 10 in flight")
+    print(f"{'engine':<24} {'probes/s':>10}")
+    print(f"{'connection per probe':<24} {asyncio.run(measure_http(False)):>10,.0f}")
+    print(f"{'keep-alive pool':<24} {asyncio.run(measure_http(True)):>10,.0f}")
+
+    async def measure_monitor(targets=300, seconds=5):
+        loop = asyncio.get_running_loop()
+        fast = await loop.create_server(lambda: HttpResponder(keep_alive=True), '127.0.0.1', 0)
+        slow = await loop.create_server(lambda: HttpResponder(1.5, keep_alive=True), '127.0.0.1', 0)
+        probes = []
+        for number in range(targets):
+            port = (slow if number % 10 == 0 else fast).sockets[0].getsockname()[1]
+            probes += [('127.0.0.1', 'http', port, 'http'), ('127.0.0.1', 'tcp', port, 'bench')]
+        resolver = Resolver()
+        pool = HttpPool()
+        prober = Prober(resolver, pool)
+        monitor = Monitor(probes, prober, 1, jitter=0)
+        lags = []
+        run = monitor._run
+
+        async def timed_run(index, nominal):
+            lags.append(loop.time() - nominal)
+            await run(index, nominal)
+
+        monitor._run = timed_run
+        try:
+            await monitor.run(seconds)
+        finally:
+            prober.close()
+            pool.close()
+            resolver.close()
+            fast.close()
+            slow.close()
+        lags.sort()
+        return len(probes), monitor.runs / seconds, lags[len(lags) // 2], lags[-1]
+
+    count, rate, median, worst = asyncio.run(measure_monitor())
+    print(f"\nMonitoring {count} probes every second, one target in ten answering HTTP after 1.5 s")
+    print(f"{'probes/s':>10} {'median lag':>12} {'worst lag':>12}")
+    print(f"{rate:>10,.0f} {median * 1000:>9.1f} ms {worst * 1000:>9.1f} ms")
+
+    class SlowResolver(Resolver):
+        def query(self, kind, name):
+            time.sleep(latency * 5)
+            return ['192.0.2.1'] if kind == 'A' else [] if kind == 'AAAA' else None
+
+    names = [f"host{number}.example" for number in range(50)]
+    resolver = SlowResolver()
+
+    async def resolve_all():
+        await asyncio.gather(*(resolver.resolve(name) for name in names))
+
+    try:
+        print(f"\nResolving {len(names)} targets (A and AAAA), lookups answered after {latency * 5000:.0f} ms")
+        print(f"{'engine':<24} {'seconds':>10}")
+        started = time.perf_counter()
+        for name in names:
+            resolver.query('A', name)
+            resolver.query('AAAA', name)
+        print(f"{'serial, blocking':<24} {time.perf_counter() - started:>10.2f}")
+        for label in (f"{DNS_WORKERS} threads", "cached"):
+            started = time.perf_counter()
+            asyncio.run(resolve_all())
+            print(f"{label:<24} {time.perf_counter() - started:>10.2f}")
+    finally:
+        resolver.close()
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def kind_interval(text):
+    """
+    Parses an --interval-for argument, e.g. "dns=300".
+    """
+    kind, _, seconds = text.partition('=')
+    if kind not in ('dns', 'http', 'tcp'):
+        raise argparse.ArgumentTypeError(f"unknown probe kind: {kind!r}")
+    try:
+        return kind, float(seconds)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid seconds: {seconds!r}") from None
+
+
 def main():
     # Parse command line arguments
     parser = argparse.ArgumentParser(description='Test script to check port availability.')
-    parser.add_argument('targets', metavar='TARGET', type=str, nargs='+', help='Target host or IPv4 address')
+    parser.add_argument('targets', metavar='TARGET', type=str, nargs='*', help='Target host, IPv4 or IPv6 address')
     parser.add_argument('-c', '--curl', metavar='PORTS', type=str, help='Port numbers to use for HTTP requests')
     parser.add_argument('-p', '--ports', metavar='PORTS', type=str, help='Port numbers to use for raw socket connections')
-    parser.add_argument('-r', '--retry', metavar='SECONDS', type=int, default=0, help='Retry timer in seconds')
+    parser.add_argument('-r', '--retry', metavar='SECONDS', type=int, default=0, help='Retry failed probes once after this many seconds (no longer a pause after each target, targets are probed at once)')
+    parser.add_argument('-i', '--interval', metavar='SECONDS', type=float, help='Keep running every probe this many seconds apart until interrupted, and print when one starts or stops succeeding')
+    parser.add_argument('--interval-for', metavar='KIND=SECONDS', type=kind_interval, action='append', default=[], help='Another --interval for dns, http or tcp probes, e.g. dns=300')
+    parser.add_argument('--jitter', metavar='FRACTION', type=float, default=MONITOR_JITTER, help=f'Spread of --interval runs, as a fraction of the interval (default: {MONITOR_JITTER})')
+    parser.add_argument('--max-backoff', metavar='N', type=float, default=MONITOR_MAX_BACKOFF, help=f'Most intervals between the runs of a failing probe (default: {MONITOR_MAX_BACKOFF})')
+    parser.add_argument('-n', '--concurrency', metavar='N', type=int, default=CONCURRENCY, help=f'HTTP and DNS probes in flight at once (default: {CONCURRENCY})')
+    parser.add_argument('--max-open', metavar='N', type=int, help=f'Raw socket connects in flight at once (default: as many as the open file limit allows, up to {MAX_OPEN_SOCKETS})')
+    parser.add_argument('--rate', metavar='N', type=float, default=0, help='Most probes per second per target (default: no limit)')
+    parser.add_argument('--deadline', metavar='SECONDS', type=float, help='Give up on probes still running after this many seconds')
+    parser.add_argument('-t', '--timeout', metavar='SECONDS', type=float, default=PROBE_TIMEOUT, help=f'Seconds a single probe may take (default: {PROBE_TIMEOUT})')
+    parser.add_argument('--method', choices=['HEAD', 'GET'], default='GET', help=f'HTTP request method; GET reads bodies up to {HTTP_BODY_LIMIT // 1024} KiB, HEAD reads none (default: GET)')
+    parser.add_argument('-k', '--insecure', action='store_true', help=f'Do not verify HTTPS certificates (HTTPS on ports {", ".join(map(str, sorted(HTTPS_PORTS)))})')
+    parser.add_argument('--dns-ttl', metavar='SECONDS', type=float, default=DNS_TTL, help=f'Seconds DNS answers are kept between retries (default: {DNS_TTL})')
+    parser.add_argument('--self-test', action='store_true', help='Run unit tests')
+    parser.add_argument('--benchmark', action='store_true', help='Measure probes per second against local listeners')
     args = parser.parse_args()
 
+    if args.self_test:
+        import unittest
+        unittest.main(module='test_gptmultitester', argv=[sys.argv[0]])
+        return
+    if args.benchmark:
+        benchmark()
+        return
+
     # Check if target argument was provided
     if not args.targets:
         parser.print_help()
         exit()
 
     # Parse additional port arguments
-    curl_ports = [int(p) for p in args.curl.split(',')] if args.curl else []
-    raw_ports = [int(p) for p in args.ports.split(',')] if args.ports else []
+    try:
+        curl_ports = [int(p) for p in args.curl.split(',')] if args.curl else []
+        raw_ports = [int(p) for p in args.ports.split(',')] if args.ports else []
+    except ValueError as e:
+        parser.error(f"invalid port number: {e}")
 
-    # Loop through targets
-    for target in args.targets:
-        try:
-            # DNS resolution and reverse PTR lookup
-            ip = socket.gethostbyname(target)
-            name = socket.gethostbyaddr(ip)[0]
-            print(f"{target} ({ip})")
-
-            # HTTP requests using http.client
-            conn = http.client.HTTPConnection(target)
-            conn.request("GET", "/")
-            response = conn.getresponse()
-            print(f"HTTP response: {response.status} {response.reason}")
-            conn.close()
-
-            # Raw socket connections
-            for port, usage in PORTS:
-                if port in raw_ports:
-                    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    s.settimeout(2)
-                    result = s.connect_ex((target, int(port)))
-                    if result == 0:
-                        print(f"Port {port} ({usage}): {SUCCESS_MESSAGE}")
-                    else:
-                        print(f"Port {port} ({usage}): {FAILURE_MESSAGE}")
-                    s.close()
-
-            # HTTP requests with custom ports
-            for port in curl_ports:
-                conn = http.client.HTTPConnection(target, port)
-                conn.request("GET", "/")
-                response = conn.getresponse()
-                print(f"HTTP response (port {port}): {response.status} {response.reason}")
-                conn.close()
+    if args.interval_for and not args.interval:
+        parser.error("--interval-for needs --interval")
+    if args.interval and (args.retry or args.deadline):
+        parser.error("--interval cannot be combined with --retry or --deadline")
+    if args.interval is not None and (args.interval <= 0 or any(seconds <= 0 for _kind, seconds in args.interval_for)):
+        parser.error("intervals must be positive")
 
-        except socket.gaierror:
-            print(f"{target}: {FAILURE_MESSAGE}")
+    probes = build_probes(args.targets, raw_ports, curl_ports)
+    if sys.platform == 'win32':
+        # ConnectScanner needs a selector loop, the default proactor loop has no add_writer()
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    if args.interval:
+        try:
+            asyncio.run(run_monitor(probes, args))
+        except KeyboardInterrupt:
+            pass
+        return
+    try:
+        count, elapsed = asyncio.run(run_scans(probes, args))
+    except KeyboardInterrupt:
+        return
+    rate = f" ({count / elapsed:.0f} probes/s)" if elapsed > 0 else ""
+    print(f"{count} probes in {elapsed:.2f}s{rate}")
 
-        if args.retry:
-            time.sleep(args.retry)
 
 if __name__ == '__main__':
     main()
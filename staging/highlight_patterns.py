@@ -9,19 +9,30 @@ Example usage:
     cat input.txt | ./highlight_patterns.py -o output.txt --theme-file /path/to/another_theme.json
 """
 
+import os
 import re
 import sys
+import time
+import heapq
 import argparse
 import logging
-import unittest
 import json
 from pathlib import Path
 
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 
 # Default config directory
 CONFIG_DIR = Path.home() / ".config" / "highlight_patterns"
+# Compiled pattern sets are cached here, keyed by the config directory and theme
+CACHE_DIR = Path(os.environ.get('XDG_CACHE_HOME', Path.home() / ".cache")) / "highlight_patterns"
+# Bump when the cache format or what goes into it changes
+CACHE_VERSION = 1
 
 EXAMPLE_THEME = {
     'default': {
@@ -44,12 +55,62 @@ EXAMPLE_PATTERN_FILES = {
     }
 }
 
-def load_themes(theme_file: Path) -> dict:
+GLOBAL_FLAGS_RE = re.compile(r'^(?:\(\?[aiLmsux]+\))+')
+
+# Bytes read per block, and written per batch, in --binary mode
+BLOCK_SIZE = 1 << 20
+OUTPUT_BUFFER = 1 << 20
+# Largest chunk of an --input file handed to one --jobs worker
+CHUNK_SIZE = 16 << 20
+# Longest a --follow'ed line waits to be shown; polling starts at the minimum and backs off to it when idle
+FOLLOW_POLL_INTERVAL = 0.5
+FOLLOW_MIN_POLL_INTERVAL = 0.02
+# inotify events on the followed file's directory that can mean new data, rotation or truncation
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+FOLLOW_EVENTS = IN_MODIFY | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+# Seconds between checks of the config directory for changes in long-running streams
+RELOAD_INTERVAL = 1.0
+
+# Longest time matching one line may take before it is passed through unhighlighted
+MATCH_TIMEOUT = 1.0
+# Only a repeated group can nest quantifiers or repeat alternatives, see backtracking_risk()
+REPEATED_GROUP_RE = re.compile(r'\)(?:[*+]|\{\d*,\})')
+# Characters \d, \w and \s stand for when checking whether parts of a pattern can match the same text
+CATEGORY_CHARS = {
+    sre_parse.CATEGORY_DIGIT: frozenset(b'0123456789'),
+    sre_parse.CATEGORY_WORD: frozenset(b'0123456789_abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'),
+    sre_parse.CATEGORY_SPACE: frozenset(b' \t\n\r\f\v'),
+}
+
+# CSS for the 16 ANSI colors, normal then bright, for --format html
+ANSI_CSS_COLORS = ('#000000', '#cd0000', '#00cd00', '#cdcd00', '#0000ee', '#cd00cd', '#00cdcd', '#e5e5e5',
+                   '#7f7f7f', '#ff0000', '#00ff00', '#ffff00', '#5c5cff', '#ff00ff', '#00ffff', '#ffffff')
+SGR_RE = re.compile(r'\033\[([\d;]*)m')
+
+# Slowest lines kept by --stats
+STATS_SLOWEST_LINES = 10
+# Longest line text shown in --stats output
+STATS_LINE_LENGTH = 200
+
+# Shorter required literals are in too many lines to be worth prefiltering on
+MIN_PREFILTER_LITERAL = 3
+# Flags that make no difference to whether a literal is in a line
+LITERAL_IGNORED_FLAGS = re.VERBOSE | re.MULTILINE | re.DOTALL
+
+def load_themes(theme_file: Path, strict: bool = False) -> dict:
     """
     Loads color themes from the theme JSON file.
 
     Args:
         theme_file (Path): Path to the theme JSON file.
+        strict (bool): Raise errors instead of exiting.
 
     Returns:
         dict: A dictionary of color themes.
@@ -58,19 +119,24 @@ def load_themes(theme_file: Path) -> dict:
         with theme_file.open('r') as file:
             return json.load(file)
     except json.JSONDecodeError as e:
+        if strict:
+            raise
         logging.error(f"Error reading theme file {theme_file}: {e}")
         sys.exit(1)
     except Exception as e:
+        if strict:
+            raise
         logging.error(f"Error loading theme file {theme_file}: {e}")
         sys.exit(1)
 
-def load_patterns(config_dir: Path, themes: dict) -> list:
+def load_patterns(config_dir: Path, themes: dict, strict: bool = False) -> list:
     """
     Loads regex patterns and their corresponding colors from config files.
 
     Args:
         config_dir (Path): Path to the configuration directory.
         themes (dict): A dictionary of color themes.
+        strict (bool): Raise errors in a pattern file instead of logging them and skipping the file.
 
     Returns:
         list: A list of tuples containing compiled regex patterns and their corresponding ANSI color codes.
@@ -86,15 +152,1162 @@ def load_patterns(config_dir: Path, themes: dict) -> list:
                 color_code = themes.get(color_name)
                 if color_code:
                     for pattern in config['patterns']:
-                        patterns.append((re.compile(pattern), color_code))
+                        regex = re.compile(pattern)
+                        risk = backtracking_risk(regex)
+                        if risk:
+                            logging.warning(f"Pattern '{pattern}' in {pattern_file} {risk}, which can take exponential "
+                                            f"time on some lines. Lines that take too long are not highlighted (see --match-timeout).")
+                        patterns.append((regex, color_code))
                 else:
                     logging.warning(f"Color '{color_name}' not found in themes.")
         except json.JSONDecodeError as e:
+            if strict:
+                raise
             logging.error(f"Error reading pattern file {pattern_file}: {e}")
         except Exception as e:
+            if strict:
+                raise
             logging.error(f"Error loading pattern file {pattern_file}: {e}")
 
-    return patterns
+    return PatternSet(patterns)
+
+class LazyPattern:
+    """
+    Stands in for a compiled regex and compiles it on first use.
+
+    A cached pattern set only needs the regexes of patterns that a line gets past the prefilter
+    for, so most of them are never compiled at all in a short run.
+    """
+    def __init__(self, pattern, flags: int = 0):
+        self.pattern = pattern
+        self.flags = flags
+        self._compiled = None
+
+    def __getattr__(self, name):
+        if self._compiled is None:
+            self._compiled = re.compile(self.pattern, self.flags)
+        value = getattr(self._compiled, name)
+        setattr(self, name, value)  # search, finditer... are looked up directly from now on
+        return value
+
+    def __reduce__(self):
+        return LazyPattern, (self.pattern, self.flags)
+
+    def __repr__(self):
+        return f"LazyPattern({self.pattern!r}, {self.flags})"
+
+def walk_pattern(parsed):
+    """
+    Walks a parsed regex tree depth first.
+
+    Args:
+        parsed: A pattern parsed with sre_parse.parse(), or a subpattern of one.
+
+    Yields:
+        tuple: The (opcode, argument) pairs of every node in the tree.
+    """
+    for op, av in parsed:
+        yield op, av
+        for child in _subpatterns(av):
+            yield from walk_pattern(child)
+
+def _subpatterns(av):
+    if isinstance(av, sre_parse.SubPattern):
+        yield av
+    elif isinstance(av, (list, tuple)):
+        for item in av:
+            yield from _subpatterns(item)
+
+def _has_top_level_branch(source: str) -> bool:
+    """
+    Checks whether a pattern has a | outside any group, so it needs wrapping to be one alternative.
+    """
+    depth = 0
+    in_class = False
+    i = 0
+    while i < len(source):
+        char = source[i]
+        if char == '\\':
+            i += 1
+        elif in_class:
+            in_class = char != ']'
+        elif char == '[':
+            in_class = True
+            # A ] right after [ or [^ is a literal
+            if source[i + 1:i + 2] == '^':
+                i += 1
+            if source[i + 1:i + 2] == ']':
+                i += 1
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            return True
+        i += 1
+    return False
+
+def _alternative_source(regex):
+    """
+    Rewrites a compiled regex as one alternative of a combined pattern compiled with the same flags.
+
+    The alternative ends in an empty marker group, which closes last and so shows up as the
+    match's lastindex. Unlike a group around the whole pattern, a trailing marker keeps the
+    alternatives' common prefixes visible to the regex compiler, which factors them out.
+
+    Args:
+        regex: The compiled regex.
+
+    Returns:
+        The alternative's source, or None if the regex has to be matched on its own.
+    """
+    if regex.flags & re.LOCALE:
+        return None
+    try:
+        parsed = sre_parse.parse(regex.pattern, regex.flags)
+    except Exception:
+        return None
+    # Group numbers shift inside the combined pattern, so backreferences would point at the wrong group
+    if any(op in (sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS) for op, _av in walk_pattern(parsed)):
+        return None
+
+    source = regex.pattern
+    is_bytes = isinstance(source, bytes)
+    if is_bytes:
+        source = source.decode('latin-1')
+    source = GLOBAL_FLAGS_RE.sub('', source, count=1)
+    if regex.flags & re.VERBOSE:
+        # Comments can hide parentheses from _has_top_level_branch, and would swallow the marker
+        source = f"(?:{source}\n)"
+    elif _has_top_level_branch(source):
+        source = f"(?:{source})"
+    source += "()"
+    return source.encode('latin-1') if is_bytes else source
+
+def _literal_runs(parsed):
+    """
+    Yields the runs of literal characters that every match of a parsed pattern contains.
+    """
+    run = []
+    for op, av in parsed:
+        if op is sre_parse.LITERAL:
+            run.append(av)
+            continue
+        yield run
+        run = []
+        if op is sre_parse.SUBPATTERN and len(av) == 4 and not (av[1] or av[2]):
+            # (group, add_flags, del_flags, pattern); groups changing the flags are skipped
+            yield from _literal_runs(av[3])
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, 'POSSESSIVE_REPEAT', None)) and av[0] >= 1:
+            yield from _literal_runs(av[2])
+        elif op is getattr(sre_parse, 'ATOMIC_GROUP', None):
+            yield from _literal_runs(av)
+    yield run
+
+def required_literal(regex):
+    """
+    Finds a literal substring that every match of a regex contains, e.g. "% packet loss" in \\b\\d+% packet loss\\b.
+
+    Args:
+        regex: The compiled regex.
+
+    Returns:
+        The longest such literal, str or bytes like the pattern, or None if there is none of MIN_PREFILTER_LITERAL or more.
+    """
+    try:
+        parsed = sre_parse.parse(regex.pattern, regex.flags)
+    except Exception:
+        return None
+    longest = max(_literal_runs(parsed), key=len)
+    if len(longest) < MIN_PREFILTER_LITERAL:
+        return None
+    return bytes(longest) if isinstance(regex.pattern, bytes) else ''.join(map(chr, longest))
+
+def _min_width(parsed, item) -> int:
+    return sre_parse.SubPattern(parsed.state, [item]).getwidth()[0]
+
+def _char_set(items, fold: bool):
+    """
+    Returns the set of characters the items of a parsed pattern can match, or None for (nearly) any.
+    """
+    chars = set()
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            chars.add(av)
+        elif op is sre_parse.IN:
+            for class_op, class_av in av:
+                if class_op is sre_parse.LITERAL:
+                    chars.add(class_av)
+                elif class_op is sre_parse.RANGE and class_av[1] - class_av[0] < 256:
+                    chars.update(range(class_av[0], class_av[1] + 1))
+                elif class_op is sre_parse.CATEGORY and class_av in CATEGORY_CHARS:
+                    chars.update(CATEGORY_CHARS[class_av])
+                else:
+                    return None
+        elif op in (sre_parse.ANY, sre_parse.NOT_LITERAL):
+            return None
+        else:
+            for child in _subpatterns(av):
+                child_chars = _char_set(child, fold)
+                if child_chars is None:
+                    return None
+                chars |= child_chars
+    if fold:
+        chars |= {ord(chr(char).swapcase()[0]) for char in chars}
+    return chars
+
+def _first_chars(items, fold: bool):
+    """
+    Returns the set of characters a match of the items of a parsed pattern can start with, or None for (nearly) any.
+    """
+    chars = set()
+    for op, av in items:
+        if op in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            continue
+        if op is sre_parse.SUBPATTERN:
+            first, optional = _first_chars(av[-1], fold), av[-1].getwidth()[0] == 0
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, 'POSSESSIVE_REPEAT', None)):
+            first, optional = _first_chars(av[2], fold), av[0] == 0 or av[2].getwidth()[0] == 0
+        elif op is sre_parse.BRANCH:
+            firsts = [_first_chars(branch, fold) for branch in av[1]]
+            first = None if None in firsts else set().union(*firsts)
+            optional = any(branch.getwidth()[0] == 0 for branch in av[1])
+        else:
+            first, optional = _char_set([(op, av)], fold), False
+        if first is None:
+            return None
+        chars |= first
+        if not optional:
+            break
+    return chars
+
+def _unseparated_repeats(parsed, fold: bool):
+    """
+    Yields the repeats in a parsed pattern that have no required part next to them they cannot
+    also match, so that one run of text can be split between them and a repeat around them in
+    many ways: \w+ in (\w+\s?)+, but not \d+ in (\d+\.)+.
+    """
+    for i, (op, av) in enumerate(parsed):
+        if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[1] > 1:
+            repeats = [(op, av)]
+        elif op is sre_parse.SUBPATTERN:
+            repeats = list(_unseparated_repeats(av[-1], fold))
+        elif op is sre_parse.BRANCH:
+            repeats = [repeat for branch in av[1] for repeat in _unseparated_repeats(branch, fold)]
+        else:
+            continue
+        for repeat in repeats:
+            chars = _char_set(repeat[1][2], fold)
+            if chars is None or not any(j != i and _min_width(parsed, item) > 0 and (_char_set([item], fold) or chars) & chars == set()
+                                        for j, item in enumerate(parsed)):
+                yield repeat
+
+def backtracking_risk(regex):
+    """
+    Looks for the shapes of pattern that make the regex engine backtrack exponentially on some
+    lines: nested quantifiers like (a+)+ or (\w+\s?)*, and alternatives that can match the same
+    text under a quantifier like (\w|\d)+.
+
+    It is a heuristic on the parsed pattern; possessive quantifiers and atomic groups, which do
+    not backtrack, are left alone.
+
+    Args:
+        regex: The compiled regex.
+
+    Returns:
+        str: What is risky about the pattern, or None if nothing is.
+    """
+    source = regex.pattern
+    if isinstance(source, bytes):
+        source = source.decode('latin-1')
+    if not regex.flags & re.VERBOSE and not REPEATED_GROUP_RE.search(source):
+        return None
+    try:
+        parsed = sre_parse.parse(regex.pattern, regex.flags)
+    except Exception:
+        return None
+    fold = bool(regex.flags & re.IGNORECASE)
+
+    for op, av in walk_pattern(parsed):
+        if op not in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) or av[1] is not sre_parse.MAXREPEAT:
+            continue
+        body = av[2]
+        if any(_unseparated_repeats(body, fold)):
+            return "has nested quantifiers, like (a+)+"
+        for branch_op, branch_av in walk_pattern(body):
+            if branch_op is not sre_parse.BRANCH:
+                continue
+            seen = set()
+            for branch in branch_av[1]:
+                first = _first_chars(branch, fold)
+                if first is None or first & seen:
+                    return "repeats alternatives that can match the same text, like (a|a)+"
+                seen |= first
+    return None
+
+def literal_trie_pattern(literals) -> str:
+    """
+    Builds a regex that matches any of a set of literals, nested as a trie.
+
+    A flat alternation makes the regex engine try every literal at every position; as a trie
+    it only follows the branches that match the next character.
+
+    Args:
+        literals: The literals, all str.
+
+    Returns:
+        str: The regex source.
+    """
+    trie = {}
+    for literal in literals:
+        node = trie
+        for char in literal:
+            if node.get('') is True:
+                break  # A shorter literal already covers this one
+            node = node.setdefault(char, {})
+        else:
+            node.clear()
+            node[''] = True
+
+    def emit(node):
+        if node.get('') is True:
+            return ''
+        branches = []
+        chars = []
+        for char in sorted(node):
+            rest = emit(node[char])
+            if rest:
+                branches.append(re.escape(char) + rest)
+            else:
+                chars.append(re.escape(char) if char not in '-]^\\' else '\\' + char)
+        if chars:
+            branches.append(chars[0] if len(chars) == 1 else f"[{''.join(chars)}]")
+        return branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+
+    return emit(trie)
+
+class PatternSet(list):
+    """
+    An ordered list of (compiled regex, color) tuples that finds the winning pattern in one scan.
+
+    Patterns with a required literal substring (see required_literal()) sit behind a prefilter:
+    one trie regex over all the literals rejects a line none of them are in, and otherwise only
+    the patterns whose literal is in the line are searched, in list order.
+
+    The rest are joined into a single alternation per set of regex flags (usually just one),
+    each alternative tagged so the one that matched is known from the match. The leftmost match
+    is the earliest match of any pattern; it wins unless a pattern earlier in the list also
+    matches further right, and only those are then searched one by one. Patterns that cannot be
+    combined (backreferences, locale flags) are searched on their own.
+
+    Either way a line that matches nothing, which is most of them, costs a single scan. The
+    regexes are built on first use, so the list should not be changed after that. literals (the
+    required literal of each pattern, None where there is none) and trie_sources (the prefilter
+    regexes by flags) can be given to skip working them out, see load_pattern_cache().
+    """
+    def __init__(self, patterns=(), prefilter: bool = True, literals: list = None, trie_sources: dict = None):
+        super().__init__(patterns)
+        self.prefilter = prefilter
+        self.literals = literals
+        self.trie_sources = dict(trie_sources or {})
+        self._combined = []
+        self._separate = []
+        self._unfiltered = []
+        self._literal_tries = []
+        self._literals = {}
+        self._folded_literals = {}
+        self._literal_searches = []
+        self._built = False
+
+    def _build(self) -> None:
+        by_literal = {}
+        for index, (regex, _color) in enumerate(self):
+            if not self.prefilter:
+                literal = None
+            elif self.literals is not None:
+                literal = self.literals[index]
+            else:
+                literal = required_literal(regex)
+            if literal is None:
+                self._unfiltered.append(index)
+            else:
+                by_literal.setdefault((literal, regex.flags & ~LITERAL_IGNORED_FLAGS), []).append(index)
+        self._build_prefilter(by_literal)
+        self._build_combined(self._unfiltered)
+        self._built = True
+
+    def _build_prefilter(self, by_literal: dict) -> None:
+        by_flags = {}
+        for (literal, flags), indices in by_literal.items():
+            key = literal[:MIN_PREFILTER_LITERAL]
+            if flags & re.IGNORECASE:
+                regex = LazyPattern(re.escape(literal), flags)
+                if key.isascii() and not flags & re.LOCALE:
+                    self._folded_literals.setdefault(key.lower(), []).append((regex, indices))
+                else:
+                    self._literal_searches.append((regex, indices))
+            else:
+                # Indexed by the first MIN_PREFILTER_LITERAL characters, see find()
+                self._literals.setdefault(key, []).append((literal, indices))
+            by_flags.setdefault(flags, []).append(literal)
+        for flags, literals in by_flags.items():
+            source = self.trie_sources.get(flags)
+            if source is None and isinstance(literals[0], bytes):
+                source = literal_trie_pattern([literal.decode('latin-1') for literal in literals]).encode('latin-1')
+            elif source is None:
+                source = literal_trie_pattern(literals)
+            self.trie_sources[flags] = source
+            self._literal_tries.append(re.compile(source, flags))
+
+    def _build_combined(self, indices: list) -> None:
+        by_flags = {}
+        for index in indices:
+            regex = self[index][0]
+            source = _alternative_source(regex)
+            if source is None:
+                self._separate.append(index)
+            else:
+                by_flags.setdefault(regex.flags, []).append((index, regex.groups, source))
+
+        for flags, alternatives in by_flags.items():
+            groups = {}
+            group = 0
+            for index, pattern_groups, _source in alternatives:
+                group += pattern_groups + 1
+                groups[group] = index
+            sources = [source for _index, _groups, source in alternatives]
+            separator = '|' if isinstance(sources[0], str) else b'|'
+            try:
+                self._combined.append((re.compile(separator.join(sources), flags), groups))
+            except re.error as e:
+                # e.g. two patterns defining the same group name; fall back to one search per pattern
+                logging.debug(f"Cannot combine patterns, matching them one by one: {e}")
+                self._separate.extend(groups.values())
+        self._separate.sort()
+
+    def _find_unfiltered(self, line):
+        found = None
+        for combined, groups in self._combined:
+            match = combined.search(line)
+            if match and (found is None or (match.start(), groups[match.lastindex]) < found):
+                found = (match.start(), groups[match.lastindex])
+        if found is None:
+            for index in self._separate:
+                match = self[index][0].search(line)
+                if match:
+                    return index, match.start()
+            return None
+
+        # No combined pattern matches before start, so earlier patterns can only match from there on
+        start, winner = found
+        separate = self._separate
+        for index in self._unfiltered:
+            if index >= winner:
+                break
+            match = self[index][0].search(line, 0 if separate and index in separate else start)
+            if match:
+                return index, match.start()
+        return winner, start
+
+    def compile(self) -> 'PatternSet':
+        """
+        Builds the combined regexes and the prefilter now instead of on first use.
+
+        Returns:
+            PatternSet: The pattern set itself.
+        """
+        if not self._built:
+            self._build()
+        return self
+
+    def candidate_lines(self, data, end: int = None):
+        """
+        Finds the lines in a block that a pattern could match, scanning the whole block at once.
+
+        Args:
+            data: The block of lines, str or bytes like the patterns, or a bytearray.
+            end (int): The end of the lines in data, the end of data by default.
+
+        Yields:
+            tuple: The start and end of each line holding a required literal, or of every line if some pattern has none.
+        """
+        if not self._built:
+            self._build()
+        newline = '\n' if isinstance(data, str) else b'\n'
+        end = len(data) if end is None else end
+        # The next hit of each trie at or after pos, None once it has no more
+        hits = [-1] * len(self._literal_tries)
+        pos = 0
+        while pos < end:
+            hit = pos if self._unfiltered else -1
+            for i, trie in enumerate(self._literal_tries):
+                if hits[i] is not None and hits[i] < pos:
+                    match = trie.search(data, pos, end)
+                    hits[i] = match.start() if match else None
+                if hits[i] is not None and (hit < 0 or hits[i] < hit):
+                    hit = hits[i]
+            if hit < 0:
+                return
+            line_start = max(pos, data.rfind(newline, pos, hit) + 1)
+            line_end = data.find(newline, hit, end)
+            if line_end < 0:
+                line_end = end
+            yield line_start, line_end
+            pos = line_end + 1
+
+    def find(self, line):
+        """
+        Finds the first pattern, in list order, that matches anywhere in the line.
+
+        Args:
+            line: The line to search, str or bytes like the patterns.
+
+        Returns:
+            tuple: The index of the winning pattern and the start of its first match, or None.
+        """
+        if not self._built:
+            self._build()
+        found = self._find_unfiltered(line) if self._unfiltered else None
+        if not any(trie.search(line) for trie in self._literal_tries):
+            return found
+
+        limit = found[0] if found else len(self)
+        for index in sorted(self._literal_candidates(line, limit)):
+            match = self[index][0].search(line)
+            if match:
+                return index, match.start()
+        return found
+
+    def candidates(self, line) -> list:
+        """
+        Lists the patterns that could match a line: those the prefilter lets through for it and
+        those without a required literal.
+
+        Args:
+            line: The line to search, str or bytes like the patterns.
+
+        Returns:
+            list: The indices of the patterns, in list order.
+        """
+        if not self._built:
+            self._build()
+        candidates = list(self._unfiltered)
+        if any(trie.search(line) for trie in self._literal_tries):
+            candidates.extend(self._literal_candidates(line, len(self)))
+        return sorted(candidates)
+
+    def spans(self, line) -> list:
+        """
+        Finds the matches of all the patterns in a line, in one scan from left to right.
+
+        Matches do not overlap: the leftmost wins, and of matches starting at the same place
+        the one of the pattern first in the list, as if all the patterns were one alternation.
+        Each combined regex, and each pattern the prefilter lets through, is searched again
+        only once the match it found is passed over. Empty matches are left out.
+
+        Args:
+            line: The line to search, str or bytes like the patterns.
+
+        Returns:
+            list: The (start, end, pattern index) of every match, in order.
+        """
+        if not self._built:
+            self._build()
+        sources = list(self._combined)
+        sources.extend((self[index][0], index) for index in self._separate)
+        if any(trie.search(line) for trie in self._literal_tries):
+            sources.extend((self[index][0], index) for index in self._literal_candidates(line, len(self)))
+
+        found = {}
+        for source, (regex, ids) in enumerate(sources):
+            match = _search_span(regex, ids, line, 0, self)
+            if match:
+                found[source] = match
+        spans = []
+        while found:
+            start, index, end = min(found.values())
+            spans.append((start, end, index))
+            for source, match in list(found.items()):
+                if match[0] < end:
+                    match = _search_span(*sources[source], line, end, self)
+                    if match:
+                        found[source] = match
+                    else:
+                        del found[source]
+        return spans
+
+    def _literal_candidates(self, line, limit: int) -> list:
+        # Only literals starting with one of the line's substrings of that length can be in it
+        width = MIN_PREFILTER_LITERAL
+        keys = {line[i:i + width] for i in range(len(line) - width + 1)}
+        candidates = [index for key in keys & self._literals.keys() for literal, indices in self._literals[key]
+                      if literal in line for index in indices if index < limit]
+        searches = self._literal_searches
+        if self._folded_literals:
+            if isinstance(line, str) and not line.isascii():
+                # Unicode case folding can match an ASCII key against other characters
+                searches = searches + [entry for entries in self._folded_literals.values() for entry in entries]
+            else:
+                lowered = line.lower()
+                keys = {lowered[i:i + width] for i in range(len(lowered) - width + 1)}
+                searches = searches + [entry for key in keys & self._folded_literals.keys() for entry in self._folded_literals[key]]
+        candidates.extend(index for regex, indices in searches if regex.search(line) for index in indices if index < limit)
+        return candidates
+
+    def highlight(self, line, reset_color):
+        """
+        Highlights every match of the winning pattern in a line.
+
+        Args:
+            line: The line to highlight.
+            reset_color: The ANSI color code to reset the color, the same type as line.
+
+        Returns:
+            The line with highlighted matches if any are found, otherwise the original line.
+        """
+        found = self.find(line)
+        if found is None:
+            return line
+        index, start = found
+        regex, color = self[index]
+        return _highlight_matches(line, regex, color, start, reset_color)[0]
+
+def _search_span(regex, ids, line, pos: int, patterns):
+    """
+    Finds the next non-empty match of a regex in a line for PatternSet.spans().
+
+    Args:
+        regex: The regex, a pattern of the set or a combined regex.
+        ids: The index of the pattern, or for a combined regex its marker groups by index.
+        line: The line to search.
+        pos (int): Where to start searching.
+        patterns (PatternSet): The set the patterns are from.
+
+    Returns:
+        tuple: The start, the index of the pattern and the end of the match, or None.
+    """
+    while pos <= len(line):
+        match = regex.search(line, pos)
+        if match is None:
+            return None
+        start = match.start()
+        if match.end() > start:
+            return start, ids if isinstance(ids, int) else ids[match.lastindex], match.end()
+        if not isinstance(ids, int):
+            # The alternation stops at the empty match, so the alternatives after it get a try of their own
+            for group in sorted(ids):
+                if group > match.lastindex:
+                    other = patterns[ids[group]][0].match(line, start)
+                    if other and other.end() > start:
+                        return start, ids[group], other.end()
+        pos = start + 1
+    return None
+
+def _highlight_matches(line, regex, color, start: int, reset_color) -> tuple:
+    """
+    Highlights every match of one regex in a line from start, where its first match is.
+
+    Returns:
+        tuple: The highlighted line and the number of matches.
+    """
+    parts = []
+    last = 0
+    for match in regex.finditer(line, start):
+        parts.extend((line[last:match.start()], color, match.group(0), reset_color))
+        last = match.end()
+    parts.append(line[last:])
+    return line[:0].join(parts), (len(parts) - 1) // 4
+
+def config_fingerprint(config_dir: Path, theme_file: Path, theme_name: str) -> list:
+    """
+    Describes everything a loaded pattern set depends on, to tell when a cached one is stale.
+
+    Args:
+        config_dir (Path): Path to the configuration directory.
+        theme_file (Path): Path to the theme JSON file.
+        theme_name (str): The selected theme.
+
+    Returns:
+        list: The cache format and Python versions, the theme, and the name, mtime and size of every pattern file.
+    """
+    files = []
+    for path in [theme_file] + sorted(config_dir.glob("highlight-*.json")):
+        stat = path.stat()
+        files.append([str(path), stat.st_mtime_ns, stat.st_size])
+    return [CACHE_VERSION, list(sys.version_info[:2]), theme_name, files]
+
+def pattern_cache_file(config_dir: Path, theme_file: Path, theme_name: str, cache_dir: Path = CACHE_DIR) -> Path:
+    """
+    Returns the cache file for a config directory and theme.
+    """
+    import hashlib
+
+    key = json.dumps([str(config_dir.resolve()), str(theme_file.resolve()), theme_name])
+    return cache_dir / f"{hashlib.sha1(key.encode()).hexdigest()}.json"
+
+def load_pattern_cache(cache_file: Path, fingerprint: list):
+    """
+    Loads a cached pattern set if it was saved for the same fingerprint.
+
+    Args:
+        cache_file (Path): The cache file.
+        fingerprint (list): The current config_fingerprint().
+
+    Returns:
+        tuple: The PatternSet, of LazyPatterns with their required literals, and the reset color; or None.
+    """
+    try:
+        with cache_file.open('r') as file:
+            cache = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cache, dict) or cache.get('fingerprint') != fingerprint:
+        return None
+    patterns = [(LazyPattern(source, flags), color) for source, flags, color, _literal in cache['patterns']]
+    literals = [literal for _source, _flags, _color, literal in cache['patterns']]
+    return PatternSet(patterns, literals=literals, trie_sources=dict(cache['tries'])), cache['reset']
+
+def save_pattern_cache(cache_file: Path, fingerprint: list, patterns: list, reset_color: str) -> PatternSet:
+    """
+    Builds a loaded pattern set and saves it, replacing the cache file atomically.
+
+    Args:
+        cache_file (Path): The cache file.
+        fingerprint (list): The config_fingerprint() the patterns were loaded with.
+        patterns (list): A list of tuples containing compiled regex patterns and their corresponding ANSI color codes.
+        reset_color (str): The ANSI color code to reset the color.
+
+    Returns:
+        PatternSet: The patterns, built.
+    """
+    import tempfile
+
+    literals = [required_literal(regex) for regex, _color in patterns]
+    pattern_set = PatternSet(patterns, literals=literals).compile()
+    cache = {
+        'fingerprint': fingerprint,
+        'reset': reset_color,
+        'patterns': [[regex.pattern, regex.flags, color, literal] for (regex, color), literal in zip(patterns, literals)],
+        'tries': sorted(pattern_set.trie_sources.items()),
+    }
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_file.parent, prefix='.highlight-')
+        with os.fdopen(fd, 'w') as file:
+            json.dump(cache, file)
+        os.replace(tmp_path, cache_file)
+    except OSError as e:
+        logging.debug(f"Cannot write pattern cache {cache_file}: {e}")
+    return pattern_set
+
+class PatternReloader:
+    """
+    Watches the config directory of a long-running stream and swaps in new patterns when it changes.
+
+    Changed files are loaded and compiled on a background thread, and the ready pattern set and
+    reset color replace current in one assignment, so the highlighting loop picks them up
+    between two lines without ever waiting. A config that fails to load keeps the previous
+    patterns until it changes again.
+    """
+    def __init__(self, config_dir: Path, theme_file: Path, theme_name: str, patterns: list, reset_color,
+                 fingerprint: list = None, cache_file: Path = None, binary: bool = False,
+                 interval: float = RELOAD_INTERVAL, on_reload=None):
+        """
+        Args:
+            config_dir (Path): Path to the configuration directory.
+            theme_file (Path): Path to the theme JSON file.
+            theme_name (str): The selected theme.
+            patterns (list): The patterns in use now, a PatternSet, encoded as bytes with binary.
+            reset_color: The reset color in use now, bytes with binary.
+            fingerprint (list): The config_fingerprint() the patterns were loaded under, so a change
+                made while they loaded is still picked up. Taken now by default.
+            cache_file (Path): Save reloaded patterns to this pattern cache file.
+            binary (bool): Encode reloaded patterns and colors as bytes, for process_binary().
+            interval (float): Seconds between checks for changes once started.
+            on_reload: Called with the reloaded theme just before the new patterns are swapped in.
+        """
+        self.config_dir = config_dir
+        self.theme_file = theme_file
+        self.theme_name = theme_name
+        self.cache_file = cache_file
+        self.binary = binary
+        self.interval = interval
+        self.on_reload = on_reload
+        self.current = (patterns, reset_color)
+        self._fingerprint = fingerprint
+        if fingerprint is None:
+            try:
+                self._fingerprint = config_fingerprint(config_dir, theme_file, theme_name)
+            except OSError:
+                pass
+        self._stop = None
+
+    def _prepare(self, patterns: list, reset_color: str) -> tuple:
+        if self.binary:
+            return encode_patterns(patterns).compile(), reset_color.encode('utf-8')
+        if not isinstance(patterns, PatternSet):
+            patterns = PatternSet(patterns)
+        return patterns.compile(), reset_color
+
+    def check(self) -> bool:
+        """
+        Reloads the patterns if the config changed since the last check.
+
+        Returns:
+            bool: Whether new patterns were swapped in.
+        """
+        try:
+            fingerprint = config_fingerprint(self.config_dir, self.theme_file, self.theme_name)
+        except OSError as e:
+            logging.debug(f"Cannot check {self.config_dir} for changes: {e}")
+            return False
+        if fingerprint == self._fingerprint:
+            return False
+        self._fingerprint = fingerprint
+
+        try:
+            theme = load_themes(self.theme_file, strict=True)[self.theme_name]
+            patterns = load_patterns(self.config_dir, theme, strict=True)
+            if not patterns:
+                raise ValueError("no patterns")
+        except (OSError, ValueError, KeyError, TypeError, re.error) as e:
+            logging.error(f"Keeping the previous patterns, cannot reload {self.config_dir}: {e}")
+            return False
+        reset_color = theme.get('reset', "\033[0m")
+        if self.cache_file:
+            patterns = save_pattern_cache(self.cache_file, fingerprint, patterns, reset_color)
+        prepared = self._prepare(patterns, reset_color)
+        if self.on_reload:
+            self.on_reload(theme)
+        self.current = prepared
+        logging.info(f"Reloaded {len(patterns)} patterns from {self.config_dir}.")
+        return True
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logging.error(f"Error reloading patterns: {e}")
+
+    def start(self) -> 'PatternReloader':
+        """
+        Starts checking for changes every interval on a daemon thread.
+        """
+        import threading
+
+        self._stop = threading.Event()
+        threading.Thread(target=self._run, name='pattern-reloader', daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._stop is not None:
+            self._stop.set()
+
+class PatternStats:
+    """
+    Collects per-pattern statistics while highlighting, to find the patterns that cost the most.
+
+    Each line is highlighted by searching every candidate pattern for it (see
+    PatternSet.candidates()) on its own and timing the search, since in the combined
+    alternation the time of one slow regex cannot be told apart from the rest. That is slower
+    than PatternSet.highlight(), but picks the same pattern and gives the same output. Without
+    --stats none of this runs.
+
+    Patterns are counted by their source and color, so the counts carry over a reload.
+    """
+    def __init__(self, slowest: int = STATS_SLOWEST_LINES):
+        self.slowest = slowest
+        self.lines = 0
+        self.matched_lines = 0
+        self.seconds = 0.0
+        self._started = time.monotonic()
+        self._by_key = {}
+        self._patterns = None
+        self._entries = []
+        self._slowest_lines = []  # heap of (seconds, line number, line)
+
+    def _entries_for(self, patterns: list) -> list:
+        if patterns is not self._patterns:
+            entries = []
+            for index, (regex, color) in enumerate(patterns):
+                pattern = regex.pattern
+                if isinstance(pattern, bytes):
+                    pattern, color = pattern.decode('utf-8', 'replace'), color.decode('utf-8', 'replace')
+                key = (pattern, color)
+                if key not in self._by_key:
+                    self._by_key[key] = {'index': index, 'pattern': pattern, 'color': color, 'candidates': 0,
+                                         'hits': 0, 'lines': 0, 'matches': 0, 'seconds': 0.0}
+                entries.append(self._by_key[key])
+            self._patterns, self._entries = patterns, entries
+        return self._entries
+
+    def highlight(self, line, patterns: PatternSet, reset_color, line_number: int = None):
+        """
+        Highlights a line like PatternSet.highlight(), counting and timing every candidate pattern.
+
+        Args:
+            line: The line to highlight, str or bytes like the patterns.
+            patterns (PatternSet): The patterns.
+            reset_color: The ANSI color code to reset the color, the same type as line.
+            line_number (int): The number of the line in the input, by default the number of lines seen so far.
+
+        Returns:
+            The line with highlighted matches if any are found, otherwise the original line.
+        """
+        entries = self._entries_for(patterns)
+        self.lines += 1
+        started = time.perf_counter()
+        found = None
+        for index in patterns.candidates(line):
+            entry = entries[index]
+            searched = time.perf_counter()
+            match = patterns[index][0].search(line)
+            entry['seconds'] += time.perf_counter() - searched
+            entry['candidates'] += 1
+            if match:
+                entry['hits'] += 1
+                if found is None:
+                    found = (index, match.start())
+
+        if found is not None:
+            index, start = found
+            regex, color = patterns[index]
+            line, matches = _highlight_matches(line, regex, color, start, reset_color)
+            entries[index]['lines'] += 1
+            entries[index]['matches'] += matches
+            self.matched_lines += 1
+
+        seconds = time.perf_counter() - started
+        self.seconds += seconds
+        slowest = (seconds, self.lines if line_number is None else line_number, line)
+        if len(self._slowest_lines) < self.slowest:
+            heapq.heappush(self._slowest_lines, slowest)
+        elif seconds > self._slowest_lines[0][0]:
+            heapq.heapreplace(self._slowest_lines, slowest)
+        return line
+
+    def to_dict(self) -> dict:
+        """
+        Returns:
+            dict: The totals, the patterns that were candidates for any line from the slowest
+                down, and the slowest lines.
+        """
+        patterns = []
+        for entry in sorted(self._by_key.values(), key=lambda entry: entry['seconds'], reverse=True):
+            if entry['candidates']:
+                patterns.append(dict(entry, hit_ratio=entry['hits'] / entry['candidates']))
+        slowest_lines = []
+        for seconds, line_number, line in sorted(self._slowest_lines, key=lambda slowest: slowest[0], reverse=True):
+            slowest_lines.append({'line_number': line_number, 'seconds': seconds, 'line': _line_preview(line)})
+        return {'lines': self.lines, 'matched_lines': self.matched_lines, 'seconds': self.seconds,
+                'elapsed': time.monotonic() - self._started, 'patterns': patterns, 'slowest_lines': slowest_lines}
+
+    def dump(self, path: Path = None) -> None:
+        """
+        Writes the statistics as JSON.
+
+        Args:
+            path (Path): The file to write, replacing an earlier dump, or None for stderr.
+        """
+        text = json.dumps(self.to_dict(), indent=2) + '\n'
+        if path is None:
+            sys.stderr.write(text)
+            sys.stderr.flush()
+        else:
+            path.write_text(text)
+
+def _line_preview(line) -> str:
+    if isinstance(line, bytes):
+        line = line.decode('utf-8', 'replace')
+    return line[:STATS_LINE_LENGTH]
+
+class LineTimeout(Exception):
+    """
+    Raised out of matching a line that takes longer than the MatchGuard budget.
+    """
+
+class MatchGuard:
+    """
+    Stops matching a line that takes longer than a time budget, so that one pathological line
+    or pattern cannot stall the stream; the line is then passed through unhighlighted.
+
+    An interval timer raises SIGALRM every budget seconds. A line still being matched at two
+    ticks in a row has had at least the budget, and the tick raises LineTimeout, which the re
+    module lets through in the middle of a search. In between, a line only costs begin() and
+    end(). Signals only reach the main thread, so the guard works in the main thread of the
+    main process, or of a --jobs worker, on platforms with setitimer().
+    """
+    def __init__(self, budget: float = MATCH_TIMEOUT):
+        self.budget = budget
+        self.line = None
+        self._lines = 0
+        self._last = None
+        self._previous = None
+
+    def start(self) -> bool:
+        """
+        Starts the timer.
+
+        Returns:
+            bool: Whether the guard could be started here.
+        """
+        import signal
+        import threading
+
+        if not hasattr(signal, 'setitimer') or threading.current_thread() is not threading.main_thread():
+            return False
+        self._previous = signal.signal(signal.SIGALRM, self._tick)
+        signal.setitimer(signal.ITIMER_REAL, self.budget, self.budget)
+        return True
+
+    def stop(self) -> None:
+        import signal
+
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, self._previous or signal.SIG_DFL)
+
+    def begin(self) -> None:
+        """
+        Marks the start of matching a line.
+        """
+        self._lines += 1
+        self.line = self._lines
+
+    def end(self) -> None:
+        """
+        Marks the end of matching a line.
+        """
+        self.line = None
+
+    def _tick(self, signum, frame) -> None:
+        line = self.line
+        if line is not None and line == self._last:
+            self.line = None
+            raise LineTimeout(f"matching took over {self.budget}s")
+        self._last = line
+
+def color_names(theme: dict) -> dict:
+    """
+    Maps the color codes of a theme back to their names, the first name for a code used twice.
+    """
+    names = {}
+    for name, code in theme.items():
+        if name != 'reset':
+            names.setdefault(code, name)
+    return names
+
+def ansi_css(code: str) -> str:
+    """
+    Translates the SGR parameters of an ANSI color code, e.g. "\\033[1;37;41m", to CSS.
+
+    Bold, italic, underline, the 16 basic colors and 24-bit colors are translated; anything else is left out.
+    """
+    styles = []
+    for match in SGR_RE.finditer(code):
+        params = [int(param) for param in match.group(1).split(';') if param]
+        while params:
+            param = params.pop(0)
+            if param in (38, 48) and params[:1] == [2] and len(params) >= 4:
+                red, green, blue = params[1:4]
+                del params[:4]
+                styles.append(f"{'color' if param == 38 else 'background'}: #{red:02x}{green:02x}{blue:02x}")
+            elif param in (38, 48) and params[:1] == [5]:
+                del params[:2]
+            elif param == 1:
+                styles.append("font-weight: bold")
+            elif param == 3:
+                styles.append("font-style: italic")
+            elif param == 4:
+                styles.append("text-decoration: underline")
+            elif 30 <= param <= 37 or 90 <= param <= 97:
+                styles.append(f"color: {ANSI_CSS_COLORS[param % 10 + (8 if param >= 90 else 0)]}")
+            elif 40 <= param <= 47 or 100 <= param <= 107:
+                styles.append(f"background: {ANSI_CSS_COLORS[param % 10 + (8 if param >= 100 else 0)]}")
+    return "; ".join(styles)
+
+class JsonLinesFormatter:
+    """
+    Writes every line as a JSON object with the spans of all the patterns matching it (see PatternSet.spans()):
+
+        {"line": 1, "text": "5% packet loss", "spans": [[0, 14, 1, "red"]]}
+
+    where a span is the start and end offset, in characters, the index of the pattern in load
+    order, and the name of its color.
+    """
+    def __init__(self, names: dict):
+        """
+        Args:
+            names (dict): The color names by color code, see color_names().
+        """
+        self.names = names
+        self.lines = 0
+
+    def update_names(self, names: dict) -> None:
+        """
+        Takes the color names of a reloaded theme, keeping the old ones for lines still highlighted with the old patterns.
+        """
+        self.names = {**self.names, **names}
+
+    def header(self) -> str:
+        return ""
+
+    def format_line(self, line: str, spans: list, patterns: list) -> str:
+        self.lines += 1
+        spans = [[start, end, index, self.names.get(patterns[index][1], patterns[index][1])] for start, end, index in spans]
+        return json.dumps({'line': self.lines, 'text': line, 'spans': spans}) + '\n'
+
+    def footer(self) -> str:
+        return ""
+
+class HtmlFormatter:
+    """
+    Writes the lines as an HTML page, with the spans of all the patterns matching them (see
+    PatternSet.spans()) in a <span> styled like the pattern's color.
+    """
+    def __init__(self, names: dict):
+        """
+        Args:
+            names (dict): The color names by color code, see color_names().
+        """
+        self.names = names
+        self.classes = {code: 'hl-' + re.sub(r'[^\w-]', '_', name) for code, name in names.items()}
+
+    def update_names(self, names: dict) -> None:
+        """
+        Takes the color names of a reloaded theme. The <style> is written already, so its classes stay
+        as they are, and colors new to the theme get an inline style like any color without a class.
+        """
+
+    def header(self) -> str:
+        rules = "".join(f".{self.classes[code]} {{ {ansi_css(code)} }}\n" for code in self.names)
+        return ("<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n<title>highlight_patterns</title>\n"
+                f"<style>\n{rules}</style>\n</head>\n<body>\n<pre>\n")
+
+    def format_line(self, line: str, spans: list, patterns: list) -> str:
+        import html
+
+        parts = []
+        last = 0
+        for start, end, index in spans:
+            code = patterns[index][1]
+            if code in self.classes:
+                attribute = f'class="{self.classes[code]}"'
+            else:
+                attribute = f'style="{ansi_css(code)}"'
+            parts.extend((html.escape(line[last:start]), f'<span {attribute} data-pattern="{index}">',
+                          html.escape(line[start:end]), '</span>'))
+            last = end
+        parts.append(html.escape(line[last:]))
+        return "".join(parts) + '\n'
+
+    def footer(self) -> str:
+        return "</pre>\n</body>\n</html>\n"
+
+FORMATTERS = {
+    'json': JsonLinesFormatter,
+    'html': HtmlFormatter,
+}
 
 def highlight_line(line: str, patterns: list, reset_color: str) -> str:
     """
@@ -108,13 +1321,16 @@ def highlight_line(line: str, patterns: list, reset_color: str) -> str:
     Returns:
         str: The line with highlighted matches if any are found, otherwise the original line.
     """
+    if isinstance(patterns, PatternSet):
+        return patterns.highlight(line, reset_color)
     for regex, color in patterns:
         if regex.search(line):
             line = regex.sub(lambda match: f"{color}{match.group(0)}{reset_color}", line)
             break  # Stop after the first match
     return line
 
-def process_input(input_stream, output_stream, patterns: list, reset_color: str) -> None:
+def process_input(input_stream, output_stream, patterns: list, reset_color: str, reloader: PatternReloader = None,
+                  stats: PatternStats = None, guard: MatchGuard = None, formatter=None) -> None:
     """
     Processes the input stream, highlights matching parts of lines, and writes the result to the output stream.
 
@@ -123,23 +1339,461 @@ def process_input(input_stream, output_stream, patterns: list, reset_color: str)
         output_stream: The output stream to write to.
         patterns (list): A list of tuples containing regex patterns and their corresponding ANSI color codes.
         reset_color (str): The ANSI color code to reset the color.
+        reloader (PatternReloader): Takes the patterns and reset color from this instead, as they are reloaded.
+        stats (PatternStats): Collects per-pattern statistics, highlighting more slowly.
+        guard (MatchGuard): A started guard that lines taking too long to match are passed through unhighlighted by.
+        formatter: Write the spans of all the patterns with this JsonLinesFormatter or HtmlFormatter
+            instead of highlighting the first pattern's matches. Its header and footer are not written.
+    """
+    line_count, match_count = _highlight_lines(input_stream, output_stream, patterns, reset_color, reloader, stats, guard, formatter)
+    logging.info(f"Processed {line_count} lines with {match_count} matches.")
+
+def _highlight_lines(input_stream, output_stream, patterns: list, reset_color: str, reloader: PatternReloader = None,
+                     stats: PatternStats = None, guard: MatchGuard = None, formatter=None) -> tuple:
+    """
+    Does the work of process_input(), returning the number of lines and matches instead of logging them.
     """
     line_count = 0
     match_count = 0
+    if not isinstance(patterns, PatternSet):
+        patterns = PatternSet(patterns)
+    # Building the combined regexes can take longer than a line may
+    patterns.compile()
 
     for line in input_stream:
+        if reloader is not None:
+            patterns, reset_color = reloader.current
         line = line.rstrip()  # Remove any trailing newline characters
         try:
-            highlighted_line = highlight_line(line, patterns, reset_color)
-            if line != highlighted_line:
-                match_count += 1
-            output_stream.write(highlighted_line + '\n')
+            try:
+                if guard is not None:
+                    guard.begin()
+                if formatter is not None:
+                    spans = patterns.spans(line)
+                elif stats is None:
+                    highlighted_line = highlight_line(line, patterns, reset_color)
+                else:
+                    highlighted_line = stats.highlight(line, patterns, reset_color)
+                if guard is not None:
+                    guard.end()
+            except LineTimeout as e:
+                logging.warning(f"Not highlighting line {line_count + 1}, {e}: {_line_preview(line)}")
+                highlighted_line = line
+                spans = []
+            if formatter is not None:
+                match_count += bool(spans)
+                output_stream.write(formatter.format_line(line, spans, patterns))
+            else:
+                if line != highlighted_line:
+                    match_count += 1
+                output_stream.write(highlighted_line + '\n')
             line_count += 1
         except Exception as e:
             logging.error(f"Error processing line: {line}. Error: {e}")
+    return line_count, match_count
+
+def encode_patterns(patterns: list) -> PatternSet:
+    """
+    Recompiles patterns and colors as bytes, for matching undecoded input.
+
+    Patterns are encoded as UTF-8, so \\w, \\d, \\b and case-insensitive matching only know about ASCII.
+
+    Args:
+        patterns (list): A list of tuples containing compiled str regex patterns and their corresponding ANSI color codes.
+
+    Returns:
+        PatternSet: The same patterns, in the same order, compiled as bytes.
+    """
+    encoded = []
+    for regex, color in patterns:
+        try:
+            encoded.append((re.compile(regex.pattern.encode('utf-8'), regex.flags & ~re.UNICODE), color.encode('utf-8')))
+        except (re.error, ValueError) as e:
+            logging.warning(f"Skipping pattern '{regex.pattern}' that cannot match bytes: {e}")
+    return PatternSet(encoded)
+
+class BatchedWriter:
+    """
+    Collects output pieces and writes them out in batches, so small writes do not each hit the stream.
+
+    Pieces can be memoryview slices of the input block; flush() before the block is reused.
+    """
+    def __init__(self, stream, limit: int = OUTPUT_BUFFER):
+        self.stream = stream
+        self.limit = limit
+        self.pieces = []
+        self.size = 0
+
+    def write(self, piece) -> None:
+        if not piece:
+            return
+        self.pieces.append(piece)
+        self.size += len(piece)
+        if self.size >= self.limit:
+            self.flush()
+
+    def flush(self) -> None:
+        self.stream.writelines(self.pieces)
+        self.pieces.clear()
+        self.size = 0
+
+def _highlight_block(data, view, end: int, patterns: PatternSet, reset_color: bytes, writer: BatchedWriter,
+                     stats: PatternStats = None, line_count: int = 0, guard: MatchGuard = None) -> int:
+    """
+    Highlights the lines in data[:end], writing the spans in between straight through.
+
+    Args:
+        data: The block, a bytearray of whole lines.
+        view (memoryview): A view of data, sliced for the unchanged spans.
+        end (int): The end of the lines in data.
+        patterns (PatternSet): The patterns, compiled as bytes.
+        reset_color (bytes): The ANSI color code to reset the color.
+        writer (BatchedWriter): Where to write the output.
+        stats (PatternStats): Collects per-pattern statistics, highlighting more slowly.
+        line_count (int): The number of lines before the block, for numbering lines in stats.
+        guard (MatchGuard): A started guard that lines taking too long to match are passed through unhighlighted by.
+
+    Returns:
+        int: The number of highlighted lines.
+    """
+    match_count = 0
+    pending = 0
+    counted = 0
+    for line_start, line_end in patterns.candidate_lines(data, end):
+        line = bytes(view[line_start:line_end]).rstrip()
+        try:
+            if guard is not None:
+                guard.begin()
+            if stats is None:
+                highlighted = patterns.highlight(line, reset_color)
+            else:
+                line_count += data.count(b'\n', counted, line_start)
+                counted = line_start
+                highlighted = stats.highlight(line, patterns, reset_color, line_count + 1)
+            if guard is not None:
+                guard.end()
+        except LineTimeout as e:
+            logging.warning(f"Not highlighting a line, {e}: {_line_preview(line)}")
+            highlighted = line
+        if highlighted is not line:
+            writer.write(view[pending:line_start])
+            writer.write(highlighted)
+            pending = line_start + len(line)
+            match_count += 1
+    writer.write(view[pending:end])
+    return match_count
+
+def process_binary(input_stream, output_stream, patterns: PatternSet, reset_color: bytes, block_size: int = BLOCK_SIZE,
+                   reloader: PatternReloader = None, stats: PatternStats = None, guard: MatchGuard = None) -> None:
+    """
+    Processes a binary input stream in large blocks, highlighting lines like process_input().
 
+    Blocks are read into one reused buffer, only lines holding a pattern's required literal are
+    looked at, and everything else is written through without being decoded or copied. Unlike
+    process_input(), trailing whitespace is kept.
+
+    Args:
+        input_stream: The binary input stream to read from.
+        output_stream: The binary output stream to write to.
+        patterns (PatternSet): The patterns, compiled as bytes (see encode_patterns()).
+        reset_color (bytes): The ANSI color code to reset the color.
+        block_size (int): The number of bytes to read at a time.
+        reloader (PatternReloader): Takes the patterns and reset color from this instead, as they are reloaded.
+        stats (PatternStats): Collects per-pattern statistics for the lines past the prefilter, highlighting them more slowly.
+        guard (MatchGuard): A started guard that lines taking too long to match are passed through unhighlighted by.
+    """
+    line_count, match_count = _highlight_blocks(input_stream, output_stream, patterns, reset_color, block_size, reloader, stats, guard)
     logging.info(f"Processed {line_count} lines with {match_count} matches.")
 
+def _highlight_blocks(input_stream, output_stream, patterns: PatternSet, reset_color: bytes, block_size: int = BLOCK_SIZE,
+                      reloader: PatternReloader = None, stats: PatternStats = None, guard: MatchGuard = None) -> tuple:
+    """
+    Does the work of process_binary(), returning the number of lines and matches instead of logging them.
+    """
+    writer = BatchedWriter(output_stream)
+    buffer = bytearray(block_size)
+    filled = 0
+    line_count = 0
+    match_count = 0
+    eof = False
+
+    while not eof:
+        view = memoryview(buffer)
+        read = input_stream.readinto(view[filled:])
+        eof = not read
+        filled += read or 0
+        end = filled if eof else buffer.rfind(b'\n', 0, filled) + 1
+        if end:
+            if reloader is not None:
+                patterns, reset_color = reloader.current
+            match_count += _highlight_block(buffer, view, end, patterns, reset_color, writer, stats, line_count, guard)
+            line_count += buffer.count(b'\n', 0, end) + (eof and buffer[end - 1] != 0x0a)
+            writer.flush()
+        del view
+        # Keep the partial last line for the next block, growing the buffer if one line fills it
+        buffer[:filled - end] = buffer[end:filled]
+        filled -= end
+        if filled == len(buffer):
+            buffer.extend(bytes(len(buffer)))
+    return line_count, match_count
+
+def split_file(path: Path, chunk_size: int) -> list:
+    """
+    Splits a file into byte ranges of about chunk_size, each ending at a newline.
+
+    Args:
+        path (Path): The file to split.
+        chunk_size (int): The target size of a range in bytes.
+
+    Returns:
+        list: (start, end) byte offsets covering the whole file, in order.
+    """
+    size = path.stat().st_size
+    ranges = []
+    start = 0
+    with path.open('rb') as file:
+        while start < size:
+            file.seek(min(start + chunk_size, size))
+            end = file.tell() + len(file.readline()) if start + chunk_size < size else size
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+# Per-process state of the --jobs workers, set up once by _init_worker()
+_worker = {}
+
+def _init_worker(path: str, patterns: list, reset_color, binary: bool, encoding: str, match_timeout: float) -> None:
+    guard = None
+    if match_timeout:
+        guard = MatchGuard(match_timeout)
+        if not guard.start():
+            guard = None
+    _worker.update(path=path, patterns=PatternSet(patterns).compile(), reset_color=reset_color, binary=binary,
+                   encoding=encoding, guard=guard)
+
+def _highlight_range(start: int, end: int) -> tuple:
+    """
+    Highlights one byte range of the --jobs input file in a worker.
+
+    Returns:
+        tuple: The highlighted output as bytes, and the number of lines and matches in the range.
+    """
+    import io
+
+    with open(_worker['path'], 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start)
+    output = io.BytesIO()
+    if _worker['binary']:
+        counts = _highlight_blocks(io.BytesIO(data), output, _worker['patterns'], _worker['reset_color'], max(1, len(data)),
+                                   guard=_worker['guard'])
+        return output.getvalue(), counts
+    # Decode and split lines the way the serial path's text mode open() does
+    input_stream = io.TextIOWrapper(io.BytesIO(data), encoding=_worker['encoding'])
+    output_stream = io.TextIOWrapper(output, encoding=_worker['encoding'], newline='')
+    counts = _highlight_lines(input_stream, output_stream, _worker['patterns'], _worker['reset_color'], guard=_worker['guard'])
+    output_stream.flush()
+    return output.getvalue(), counts
+
+def process_parallel(input_path: Path, output_stream, patterns: list, reset_color, jobs: int,
+                     binary: bool = False, chunk_size: int = CHUNK_SIZE, match_timeout: float = 0) -> None:
+    """
+    Highlights a file in chunks split at newlines, on a pool of worker processes.
+
+    Every worker builds the same PatternSet once. Output is written in the original order as
+    chunks complete, with at most two chunks per worker in flight, so memory stays bounded.
+
+    Args:
+        input_path (Path): The input file.
+        output_stream: The binary output stream to write to.
+        patterns (list): The patterns, compiled as str, or as bytes with binary.
+        reset_color: The ANSI color code to reset the color, str, or bytes with binary.
+        jobs (int): The number of worker processes.
+        binary (bool): Highlight like process_binary() instead of process_input().
+        chunk_size (int): The largest chunk handed to a worker, smaller files are split in 4 per worker.
+        match_timeout (float): Pass lines through unhighlighted that take longer than this to match, 0 to never.
+    """
+    import locale
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+
+    size = input_path.stat().st_size
+    ranges = split_file(input_path, max(1, min(chunk_size, -(-size // (jobs * 4)))))
+    initargs = (str(input_path), list(patterns), reset_color, binary, locale.getpreferredencoding(False), match_timeout)
+    line_count = 0
+    match_count = 0
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=initargs) as executor:
+        pending = deque()
+        for start, end in ranges:
+            pending.append(executor.submit(_highlight_range, start, end))
+            while len(pending) >= jobs * 2 or (pending and end == size):
+                output, (lines, matches) = pending.popleft().result()
+                output_stream.write(output)
+                line_count += lines
+                match_count += matches
+
+    logging.info(f"Processed {line_count} lines with {match_count} matches.")
+
+def open_inotify(directory: Path):
+    """
+    Starts watching a directory with inotify, through libc as Python has no binding of its own.
+
+    Args:
+        directory (Path): The directory to watch for FOLLOW_EVENTS.
+
+    Returns:
+        int: A non-blocking inotify file descriptor, or None where inotify is not available.
+    """
+    try:
+        import ctypes
+
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(directory), FOLLOW_EVENTS) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+class Follower:
+    """
+    Reads what is appended to a file, following it across rotation and truncation like tail -F.
+
+    Waits on inotify where there is one, so an idle follower does not wake up at all, and polls
+    with backoff otherwise. Either way the file is checked at least every poll_interval.
+    """
+    def __init__(self, path: Path, from_start: bool = False, poll_interval: float = FOLLOW_POLL_INTERVAL):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.file = None
+        self.inotify = open_inotify(path.parent)
+        self._delay = FOLLOW_MIN_POLL_INTERVAL
+        self._open(from_start)
+
+    def _open(self, from_start: bool) -> None:
+        try:
+            self.file = self.path.open('rb')
+        except FileNotFoundError:
+            self.file = None
+            return
+        if not from_start:
+            self.file.seek(0, os.SEEK_END)
+
+    def read(self) -> bytes:
+        """
+        Returns what was appended since the last read, b'' if nothing was.
+        """
+        data = self.file.read() if self.file else b''
+        if data:
+            return data
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return b''  # Rotated away; the new file is picked up once it is created
+        if self.file is None:
+            self._open(from_start=True)
+        elif stat.st_ino != os.fstat(self.file.fileno()).st_ino:
+            # Rotated: finish the old file, then start the new one from its beginning
+            data = self.file.read()
+            self.file.close()
+            self._open(from_start=True)
+        elif stat.st_size < self.file.tell():
+            logging.warning(f"{self.path} was truncated, following from its start.")
+            self.file.seek(0)
+        return data or (self.file.read() if self.file else b'')
+
+    def wait(self, stop=None) -> None:
+        """
+        Waits until the file may have changed, or poll_interval at most.
+
+        Args:
+            stop: An optional threading.Event that ends the wait early when set.
+        """
+        import select
+
+        if self.inotify is not None:
+            if select.select([self.inotify], [], [], self.poll_interval)[0]:
+                try:
+                    while os.read(self.inotify, 65536):
+                        pass
+                except BlockingIOError:
+                    pass
+            return
+        if stop is not None:
+            stop.wait(self._delay)
+        else:
+            time.sleep(self._delay)
+        self._delay = min(self._delay * 2, self.poll_interval)
+
+    def woke(self) -> None:
+        """
+        Notes that data arrived, so polling goes back to its fastest rate.
+        """
+        self._delay = FOLLOW_MIN_POLL_INTERVAL
+
+    def close(self) -> None:
+        if self.file:
+            self.file.close()
+        if self.inotify is not None:
+            os.close(self.inotify)
+
+def follow(path: Path, output_stream, patterns: list, reset_color: str, from_start: bool = False,
+           poll_interval: float = FOLLOW_POLL_INTERVAL, stop=None, reloader: PatternReloader = None,
+           stats: PatternStats = None, guard: MatchGuard = None, formatter=None) -> None:
+    """
+    Highlights the lines appended to a file as they arrive, until interrupted.
+
+    Output is flushed after every batch of lines, so a line is shown within poll_interval of
+    being written, and with inotify typically within milliseconds.
+
+    Args:
+        path (Path): The file to follow.
+        output_stream: The output stream to write to.
+        patterns (list): A list of tuples containing regex patterns and their corresponding ANSI color codes.
+        reset_color (str): The ANSI color code to reset the color.
+        from_start (bool): Highlight what is already in the file first, instead of only new lines.
+        poll_interval (float): The longest time between checks of the file.
+        stop: An optional threading.Event that ends following when set.
+        reloader (PatternReloader): Takes the patterns and reset color from this instead, as they are reloaded.
+        stats (PatternStats): Collects per-pattern statistics, highlighting more slowly.
+        guard (MatchGuard): A started guard that lines taking too long to match are passed through unhighlighted by.
+        formatter: Write the spans of all the patterns with this formatter instead, see process_input().
+    """
+    import io
+    import locale
+
+    if not isinstance(patterns, PatternSet):
+        patterns = PatternSet(patterns)
+    encoding = locale.getpreferredencoding(False)
+    follower = Follower(path, from_start, poll_interval)
+    partial = b''
+    line_count = 0
+    match_count = 0
+    try:
+        while stop is None or not stop.is_set():
+            data = follower.read()
+            if not data:
+                follower.wait(stop)
+                continue
+            follower.woke()
+            # Lines are only highlighted once complete, the rest waits for its newline
+            data = partial + data
+            end = data.rfind(b'\n') + 1
+            partial = data[end:]
+            if end:
+                text = data[:end].decode(encoding, errors='replace')
+                lines, matches = _highlight_lines(io.StringIO(text, newline=None), output_stream, patterns, reset_color,
+                                                  reloader, stats, guard, formatter)
+                line_count += lines
+                match_count += matches
+                output_stream.flush()
+    finally:
+        follower.close()
+        logging.info(f"Processed {line_count} lines with {match_count} matches.")
+
 def create_example_configs(config_dir: Path) -> None:
     """
     Creates example configuration files in the specified directory.
@@ -182,10 +1836,19 @@ def main() -> None:
     parser.add_argument('--create-configs', action='store_true', help="Create example configuration files")
     parser.add_argument('--theme', type=str, help="Theme to use from the theme file (default: 'default')")
     parser.add_argument('--theme-file', type=str, help="Path to a specific theme file (overrides --theme)")
+    parser.add_argument('--no-cache', action='store_true', help=f"Load the pattern files even if they are unchanged since the last run (cache: {CACHE_DIR})")
+    parser.add_argument('-f', '--follow', type=str, metavar='FILE', help="Highlight lines as they are appended to FILE, following rotation like tail -F")
+    parser.add_argument('--no-reload', action='store_true', help="Do not pick up changed config files while following or reading stdin")
+    parser.add_argument('--format', choices=['ansi', *FORMATTERS], default='ansi', help="ansi: color the matches of the first matching pattern (default); json: a JSON object per line with the spans of all patterns; html: a page with the spans of all patterns")
+    parser.add_argument('--stats', nargs='?', const='-', metavar='FILE', help="Time every pattern and write per-pattern statistics as JSON to FILE (default: stderr) on exit and on SIGUSR1; highlighting is slower")
+    parser.add_argument('--match-timeout', type=float, metavar='SECONDS', help=f"Pass a line through unhighlighted if matching it takes longer than this, 0 to never (default: {MATCH_TIMEOUT})")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="Highlight an --input file on this many processes, 0 for one per CPU (default: 1)")
+    parser.add_argument('--binary', action='store_true', help="Process raw bytes in large blocks, much faster on big mostly unmatched input (patterns match ASCII-only, trailing whitespace is kept)")
     args = parser.parse_args()
 
     if args.self_test:
-        unittest.main(argv=[sys.argv[0]])
+        import unittest
+        unittest.main(module='test_highlight_patterns', argv=[sys.argv[0]])
         sys.exit(0)
 
     config_dir = Path(args.config_dir)
@@ -202,49 +1865,133 @@ def main() -> None:
         logging.error(f"Theme file does not exist: {theme_file_path}. Run with --create-configs to create example configuration files.")
         sys.exit(1)
 
-    themes = load_themes(theme_file_path)
     theme_name = args.theme if args.theme else 'default'
+    cache_file = cached = None
+    fingerprint = config_fingerprint(config_dir, theme_file_path, theme_name)
+    if not args.no_cache:
+        cache_file = pattern_cache_file(config_dir, theme_file_path, theme_name)
+        cached = load_pattern_cache(cache_file, fingerprint)
 
-    if theme_name not in themes:
-        logging.error(f"Theme '{theme_name}' not found in theme file.")
-        sys.exit(1)
+    if cached:
+        patterns, reset_color = cached
+    else:
+        themes = load_themes(theme_file_path)
+
+        if theme_name not in themes:
+            logging.error(f"Theme '{theme_name}' not found in theme file.")
+            sys.exit(1)
 
-    selected_theme = themes[theme_name]
-    reset_color = selected_theme.get('reset', "\033[0m")
-    patterns = load_patterns(config_dir, selected_theme)
+        selected_theme = themes[theme_name]
+        reset_color = selected_theme.get('reset', "\033[0m")
+        patterns = load_patterns(config_dir, selected_theme)
 
-    if not patterns:
-        logging.error(f"No pattern files found in {config_dir}. Run with --create-configs to create example configuration files.")
+        if not patterns:
+            logging.error(f"No pattern files found in {config_dir}. Run with --create-configs to create example configuration files.")
+            sys.exit(1)
+        if cache_file:
+            patterns = save_pattern_cache(cache_file, fingerprint, patterns, reset_color)
+
+    if args.follow and (args.input or args.jobs != 1 or args.binary):
+        logging.error("--follow cannot be combined with --input, --jobs or --binary.")
+        sys.exit(1)
+    if args.stats and args.jobs != 1:
+        logging.error("--stats cannot be combined with --jobs.")
         sys.exit(1)
+    formatter = None
+    if args.format != 'ansi':
+        if args.binary or args.jobs != 1 or args.stats:
+            logging.error(f"--format {args.format} cannot be combined with --binary, --jobs or --stats.")
+            sys.exit(1)
+        formatter = FORMATTERS[args.format](color_names(load_themes(theme_file_path)[theme_name]))
 
     # If no input file is provided and stdin is a terminal, show the help message
-    if not args.input and sys.stdin.isatty():
+    if not args.input and not args.follow and sys.stdin.isatty():
         parser.print_help()
         sys.exit(0)
 
-    input_stream = sys.stdin
+    jobs = args.jobs or os.cpu_count() or 1
+    if jobs > 1 and not args.input:
+        logging.warning("--jobs needs an --input file, highlighting stdin on one process.")
+        jobs = 1
+    mode = 'b' if args.binary or jobs > 1 else ''
+    input_stream = sys.stdin.buffer if args.binary else sys.stdin
     if args.input:
         input_path = Path(args.input)
         if not input_path.is_file():
             logging.error(f"Input file does not exist: {args.input}")
             sys.exit(1)
-        input_stream = input_path.open('r')
+        input_stream = input_path.open('r' + mode)
 
-    output_stream = sys.stdout
+    output_stream = sys.stdout.buffer if mode else sys.stdout
     if args.output:
         output_path = Path(args.output)
         try:
-            output_stream = output_path.open('w')
+            output_stream = output_path.open('w' + mode)
         except Exception as e:
             logging.error(f"Error opening output file: {args.output}. Error: {e}")
             sys.exit(1)
 
+    if args.binary:
+        patterns, reset_color = encode_patterns(patterns), reset_color.encode('utf-8')
+
+    # Long-running streams pick up config changes; an --input file is done before they matter
+    reloader = None
+    if not args.input and not args.no_reload:
+        # The formatter names the colors of the theme, so it follows a reloaded theme too
+        on_reload = (lambda theme: formatter.update_names(color_names(theme))) if formatter else None
+        reloader = PatternReloader(config_dir, theme_file_path, theme_name, patterns, reset_color,
+                                   fingerprint=fingerprint, cache_file=cache_file, binary=args.binary,
+                                   on_reload=on_reload).start()
+
+    stats = None
+    if args.stats:
+        import signal
+
+        stats = PatternStats()
+        stats_path = None if args.stats == '-' else Path(args.stats)
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, lambda signum, frame: stats.dump(stats_path))
+
+    match_timeout = max(MATCH_TIMEOUT if args.match_timeout is None else args.match_timeout, 0)
+    guard = None
+    if match_timeout and jobs == 1:
+        guard = MatchGuard(match_timeout)
+        if not guard.start():
+            if args.match_timeout is not None:
+                logging.warning("--match-timeout is not supported on this platform, slow lines will not be cut short.")
+            guard = None
+
     try:
-        process_input(input_stream, output_stream, patterns, reset_color)
+        if formatter:
+            output_stream.write(formatter.header())
+        if args.follow:
+            follow(Path(args.follow), output_stream, patterns, reset_color, reloader=reloader, stats=stats, guard=guard,
+                   formatter=formatter)
+        elif jobs > 1:
+            process_parallel(input_path, output_stream, patterns, reset_color, jobs, binary=args.binary,
+                             match_timeout=match_timeout)
+        elif args.binary:
+            process_binary(input_stream, output_stream, patterns, reset_color, reloader=reloader, stats=stats, guard=guard)
+        else:
+            process_input(input_stream, output_stream, patterns, reset_color, reloader=reloader, stats=stats, guard=guard,
+                          formatter=formatter)
+    except KeyboardInterrupt:
+        pass
     except Exception as e:
         logging.error(f"An error occurred during processing: {e}")
         sys.exit(1)
     finally:
+        if formatter:
+            output_stream.write(formatter.footer())
+        if guard:
+            guard.stop()
+        if reloader:
+            reloader.stop()
+        if stats:
+            try:
+                stats.dump(stats_path)
+            except OSError as e:
+                logging.error(f"Error writing stats to {args.stats}: {e}")
         if args.input:
             input_stream.close()
         if args.output:
@@ -252,50 +1999,5 @@ def main() -> None:
 
     sys.exit(0)
 
-class TestHighlightPatterns(unittest.TestCase):
-    """
-    Unit tests for the highlight_patterns script.
-    """
-    def test_highlight_line(self):
-        themes = {
-            "red": "\033[1;37;41m",
-            "green": "\033[37;42m",
-            "reset": "\033[0m"
-        }
-        patterns = [
-            (re.compile(r"\b0% packet loss\b"), themes["green"]),
-            (re.compile(r"\b\d+% packet loss\b"), themes["red"])
-        ]
-        line = "100% packet loss"
-        expected = f"{themes['red']}100% packet loss{themes['reset']}"
-        self.assertEqual(highlight_line(line, patterns, themes["reset"]), expected)
-
-    def test_no_highlight(self):
-        themes = {
-            "red": "\033[1;37;41m",
-            "green": "\033[37;42m",
-            "reset": "\033[0m"
-        }
-        patterns = [
-            (re.compile(r"\b0% packet loss\b"), themes["green"]),
-            (re.compile(r"\b\d+% packet loss\b"), themes["red"])
-        ]
-        line = "No loss"
-        self.assertEqual(highlight_line(line, patterns, themes["reset"]), line)
-
-    def test_another_pattern(self):
-        themes = {
-            "red": "\033[1;37;41m",
-            "green": "\033[37;42m",
-            "reset": "\033[0m"
-        }
-        patterns = [
-            (re.compile(r"\b0% packet loss\b"), themes["green"]),
-            (re.compile(r"\b\d+% packet loss\b"), themes["red"])
-        ]
-        line = "0% packet loss"
-        expected = f"{themes['green']}0% packet loss{themes['reset']}"
-        self.assertEqual(highlight_line(line, patterns, themes["reset"]), expected)
-
 if __name__ == "__main__":
     main()
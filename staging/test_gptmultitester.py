@@ -0,0 +1,466 @@
+"""
+Unit tests for gptmultitester.py, run them with ./gptmultitester.py --self-test
+"""
+
+import asyncio
+import errno
+import os
+import select
+import shutil
+import socket
+import ssl
+import subprocess
+import tempfile
+import time
+import unittest
+
+from gptmultitester import (
+    HTTP_PORT, SUCCESS_MESSAGE, ConnectScanner, HttpPool, HttpResponder, Monitor, Prober, Resolver, _free_port,
+    build_probes, connect_state, format_result, format_timings, scan,
+)
+
+class TestGptMultitester(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.close()
+        # Let the listeners see the last clients hang up
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        self.loop.close()
+
+    def listen(self, protocol_factory):
+        server = self.loop.run_until_complete(self.loop.create_server(protocol_factory, '127.0.0.1', 0))
+        self.servers.append(server)
+        return server.sockets[0].getsockname()[1]
+
+    def test_scan_local_listeners(self):
+        http_port = self.listen(HttpResponder)
+        silent_port = self.listen(asyncio.Protocol)
+        closed_port = _free_port()
+        probes = [
+            ('127.0.0.1', 'dns', None, None),
+            ('127.0.0.1', 'http', http_port, 'http'),
+            ('127.0.0.1', 'tcp', http_port, 'custom'),
+            ('127.0.0.1', 'tcp', closed_port, 'custom'),
+            ('127.0.0.1', 'http', silent_port, 'http'),
+            ('no-such-host.invalid', 'dns', None, None),
+            ('no-such-host.invalid', 'tcp', http_port, 'custom'),
+        ]
+        reported = []
+        results = self.loop.run_until_complete(scan(probes, timeout=0.3, report=reported.append))
+        self.assertEqual(reported, results)
+        self.assertEqual([(result['target'], result['kind'], result['port']) for result in results],
+                         [probe[:3] for probe in probes])
+        self.assertEqual([result['ok'] for result in results], [True, True, True, False, False, False, False])
+        self.assertEqual(results[1]['detail'], "200 OK")
+        self.assertEqual(results[3]['detail'], "refused")
+        self.assertEqual(results[4]['detail'], "timed out")
+        self.assertEqual(results[6]['detail'], "not resolved")
+        self.assertTrue(results[0]['detail'].startswith("127.0.0.1"))
+        self.assertEqual(format_result(results[2]), f"Port {http_port} (custom): {SUCCESS_MESSAGE}")
+        self.assertIsNone(format_result(results[6]))
+
+    def test_scan_invalid_name(self):
+        probes = [('a..b', 'dns', None, None), ('a..b', 'tcp', 1, 'custom'), ('127.0.0.1', 'dns', None, None)]
+        reported = []
+        results = self.loop.run_until_complete(scan(probes, timeout=0.3, report=reported.append))
+        self.assertEqual(reported, results)
+        self.assertEqual([result['ok'] for result in results], [False, False, True])
+        self.assertIn("invalid name 'a..b'", results[0]['detail'])
+        self.assertEqual(results[1]['detail'], "not resolved")
+
+    def test_concurrency_limit(self):
+        counts = {'in_flight': 0, 'most': 0}
+
+        class CountingResponder(HttpResponder):
+            def connection_made(self, transport):
+                super().connection_made(transport)
+                counts['in_flight'] += 1
+                counts['most'] = max(counts['most'], counts['in_flight'])
+
+            def respond(self):
+                counts['in_flight'] -= 1
+                super().respond()
+
+        port = self.listen(lambda: CountingResponder(0.05))
+        probes = [('127.0.0.1', 'http', port, 'http')] * 20
+        started = time.monotonic()
+        results = self.loop.run_until_complete(scan(probes, concurrency=4))
+        self.assertTrue(all(result['ok'] for result in results))
+        self.assertEqual(counts['most'], 4)
+        self.assertGreaterEqual(time.monotonic() - started, 0.05 * 20 / 4)
+
+    def test_rate_limit_and_deadline(self):
+        port = self.listen(HttpResponder)
+        started = time.monotonic()
+        results = self.loop.run_until_complete(scan([('127.0.0.1', 'tcp', port, 'custom')] * 5, rate=20))
+        self.assertTrue(all(result['ok'] for result in results))
+        self.assertGreaterEqual(time.monotonic() - started, 4 / 20)
+
+        # Ten probes at two a second do not fit in the deadline, the first two do
+        started = time.monotonic()
+        results = self.loop.run_until_complete(scan([('127.0.0.1', 'tcp', port, 'custom')] * 10, rate=2, deadline=0.8))
+        self.assertLess(time.monotonic() - started, 1.3)
+        self.assertEqual([result['ok'] for result in results], [True] * 2 + [False] * 8)
+        self.assertEqual(results[-1]['detail'], "deadline exceeded")
+
+    def test_resolver(self):
+        queries = []
+
+        class FakeResolver(Resolver):
+            records = {('A', 'both'): ['192.0.2.1'], ('AAAA', 'both'): ['2001:db8::1'], ('A', 'six'): [],
+                       ('AAAA', 'six'): ['2001:db8::2'], ('PTR', '192.0.2.1'): 'both.example'}
+
+            def query(self, kind, name):
+                queries.append((kind, name))
+                time.sleep(0.05)
+                if name == 'broken':
+                    raise socket.gaierror(socket.EAI_AGAIN, "Temporary failure in name resolution")
+                return self.records.get((kind, name), [] if kind != 'PTR' else None)
+
+        resolver = FakeResolver(ttl=0.3)
+        self.addCleanup(resolver.close)
+
+        async def resolve_all(targets):
+            return await asyncio.gather(*(resolver.resolve(target) for target in targets), return_exceptions=True)
+
+        # All lookups run at once, and the same one asked for twice runs once
+        started = time.monotonic()
+        answers = self.loop.run_until_complete(resolve_all(['both', 'six', 'none', 'broken', 'both', '2001:db8::9']))
+        self.assertLess(time.monotonic() - started, 0.15)
+        self.assertEqual(answers[:2], [['192.0.2.1', '2001:db8::1'], ['2001:db8::2']])
+        self.assertIsInstance(answers[2], socket.gaierror)
+        self.assertEqual(answers[3].errno, socket.EAI_AGAIN)
+        self.assertEqual(answers[4], answers[0])
+        self.assertEqual(answers[5], ['2001:db8::9'])
+        self.assertEqual(len(queries), 8)
+        self.assertEqual(self.loop.run_until_complete(resolver.reverse_lookup('192.0.2.1')), 'both.example')
+
+        # Answers, but not failures, are kept until they are out of date, even by another event loop
+        queries.clear()
+        other_loop = asyncio.new_event_loop()
+        self.addCleanup(other_loop.close)
+        other_loop.run_until_complete(resolve_all(['both', 'six', 'none', 'broken']))
+        self.loop.run_until_complete(resolver.reverse_lookup('192.0.2.1'))
+        self.assertEqual(queries, [('A', 'broken'), ('AAAA', 'broken')])
+        time.sleep(0.3)
+        resolver.evict()
+        self.assertEqual(resolver.cache, {})
+        queries.clear()
+        self.loop.run_until_complete(resolve_all(['both']))
+        self.assertEqual(sorted(queries), [('A', 'both'), ('AAAA', 'both')])
+
+    def test_scan_ipv6(self):
+        if not socket.has_ipv6:
+            self.skipTest("no IPv6")
+        try:
+            server = self.loop.run_until_complete(self.loop.create_server(HttpResponder, '::1', 0))
+        except OSError:
+            self.skipTest("no IPv6 loopback")
+        self.servers.append(server)
+        port = server.sockets[0].getsockname()[1]
+        probes = [('::1', 'dns', None, None), ('::1', 'http', port, 'http'), ('::1', 'tcp', port, 'custom')]
+        results = self.loop.run_until_complete(scan(probes, timeout=1))
+        self.assertEqual([result['ok'] for result in results], [True, True, True])
+        self.assertTrue(results[0]['detail'].startswith("::1"))
+
+    def test_http_pool(self):
+        connections = []
+
+        class ScriptedResponder(asyncio.Protocol):
+            """Answers the requests on a connection with the next of a list of responses."""
+
+            def __init__(self, responses):
+                self.responses = list(responses)
+                self.requests = []
+
+            def connection_made(self, transport):
+                self.transport = transport
+                connections.append(self)
+
+            def data_received(self, data):
+                self.requests.append(data.split(b" ", 1)[0])
+                response = self.responses.pop(0)
+                self.transport.write(response)
+                if b"Connection: close" in response or not self.responses:
+                    self.transport.close()
+
+        def listen(*responses):
+            return self.listen(lambda: ScriptedResponder(responses))
+
+        pool = HttpPool(idle_timeout=5)
+        probe = lambda port: self.loop.run_until_complete(pool.probe('127.0.0.1', 'localhost', port))
+
+        # Keep-alive connections carry request after request
+        port = listen(*[b"HTTP/1.1 204 No Content\r\n\r\n"] * 3)
+        statuses = [probe(port) for _ in range(3)]
+        self.assertEqual([status for status, _timings in statuses], ["204 No Content"] * 3)
+        self.assertEqual([timings['reused'] for _status, timings in statuses], [False, True, True])
+        self.assertIsNotNone(statuses[0][1]['connect'])
+        self.assertIsNone(statuses[1][1]['connect'])
+        self.assertEqual(len(connections), 1)
+        self.assertEqual(connections[0].requests, [b"HEAD"] * 3)
+
+        # A server that closed an idle connection gets the request on a new one
+        connections.clear()
+        port = listen(b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n")
+        self.assertEqual(probe(port)[0], "200 OK")
+        self.assertEqual(probe(port)[0], "200 OK")
+        self.assertEqual(len(connections), 2)
+
+        # GET reads bodies up to the limit, and closes connections with longer ones
+        pool.method = 'GET'
+        pool.body_limit = 10
+        connections.clear()
+        port = listen(b"HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\nhello",
+                      b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n5\r\nhello\r\n0\r\n\r\n",
+                      b"HTTP/1.1 100 Continue\r\n\r\nHTTP/1.1 404 Not Found\r\nContent-Length: 11\r\n\r\nnot found!!",
+                      b"HTTP/1.1 200 OK\r\n\r\n")
+        self.assertEqual([probe(port)[0] for _ in range(4)], ["200 OK", "200 OK", "404 Not Found", "200 OK"])
+        self.assertEqual(len(connections), 2)
+        self.assertEqual(connections[0].requests, [b"GET"] * 3)
+
+        port = listen(b"SSH-2.0-OpenSSH\r\n")
+        with self.assertRaises(ConnectionError):
+            probe(port)
+        pool.close()
+
+        # At most max_idle connections are kept, the oldest go first
+        pool = HttpPool(max_idle=2)
+        probe = lambda port: self.loop.run_until_complete(pool.probe('127.0.0.1', 'localhost', port))
+        ports = [self.listen(lambda: HttpResponder(keep_alive=True)) for _ in range(3)]
+        for port in ports:
+            probe(port)
+        self.assertEqual(len(pool.idle_order), 2)
+        self.assertEqual([probe(port)[1]['reused'] for port in reversed(ports)], [True, True, False])
+        self.assertEqual(len(pool.idle_order), 2)
+        pool.close()
+
+    def test_https_session_resumption(self):
+        if not shutil.which('openssl'):
+            self.skipTest("no openssl command to make a certificate with")
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        certificate = os.path.join(directory, 'localhost.pem')
+        subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1', '-subj', '/CN=localhost',
+                        '-addext', 'subjectAltName=DNS:localhost', '-keyout', certificate, '-out', certificate],
+                       check=True, capture_output=True)
+        server_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        server_context.load_cert_chain(certificate)
+        server = self.loop.run_until_complete(self.loop.create_server(HttpResponder, '127.0.0.1', 0, ssl=server_context))
+        self.servers.append(server)
+        port = server.sockets[0].getsockname()[1]
+
+        # Each response closes its connection, so the second probe resumes the session
+        pool = HttpPool(context=ssl.create_default_context(cafile=certificate))
+        results = [self.loop.run_until_complete(pool.probe('127.0.0.1', 'localhost', port, tls=True)) for _ in range(2)]
+        self.assertEqual([status for status, _timings in results], ["200 OK"] * 2)
+        self.assertEqual([timings['resumed'] for _status, timings in results], [False, True])
+        self.assertGreater(results[0][1]['tls'], 0)
+        self.assertIn("TLS", format_timings(results[1][1]))
+        pool.close()
+
+        # Certificates are verified; the server logs the handshake the client gives up on
+        self.loop.set_exception_handler(lambda _loop, _context: None)
+        with self.assertRaises(ssl.SSLCertVerificationError):
+            self.loop.run_until_complete(HttpPool().probe('127.0.0.1', 'localhost', port, tls=True))
+
+    def test_monitor(self):
+        open_port = self.listen(asyncio.Protocol)
+        slow_port = self.listen(lambda: HttpResponder(0.35))
+        closed_port = _free_port()
+        probes = [('127.0.0.1', 'tcp', open_port, 'custom'), ('127.0.0.1', 'tcp', closed_port, 'custom'),
+                  ('127.0.0.1', 'http', slow_port, 'http'), ('127.0.0.1', 'dns', None, None)]
+        reported = []
+
+        async def monitor():
+            resolver = Resolver()
+            pool = HttpPool()
+            prober = Prober(resolver, pool, timeout=1)
+            monitor = Monitor(probes, prober, 0.1, {'dns': 0.5}, jitter=0.1, max_backoff=4, report=reported.append)
+            starts = {index: [] for index in range(len(probes))}
+            run = monitor._run
+
+            async def counted_run(index, nominal):
+                starts[index].append(asyncio.get_running_loop().time())
+                await run(index, nominal)
+
+            monitor._run = counted_run
+            try:
+                await monitor.run(1.2)
+            finally:
+                prober.close()
+                pool.close()
+                resolver.close()
+            return monitor, starts
+
+        monitor, starts = self.loop.run_until_complete(monitor())
+        # The open port keeps its cadence next to the slow server
+        self.assertTrue(10 <= len(starts[0]) <= 13, starts[0])
+        gaps = [later - earlier for earlier, later in zip(starts[0], starts[0][1:])]
+        self.assertTrue(all(0.07 < gap < 0.13 for gap in gaps), gaps)
+        # The closed port backs off: 0.2, 0.4, then 0.4 seconds apart
+        gaps = [later - earlier for earlier, later in zip(starts[1], starts[1][1:])]
+        self.assertTrue(3 <= len(starts[1]) <= 5, starts[1])
+        self.assertAlmostEqual(gaps[0], 0.2, delta=0.05)
+        self.assertTrue(all(gap < 0.45 for gap in gaps), gaps)
+        # The slow server never has two probes at once, and misses the runs it overruns
+        gaps = [later - earlier for earlier, later in zip(starts[2], starts[2][1:])]
+        self.assertTrue(all(gap >= 0.35 for gap in gaps), gaps)
+        self.assertGreater(monitor.skipped, 0)
+        self.assertTrue(2 <= len(starts[3]) <= 3, starts[3])
+        # Only first results are reported, as none changed
+        self.assertEqual(sorted((result['port'] or 0, result['ok']) for result in reported),
+                         sorted([(open_port, True), (closed_port, False), (slow_port, True), (0, True)]))
+        self.assertEqual(monitor.running, {})
+
+    def test_monitor_reschedules_broken_probe(self):
+        port = self.listen(asyncio.Protocol)
+        probes = [('127.0.0.1', 'tcp', port, 'custom')]
+        reported = []
+
+        class BrokenOnceProber(Prober):
+            calls = 0
+
+            async def probe(self, *args, **kwargs):
+                BrokenOnceProber.calls += 1
+                if BrokenOnceProber.calls == 1:
+                    raise RuntimeError("broken")
+                return await super().probe(*args, **kwargs)
+
+        async def monitor():
+            resolver = Resolver()
+            pool = HttpPool()
+            prober = BrokenOnceProber(resolver, pool, timeout=1)
+            monitor = Monitor(probes, prober, 0.1, jitter=0, report=reported.append)
+            try:
+                await monitor.run(0.6)
+            finally:
+                prober.close()
+                pool.close()
+                resolver.close()
+            return monitor
+
+        monitor = self.loop.run_until_complete(monitor())
+        # The broken run is a failure, and the probe runs and recovers after backing off
+        self.assertGreaterEqual(BrokenOnceProber.calls, 2)
+        self.assertEqual([result['ok'] for result in reported], [False, True])
+        self.assertIn("RuntimeError", reported[0]['detail'])
+        self.assertEqual(monitor.runs, BrokenOnceProber.calls)
+
+    def test_monitor_dns_skips_cache(self):
+        queries = []
+
+        class FakeResolver(Resolver):
+            def query(self, kind, name):
+                queries.append((kind, name))
+                return ['127.0.0.1'] if kind == 'A' else [] if kind == 'AAAA' else 'monitored.example'
+
+        port = self.listen(asyncio.Protocol)
+        probes = [('monitored', 'dns', None, None), ('monitored', 'tcp', port, 'custom')]
+
+        async def monitor():
+            resolver = FakeResolver(ttl=300)
+            pool = HttpPool()
+            prober = Prober(resolver, pool, timeout=1)
+            monitor = Monitor(probes, prober, 0.1, {'dns': 0.1}, jitter=0)
+            try:
+                await monitor.run(0.55)
+            finally:
+                prober.close()
+                pool.close()
+                resolver.close()
+            return monitor
+
+        self.loop.run_until_complete(monitor())
+        # Five dns runs or so, each asking for A, AAAA and PTR. The five tcp runs take cached
+        # answers, but for the first if it comes before any, and the last dns run may be cut
+        # short before its PTR lookup
+        self.assertGreaterEqual(queries.count(('PTR', '127.0.0.1')), 4)
+        self.assertLessEqual(queries.count(('A', 'monitored')), queries.count(('PTR', '127.0.0.1')) + 2)
+
+    def blackhole(self):
+        """
+        Returns a port whose connects get no answer: a listener that never accepts, with its
+        backlog filled up.
+        """
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(0)
+        self.addCleanup(listener.close)
+        address = listener.getsockname()
+        while True:
+            sock = socket.socket()
+            self.addCleanup(sock.close)
+            sock.setblocking(False)
+            sock.connect_ex(address)
+            if not select.select([], [sock], [], 0.05)[1]:
+                return address[1]
+
+    def test_connect_scanner(self):
+        open_port = self.listen(asyncio.Protocol)
+        closed_port = _free_port()
+        filtered_port = self.blackhole()
+        fds = len(os.listdir('/proc/self/fd')) if os.path.isdir('/proc/self/fd') else None
+
+        async def run(ports, max_open):
+            scanner = ConnectScanner(timeout=0.2, max_open=max_open)
+            most = 0
+
+            def count():
+                nonlocal most
+                most = max(most, len(scanner.open))
+
+            futures = [scanner.connect(('127.0.0.1', port)) for port in ports]
+            count()
+            for future in futures:
+                future.add_done_callback(lambda _future: count())
+            try:
+                return await asyncio.gather(*futures), most, scanner
+            finally:
+                scanner.close()
+
+        ports = [open_port, closed_port, filtered_port] * 4
+        started = time.monotonic()
+        states, most, scanner = self.loop.run_until_complete(run(ports, 3))
+        self.assertEqual(states, ["open", "refused", "filtered"] * 4)
+        self.assertLessEqual(most, 3)
+        # Four filtered connects, three at a time at most, take two timeouts at least
+        self.assertGreaterEqual(time.monotonic() - started, 0.4)
+        self.assertEqual((scanner.open, list(scanner.waiting)), ({}, []))
+        if fds is not None:
+            self.assertEqual(len(os.listdir('/proc/self/fd')), fds)
+
+        # Closing the scanner mid-scan closes its sockets and cancels the rest
+        async def interrupt():
+            scanner = ConnectScanner(timeout=5, max_open=2)
+            futures = [scanner.connect(('127.0.0.1', filtered_port)) for _ in range(4)]
+            await asyncio.sleep(0.05)
+            scanner.close()
+            return futures, scanner
+
+        futures, scanner = self.loop.run_until_complete(interrupt())
+        self.assertTrue(all(future.cancelled() for future in futures))
+        self.assertEqual(scanner.open, {})
+        if fds is not None:
+            self.assertEqual(len(os.listdir('/proc/self/fd')), fds)
+
+    def test_connect_state(self):
+        self.assertEqual([connect_state(error) for error in (0, errno.ECONNREFUSED, errno.ETIMEDOUT, errno.EHOSTUNREACH)],
+                         ["open", "refused", "filtered", "unreachable"])
+        self.assertEqual(connect_state(errno.EACCES), os.strerror(errno.EACCES))
+
+    def test_build_probes(self):
+        probes = build_probes(['a', 'b'], [22, 8080], [8000])
+        self.assertEqual(probes[:7], [('a', 'dns', None, None), ('a', 'http', HTTP_PORT, 'http'), ('a', 'http', 8000, 'http'),
+                                      ('a', 'tcp', 80, 'http'), ('a', 'tcp', 443, 'https'), ('a', 'tcp', 22, 'ssh'),
+                                      ('a', 'tcp', 8080, 'custom')])
+        self.assertEqual(probes[7][0], 'b')
+
+
+if __name__ == '__main__':
+    unittest.main()
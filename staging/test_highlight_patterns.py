@@ -0,0 +1,529 @@
+"""
+Unit tests for highlight_patterns.py, run them with ./highlight_patterns.py --self-test
+"""
+
+import json
+import random
+import re
+import time
+import unittest
+from pathlib import Path
+
+from highlight_patterns import (
+    ansi_css, backtracking_risk, color_names, config_fingerprint, create_example_configs, encode_patterns, follow,
+    highlight_line, _highlight_lines, HtmlFormatter, JsonLinesFormatter, LazyPattern, literal_trie_pattern,
+    load_pattern_cache, load_patterns, load_themes, MatchGuard, pattern_cache_file, PatternReloader, PatternSet, PatternStats,
+    process_binary, process_input, process_parallel, required_literal, save_pattern_cache, split_file,
+)
+
+def make_benchmark_patterns(count: int) -> list:
+    """
+    Builds a set of alert-style patterns, in the shape of a large shared pattern repository.
+
+    Args:
+        count (int): The number of patterns.
+
+    Returns:
+        list: A list of tuples containing compiled regex patterns and their corresponding ANSI color codes.
+    """
+    shapes = (
+        r'\bInterface Gi0/{i}, changed state to down\b',
+        r'\bBGP-5-ADJCHANGE: neighbor 10\.{i}\.\d+\.\d+ Down\b',
+        r'\b(?:ERR|CRIT)-{i}\b',
+        r'(?i)\bfan {i} (?:failed|missing)\b',
+        r'\b\d+% packet loss on probe{i}\b',
+    )
+    colors = ("\033[1;37;41m", "\033[37;42m", "\033[30;43m")
+    return [(re.compile(shapes[i % len(shapes)].format(i=i)), colors[i % len(colors)]) for i in range(count)]
+
+def make_benchmark_lines(count: int, pattern_count: int, hit_rate: float = 0.05, seed: int = 0) -> list:
+    """
+    Builds router log lines of which roughly hit_rate match one of make_benchmark_patterns(pattern_count).
+
+    Args:
+        count (int): The number of lines.
+        pattern_count (int): The number of patterns the matching lines are drawn from.
+        hit_rate (float): The fraction of lines that match a pattern.
+        seed (int): The random seed, so runs are comparable.
+
+    Returns:
+        list: The log lines, without newlines.
+    """
+    rng = random.Random(seed)
+    lines = []
+    for n in range(count):
+        prefix = f"Oct 17 12:{n // 60 % 60:02d}:{n % 60:02d} rtr{rng.randrange(40)}.example.net"
+        i = rng.randrange(pattern_count)
+        if rng.random() < hit_rate:
+            body = (
+                f"%LINK-3-UPDOWN: Interface Gi0/{i}, changed state to down",
+                f"%BGP-5-ADJCHANGE: neighbor 10.{i}.0.1 Down BGP Notification sent",
+                f"%SYS-2-ERR-{i}: process restarted",
+                f"%ENV-1-FAN: Fan {i} failed",
+                f"%SLA-4-LOSS: 12% packet loss on probe{i}",
+            )[i % 5]
+        else:
+            body = rng.choice((
+                f"%LINK-3-UPDOWN: Interface Gi0/{i}, changed state to up",
+                f"%SEC-6-IPACCESSLOGP: list 101 permitted tcp 10.0.{i % 256}.1(5123) -> 10.1.0.{i % 256}(443), 1 packet",
+                f"%SYS-5-CONFIG_I: Configured from console by admin on vty{i % 5}",
+                f"%SLA-6-OK: probe{i} reachable, rtt {rng.randrange(1, 90)} ms",
+            ))
+        lines.append(f"{prefix} {body}")
+    return lines
+
+def make_benchmark_config(config_dir: Path, pattern_count: int, files: int = 20) -> None:
+    """
+    Writes a theme and make_benchmark_patterns(pattern_count) spread over a number of pattern files.
+    """
+    colors = ('red', 'green', 'yellow')
+    theme = {'default': {'red': "\033[1;37;41m", 'green': "\033[37;42m", 'yellow': "\033[30;43m", 'reset': "\033[0m"}}
+    config_dir.mkdir(parents=True, exist_ok=True)
+    (config_dir / 'theme.json').write_text(json.dumps(theme))
+    sources = [regex.pattern for regex, _color in make_benchmark_patterns(pattern_count)]
+    per_file = -(-pattern_count // files)
+    for number, start in enumerate(range(0, pattern_count, per_file)):
+        content = {'patterns': sources[start:start + per_file]}
+        (config_dir / f"highlight-{number:03d}-{colors[number % len(colors)]}.json").write_text(json.dumps(content))
+
+class TestHighlightPatterns(unittest.TestCase):
+    """
+    Unit tests for the highlight_patterns script.
+    """
+    def test_highlight_line(self):
+        themes = {
+            "red": "\033[1;37;41m",
+            "green": "\033[37;42m",
+            "reset": "\033[0m"
+        }
+        patterns = [
+            (re.compile(r"\b0% packet loss\b"), themes["green"]),
+            (re.compile(r"\b\d+% packet loss\b"), themes["red"])
+        ]
+        line = "100% packet loss"
+        expected = f"{themes['red']}100% packet loss{themes['reset']}"
+        self.assertEqual(highlight_line(line, patterns, themes["reset"]), expected)
+
+    def test_no_highlight(self):
+        themes = {
+            "red": "\033[1;37;41m",
+            "green": "\033[37;42m",
+            "reset": "\033[0m"
+        }
+        patterns = [
+            (re.compile(r"\b0% packet loss\b"), themes["green"]),
+            (re.compile(r"\b\d+% packet loss\b"), themes["red"])
+        ]
+        line = "No loss"
+        self.assertEqual(highlight_line(line, patterns, themes["reset"]), line)
+
+    def test_another_pattern(self):
+        themes = {
+            "red": "\033[1;37;41m",
+            "green": "\033[37;42m",
+            "reset": "\033[0m"
+        }
+        patterns = [
+            (re.compile(r"\b0% packet loss\b"), themes["green"]),
+            (re.compile(r"\b\d+% packet loss\b"), themes["red"])
+        ]
+        line = "0% packet loss"
+        expected = f"{themes['green']}0% packet loss{themes['reset']}"
+        self.assertEqual(highlight_line(line, patterns, themes["reset"]), expected)
+
+    def test_pattern_set_priority(self):
+        patterns = PatternSet([
+            (re.compile(r"\bloss\b"), "<green>"),
+            (re.compile(r"\d+%"), "<red>"),
+        ])
+        # The red pattern matches first in the line, but the green one comes first in the list
+        self.assertEqual(highlight_line("100% packet loss", patterns, "</>"), "100% packet <green>loss</>")
+        self.assertEqual(highlight_line("100% and 5% up", patterns, "</>"), "<red>100%</> and <red>5%</> up")
+        self.assertEqual(highlight_line("all good", patterns, "</>"), "all good")
+
+    def test_pattern_set_matches_loop(self):
+        patterns = [
+            (re.compile(r"(?i)\bdown\b"), "<1>"),
+            (re.compile(r"(\w+)=\1"), "<2>"),           # backreference, matched on its own
+            (re.compile(r"(?<=rtr)\d+"), "<3>"),
+            (re.compile(r"""\d+ \s ms  # latency""", re.VERBOSE), "<4>"),
+            (re.compile(r"^$"), "<5>"),
+            (re.compile(r"(?P<port>\d+)/tcp"), "<6>"),
+            (re.compile(r"up|[|(]flap"), "<7>"),
+        ]
+        lines = ["rtr12 link DOWN", "a=a rtr7", "rtr3 12 ms", "", "ok 22/tcp rtr1", "x=y 9 ms", "nothing", "|flap up"]
+        pattern_set = PatternSet(patterns)
+        for line in lines:
+            self.assertEqual(highlight_line(line, pattern_set, "</>"), highlight_line(line, patterns, "</>"), line)
+
+    def test_pattern_set_benchmark_lines(self):
+        patterns = make_benchmark_patterns(50)
+        for pattern_set in (PatternSet(patterns), PatternSet(patterns, prefilter=False)):
+            for line in make_benchmark_lines(500, 50, hit_rate=0.5):
+                self.assertEqual(highlight_line(line, pattern_set, "</>"), highlight_line(line, patterns, "</>"))
+
+    def test_process_binary(self):
+        import io
+
+        patterns = [
+            (re.compile(r"\b0% packet loss\b"), "<green>"),
+            (re.compile(r"\b\d+% packet loss\b"), "<red>"),
+        ]
+        text = "ping 1\n5% packet loss  \n\nall good\n0% packet loss\n" + "x" * 40 + "\nlast 7% packet loss"
+        expected = ("ping 1\n<red>5% packet loss</>  \n\nall good\n<green>0% packet loss</>\n" + "x" * 40
+                    + "\nlast <red>7% packet loss</>")
+        # A small block size makes lines straddle blocks, and the long line grow the buffer
+        for block_size in (8, 1 << 16):
+            for pattern_set in (encode_patterns(patterns), encode_patterns(patterns + [(re.compile(r"\d{3}"), "<3>")])):
+                output = io.BytesIO()
+                process_binary(io.BytesIO(text.encode()), output, pattern_set, b"</>", block_size=block_size)
+                self.assertEqual(output.getvalue().decode(), expected)
+
+    def test_process_parallel(self):
+        import io
+        import tempfile
+
+        patterns = make_benchmark_patterns(20)
+        lines = make_benchmark_lines(300, 20, hit_rate=0.3)
+        text = '\n'.join(lines) + '\nno newline at the end'
+        serial = io.StringIO()
+        process_input(io.StringIO(text), serial, patterns, "</>")
+        serial_binary = io.BytesIO()
+        process_binary(io.BytesIO(text.encode()), serial_binary, encode_patterns(patterns), b"</>")
+        with tempfile.TemporaryDirectory() as root:
+            path = Path(root) / 'input.log'
+            path.write_bytes(text.encode())
+            ranges = split_file(path, 1000)
+            self.assertEqual(ranges[0][0], 0)
+            self.assertEqual(ranges[-1][1], len(text))
+            self.assertTrue(all(text.encode()[end - 1:end] == b'\n' for _start, end in ranges[:-1]))
+
+            output = io.BytesIO()
+            process_parallel(path, output, patterns, "</>", jobs=2, chunk_size=1000)
+            self.assertEqual(output.getvalue().decode(), serial.getvalue())
+            output = io.BytesIO()
+            process_parallel(path, output, encode_patterns(patterns), b"</>", jobs=2, binary=True, chunk_size=1000)
+            self.assertEqual(output.getvalue(), serial_binary.getvalue())
+
+    def test_pattern_cache(self):
+        import tempfile
+
+        with tempfile.TemporaryDirectory() as root:
+            config_dir = Path(root) / 'config'
+            make_benchmark_config(config_dir, 30, files=3)
+            theme_file = config_dir / 'theme.json'
+            cache_file = pattern_cache_file(config_dir, theme_file, 'default', Path(root) / 'cache')
+            fingerprint = config_fingerprint(config_dir, theme_file, 'default')
+            self.assertIsNone(load_pattern_cache(cache_file, fingerprint))
+
+            patterns = load_patterns(config_dir, load_themes(theme_file)['default'])
+            literals = save_pattern_cache(cache_file, fingerprint, patterns, "\033[0m").literals
+            cached, reset_color = load_pattern_cache(cache_file, fingerprint)
+            self.assertEqual(reset_color, "\033[0m")
+            self.assertEqual(cached.literals, literals)
+            self.assertEqual(cached.compile().trie_sources, PatternSet(patterns).compile().trie_sources)
+            self.assertEqual([(regex.pattern, regex.flags, color) for regex, color in cached],
+                             [(regex.pattern, regex.flags, color) for regex, color in patterns])
+            for line in make_benchmark_lines(200, 30, hit_rate=0.5):
+                self.assertEqual(highlight_line(line, cached, "</>"), highlight_line(line, patterns, "</>"))
+            # Lines that no literal is in never compile the patterns behind the prefilter
+            cached, _reset_color = load_pattern_cache(cache_file, fingerprint)
+            highlight_line("nothing to see here", cached, "</>")
+            self.assertTrue(all(regex._compiled is None for (regex, _color), literal in zip(cached, literals) if literal))
+
+            # Any change to a pattern file makes the cache stale
+            pattern_file = sorted(config_dir.glob("highlight-*.json"))[0]
+            pattern_file.write_text(json.dumps({'patterns': [r"\bchanged\b"]}))
+            self.assertIsNone(load_pattern_cache(cache_file, config_fingerprint(config_dir, theme_file, 'default')))
+
+    def test_lazy_pattern(self):
+        regex = LazyPattern(r"(?i)link (\w+)", re.IGNORECASE)
+        self.assertIsNone(regex._compiled)
+        self.assertEqual(regex.search("LINK down").group(1), "down")
+        self.assertEqual(regex.groups, 1)
+        self.assertEqual(highlight_line("a link up", [(regex, "<1>")], "</>"), "a <1>link up</>")
+
+    def test_follow(self):
+        import io
+        import tempfile
+        import threading
+
+        class Output(io.StringIO):
+            def wait_for(self, text, timeout=5):
+                deadline = time.monotonic() + timeout
+                while text not in self.getvalue() and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                return self.getvalue()
+
+        patterns = [(re.compile(r"\b\d+% packet loss\b"), "<red>")]
+        with tempfile.TemporaryDirectory() as root:
+            path = Path(root) / 'syslog'
+            path.write_text("old 9% packet loss\n")
+            output = Output()
+            stop = threading.Event()
+            thread = threading.Thread(target=follow, args=(path, output, patterns, "</>"),
+                                      kwargs={'poll_interval': 0.05, 'stop': stop})
+            thread.start()
+            try:
+                time.sleep(0.1)
+                with path.open('a') as file:
+                    file.write("new 5% packet loss\nhalf a ")
+                    file.flush()
+                    self.assertIn("new <red>5% packet loss</>\n", output.wait_for("new"))
+                    file.write("line\n")
+                self.assertIn("half a line\n", output.wait_for("half a line"))
+
+                # Rotation: the rest of the old file, then the new one from its start
+                with path.open('a') as file:
+                    file.write("last 1% packet loss\n")
+                path.rename(path.with_suffix('.1'))
+                path.write_text("rotated\n")
+                self.assertIn("rotated\n", output.wait_for("rotated"))
+                # Truncation: followed from the start again
+                path.write_text("t\n")
+                self.assertIn("t\n", output.wait_for("rotated\nt\n"))
+            finally:
+                stop.set()
+                thread.join()
+        self.assertNotIn("old", output.getvalue())
+        self.assertIn("last <red>1% packet loss</>\n", output.getvalue())
+        self.assertTrue(output.getvalue().endswith("rotated\nt\n"))
+
+    def test_pattern_reloader(self):
+        import io
+        import tempfile
+
+        with tempfile.TemporaryDirectory() as root:
+            config_dir = Path(root)
+            create_example_configs(config_dir)
+            theme_file = config_dir / 'theme.json'
+            theme = load_themes(theme_file)['default']
+            reloader = PatternReloader(config_dir, theme_file, 'default', PatternSet(load_patterns(config_dir, theme)), theme['reset'])
+            self.assertFalse(reloader.check())
+            red = config_dir / 'highlight-002-red.json'
+
+            def lines():
+                yield "link down\n"
+                red.write_text(json.dumps({'patterns': [r"\bdown\b", r"\b\d+% packet loss\b"]}))
+                self.assertTrue(reloader.check())
+                yield "link down\n"
+                # A broken pattern file keeps the previous patterns
+                red.write_text(json.dumps({'patterns': [r"(unclosed"]}))
+                with self.assertLogs(level='ERROR'):
+                    self.assertFalse(reloader.check())
+                yield "link down\n"
+                red.write_text("{not json")
+                with self.assertLogs(level='ERROR'):
+                    self.assertFalse(reloader.check())
+                yield "link down\n"
+
+            output = io.StringIO()
+            self.assertEqual(_highlight_lines(lines(), output, [], "", reloader), (4, 3))
+            red_color, reset_color = theme['red'], theme['reset']
+            self.assertEqual(output.getvalue(), "link down\n" + f"link {red_color}down{reset_color}\n" * 3)
+
+            # Binary streams get the reloaded patterns encoded
+            reloader = PatternReloader(config_dir, theme_file, 'default', PatternSet(), b"", fingerprint=[], binary=True)
+            red.write_text(json.dumps({'patterns': [r"\bdown\b"]}))
+            self.assertTrue(reloader.check())
+            patterns, reset_color = reloader.current
+            self.assertEqual(patterns.highlight(b"link down", reset_color), f"link {red_color}down{theme['reset']}".encode())
+
+    def test_formatter_follows_reload(self):
+        import io
+        import tempfile
+
+        with tempfile.TemporaryDirectory() as root:
+            config_dir = Path(root)
+            create_example_configs(config_dir)
+            theme_file = config_dir / 'theme.json'
+            (config_dir / 'highlight-002-red.json').write_text(json.dumps({'patterns': [r"\bdown\b"]}))
+            theme = load_themes(theme_file)['default']
+            formatter = JsonLinesFormatter(color_names(theme))
+            reloader = PatternReloader(config_dir, theme_file, 'default', PatternSet(load_patterns(config_dir, theme)), theme['reset'],
+                                       on_reload=lambda theme: formatter.update_names(color_names(theme)))
+
+            def lines():
+                yield "link down"
+                # The red patterns get a new color code, still named red
+                themes = json.loads(theme_file.read_text())
+                themes['default']['red'] = "\033[1;31m"
+                theme_file.write_text(json.dumps(themes))
+                self.assertTrue(reloader.check())
+                yield "link down"
+
+            output = io.StringIO()
+            _highlight_lines(lines(), output, [], "", reloader, formatter=formatter)
+        self.assertEqual([json.loads(line)['spans'] for line in output.getvalue().splitlines()],
+                         [[[5, 9, 1, 'red']], [[5, 9, 1, 'red']]])
+
+    def test_backtracking_risk(self):
+        import tempfile
+
+        risky = [r"(a+)+b", r"(a*)*", r"([a-z]+ ?)+$", r"(\w+\w)+x", r"(.*?,)+x", r"(\w|\d\d)+x", r"(a+|b)+",
+                 r"(?i)(A+a)+x", r"(?x) ( \d+ ) {2,}"]
+        safe = [r"\b\d+% packet loss\b", r"(\d+\.)+\d+", r"(a+b)+", r"(a+b+)+", r"(foo\d+|bar)+", r"(error|warn)+",
+                r"(?:\d{1,3}\.){3}\d{1,3}", r"(a|b)+", r"(a++)+", r"(?>a+)+b", r"(a+){2}"]
+        for pattern in risky:
+            self.assertTrue(backtracking_risk(re.compile(pattern)), pattern)
+            self.assertTrue(backtracking_risk(re.compile(pattern.encode())), pattern)
+        for pattern in safe:
+            self.assertIsNone(backtracking_risk(re.compile(pattern)), pattern)
+
+        with tempfile.TemporaryDirectory() as root:
+            (Path(root) / 'highlight-001-red.json').write_text(json.dumps({'patterns': [r"(\w+\s?)+$", r"\bdown\b"]}))
+            with self.assertLogs(level='WARNING') as logs:
+                patterns = load_patterns(Path(root), {'red': "<red>"})
+            self.assertEqual(len(patterns), 2)
+            self.assertEqual(len(logs.output), 1)
+            self.assertIn("nested quantifiers", logs.output[0])
+
+    def test_match_guard(self):
+        import io
+
+        guard = MatchGuard(0.05)
+        if not guard.start():
+            self.skipTest("no setitimer() here")
+        try:
+            patterns = [(re.compile(r"(a+)+b"), "<slow>"), (re.compile(r"\d+"), "<num>")]
+            text = "line 1\n" + "a" * 40 + " 2\nline 3\n"
+            started = time.monotonic()
+            output = io.StringIO()
+            with self.assertLogs(level='WARNING') as logs:
+                counts = _highlight_lines(io.StringIO(text), output, patterns, "</>", guard=guard)
+            self.assertEqual(counts, (3, 2))
+            self.assertEqual(output.getvalue(), "line <num>1</>\n" + "a" * 40 + " 2\nline <num>3</>\n")
+            self.assertIn("Not highlighting line 2", logs.output[0])
+
+            output = io.BytesIO()
+            with self.assertLogs(level='WARNING'):
+                process_binary(io.BytesIO(text.encode()), output, encode_patterns(patterns), b"</>", guard=guard)
+            self.assertEqual(output.getvalue(), b"line <num>1</>\n" + b"a" * 40 + b" 2\nline <num>3</>\n")
+            self.assertLess(time.monotonic() - started, 2)
+        finally:
+            guard.stop()
+
+    def test_spans(self):
+        patterns = make_benchmark_patterns(100) + [(re.compile(pattern), "<extra>") for pattern in
+                                                   (r"\d+", r"(\w)\1", r"(?i)DOWN", r"(?:\d+ms)?", r"loss\b", r"[a-z]+", r"x*")]
+        pattern_set = PatternSet(patterns)
+
+        def scan(line):
+            # One pattern at a time from each match's end, the way PatternSet.spans() is specified
+            spans = []
+            pos = 0
+            while True:
+                found = []
+                for index, (regex, _color) in enumerate(patterns):
+                    for match in regex.finditer(line, pos):
+                        if match.end() > match.start():
+                            found.append((match.start(), index, match.end()))
+                            break
+                if not found:
+                    return spans
+                start, index, pos = min(found)
+                spans.append((start, pos, index))
+
+        for line in make_benchmark_lines(100, 100, hit_rate=0.3):
+            self.assertEqual(pattern_set.spans(line), scan(line), line)
+        self.assertEqual(pattern_set.spans(""), [])
+        # A pattern that can match empty does not hide the patterns after it
+        pattern_set = PatternSet([(re.compile(r"(?:\d+ms)?"), "a"), (re.compile(r"[a-z]+"), "b")])
+        self.assertEqual(pattern_set.spans("error 5ms"), [(0, 5, 1), (6, 9, 0)])
+
+    def test_formatters(self):
+        import io
+
+        theme = {'red': "\033[1;37;41m", 'green': "\033[38;2;0;128;0m", 'reset': "\033[0m"}
+        patterns = [(re.compile(r"\b0% packet loss\b"), theme['green']), (re.compile(r"\b\d+% packet loss\b"), theme['red']),
+                    (re.compile(r"<\w+>"), theme['red'])]
+        text = "5% packet loss, 0% packet loss\nnothing\n<b> & 0% packet loss\n"
+
+        output = io.StringIO()
+        formatter = JsonLinesFormatter(color_names(theme))
+        self.assertEqual(_highlight_lines(io.StringIO(text), output, patterns, "", formatter=formatter), (3, 2))
+        self.assertEqual([json.loads(line) for line in output.getvalue().splitlines()], [
+            {'line': 1, 'text': "5% packet loss, 0% packet loss", 'spans': [[0, 14, 1, 'red'], [16, 30, 0, 'green']]},
+            {'line': 2, 'text': "nothing", 'spans': []},
+            {'line': 3, 'text': "<b> & 0% packet loss", 'spans': [[0, 3, 2, 'red'], [6, 20, 0, 'green']]},
+        ])
+
+        self.assertEqual(ansi_css(theme['red']), "font-weight: bold; color: #e5e5e5; background: #cd0000")
+        self.assertEqual(ansi_css(theme['green']), "color: #008000")
+        formatter = HtmlFormatter(color_names(theme))
+        output = io.StringIO()
+        _highlight_lines(io.StringIO(text), output, patterns, "", formatter=formatter)
+        self.assertIn(".hl-red { font-weight: bold; color: #e5e5e5; background: #cd0000 }", formatter.header())
+        self.assertEqual(output.getvalue().splitlines()[2],
+                         '<span class="hl-red" data-pattern="2">&lt;b&gt;</span> &amp; '
+                         '<span class="hl-green" data-pattern="0">0% packet loss</span>')
+
+    def test_pattern_stats(self):
+        import io
+        import tempfile
+
+        patterns = [(re.compile(r"(a+)+b"), "<slow>"), (re.compile(r"\berror\b"), "<error>"), (re.compile(r"\d+"), "<num>")]
+        lines = ["error 1 and error 2", "nothing", "aaaaaaaaaaaaaaaaaa", "count 42", "aab 3"]
+        text = "".join(line + "\n" for line in lines)
+        expected = io.StringIO()
+        _highlight_lines(io.StringIO(text), expected, patterns, "</>")
+        output = io.StringIO()
+        stats = PatternStats(slowest=2)
+        self.assertEqual(_highlight_lines(io.StringIO(text), output, patterns, "</>", stats=stats), (5, 3))
+        self.assertEqual(output.getvalue(), expected.getvalue())
+
+        result = json.loads(json.dumps(stats.to_dict()))
+        self.assertEqual((result['lines'], result['matched_lines']), (5, 3))
+        by_pattern = {entry['pattern']: entry for entry in result['patterns']}
+        # Only lines holding "error" are candidates for the prefiltered pattern
+        self.assertEqual({key: by_pattern[r"\berror\b"][key] for key in ('index', 'candidates', 'hits', 'lines', 'matches', 'hit_ratio')},
+                         {'index': 1, 'candidates': 1, 'hits': 1, 'lines': 1, 'matches': 2, 'hit_ratio': 1.0})
+        self.assertEqual({key: by_pattern[r"\d+"][key] for key in ('candidates', 'hits', 'lines', 'matches')},
+                         {'candidates': 5, 'hits': 3, 'lines': 1, 'matches': 1})
+        self.assertEqual({key: by_pattern[r"(a+)+b"][key] for key in ('candidates', 'hits', 'lines')},
+                         {'candidates': 5, 'hits': 1, 'lines': 1})
+        # The backtracking pattern on the line of a's is the slowest by far
+        self.assertEqual(result['patterns'][0]['pattern'], r"(a+)+b")
+        self.assertEqual(result['slowest_lines'][0], {'line_number': 3, 'seconds': result['slowest_lines'][0]['seconds'],
+                                                      'line': "aaaaaaaaaaaaaaaaaa"})
+        self.assertEqual(len(result['slowest_lines']), 2)
+
+        # Binary blocks number lines past the prefilter by their place in the input
+        stats = PatternStats()
+        output = io.BytesIO()
+        process_binary(io.BytesIO(text.encode()), output, encode_patterns(patterns[1:2]), b"</>", block_size=16, stats=stats)
+        self.assertEqual(output.getvalue(), text.replace("error", "<error>error</>").encode())
+        self.assertEqual([line['line_number'] for line in stats.to_dict()['slowest_lines']], [1])
+
+        with tempfile.TemporaryDirectory() as root:
+            path = Path(root) / 'stats.json'
+            stats.dump(path)
+            self.assertEqual(json.loads(path.read_text())['patterns'][0]['pattern'], r"\berror\b")
+
+    def test_required_literal(self):
+        self.assertEqual(required_literal(re.compile(r"\b\d+% packet loss\b")), "% packet loss")
+        self.assertEqual(required_literal(re.compile(r"(?:ERR|CRIT)-(\d+) on (?:fan)+ tray")), " tray")
+        self.assertEqual(required_literal(re.compile(rb"link (down|up)")), b"link ")
+        self.assertIsNone(required_literal(re.compile(r"\d+ms|timeout")))
+        self.assertIsNone(required_literal(re.compile(r"(?:slow)?\d+")))
+
+    def test_prefilter(self):
+        patterns = PatternSet([
+            (re.compile(r"(?i)\bLINK DOWN\b"), "<1>"),
+            (re.compile(r"\b\d+% packet loss\b"), "<2>"),
+            (re.compile(r"\d{4,}"), "<3>"),                # no literal, always searched
+            (re.compile(r"packet"), "<4>"),
+        ])
+        self.assertEqual(patterns.find("link down on Gi0/1"), (0, 0))
+        self.assertEqual(patterns.find("port 8080: 12% packet loss"), (1, 11))
+        self.assertEqual(patterns.find("port 8080: packet"), (2, 5))
+        self.assertEqual(patterns.find("one packet"), (3, 4))
+        self.assertIsNone(patterns.find("all quiet"))
+        self.assertEqual(patterns.find("Link Down on \u212aelvin"), (0, 0))
+        self.assertEqual(patterns.find("\u212a: LINK\u017fdown, LINK DOWN"), (0, 14))
+        trie = re.compile(literal_trie_pattern(["abc", "ab", "abd", "x-]^\\y", "b"]))
+        for text, hit in (("zab", True), ("zzb", True), ("x-]^\\y", True), ("x-", False), ("a", False)):
+            self.assertEqual(bool(trie.search(text)), hit, text)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,454 @@
+"""
+Unit tests for check_network_services.py, run them with ./check_network_services.py --self-test
+"""
+
+import argparse
+import errno
+import os
+import socket
+import struct
+import tempfile
+import threading
+import time
+import unittest
+
+import network_services
+from network_services import (
+    BOOTP_OPTIONS_OFFSET, DHCP_MAGIC_COOKIE, DHCP_OPTION_END, DHCP_OPTION_LEASE_TIME, DHCP_OPTION_PAD,
+    DHCP_OPTION_SERVER_IDENTIFIER, DNS_CLASS_IN, DNS_FLAG_QR, DNS_FLAG_RD, DNS_FLAG_TC, DNS_TYPE_A, FLEET_PORT,
+    IFF_LOOPBACK, IFF_UP, RTF_GATEWAY, collect_results, diff_results, FleetCollector, is_link_active,
+    make_agent_server, make_metrics_server, MetricsExporter, _netmask_to_prefix, parse_dhcpcd_lease,
+    parse_fleet_address, parse_lease_file, parse_networkd_lease, query_nameserver, read_ifconfig_snapshot,
+    read_procfs_snapshot, read_sysfs_link_states, render_metrics, ResultsCache, run_probes, select_lease,
+    _skip_dns_name, watch,
+)
+
+def make_fake_sysfs(root: str, count: int) -> None:
+    """
+    Create a fake /sys/class/net tree with a number of veth style interfaces, every other one up.
+
+    Args:
+        root (str): The directory to populate.
+        count (int): The number of interfaces.
+    """
+    for index in range(count):
+        device = os.path.join(root, f"veth{index:04d}")
+        os.makedirs(device)
+        up = index % 2 == 0
+        attributes = {
+            "ifindex": str(index + 2),
+            "operstate": "up" if up else "down",
+            "carrier": "1" if up else "0",
+            "flags": "0x1003" if up else "0x1002",
+        }
+        for name, value in attributes.items():
+            with open(os.path.join(device, name), "w") as file:
+                file.write(value + "\n")
+
+def make_dhclient_leases(path: str, count: int, interface: str = "eth0") -> None:
+    """
+    Write a synthetic dhclient lease history of a number of leases, all expired but the last.
+
+    Args:
+        path (str): The lease file to write.
+        count (int): The number of leases.
+        interface (str): The interface the leases are for.
+    """
+    now = time.time()
+    with open(path, "w") as file:
+        for index in range(count):
+            expire = time.strftime("%w %Y/%m/%d %H:%M:%S", time.gmtime(now - (count - index) * 3600 + (7200 if index == count - 1 else 0)))
+            file.write(
+                f"lease {{\n  interface \"{interface}\";\n  fixed-address 192.0.2.{index % 250 + 2};\n"
+                f"  option subnet-mask 255.255.255.0;\n  option routers 192.0.2.1;\n"
+                f"  option dhcp-lease-time 7200;\n  option dhcp-message-type 5;\n"
+                f"  option domain-name-servers 192.0.2.53;\n  option dhcp-server-identifier 10.0.{index // 250 % 250}.{index % 250};\n"
+                f"  renew {expire};\n  rebind {expire};\n  expire {expire};\n}}\n"
+            )
+
+class StubDNSServer:
+    """
+    A minimal DNS server on 127.0.0.1 for the unit tests, answering every A query with a fixed address.
+    """
+    def __init__(self, address: str = "192.0.2.53", truncate: bool = False, silent: bool = False):
+        self.address = address
+        self.truncate = truncate
+        self.silent = silent
+        self.query_ids = []
+        # A free TCP port can still be taken for UDP, so try again with another one
+        for _attempt in range(10):
+            self.tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.tcp.bind(("127.0.0.1", 0))
+            self.port = self.tcp.getsockname()[1]
+            self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                self.udp.bind(("127.0.0.1", self.port))
+                break
+            except OSError as e:
+                self.close()
+                if e.errno != errno.EADDRINUSE:
+                    raise
+        else:
+            raise OSError(errno.EADDRINUSE, "No port free for both UDP and TCP")
+        self.tcp.listen()
+        for target in (self.serve_udp, self.serve_tcp):
+            threading.Thread(target=target, daemon=True).start()
+
+    def answer(self, query: bytes, truncate: bool) -> bytes:
+        query_id, = struct.unpack_from("!H", query)
+        question_end = _skip_dns_name(query, 12) + 4
+        qtype, = struct.unpack_from("!H", query, question_end - 4)
+        flags = DNS_FLAG_QR | DNS_FLAG_RD | (DNS_FLAG_TC if truncate else 0)
+        if qtype != DNS_TYPE_A or truncate:
+            return struct.pack("!HHHHHH", query_id, flags, 1, 0, 0, 0) + query[12:question_end]
+        answer = b"\xc0\x0c" + struct.pack("!HHIH", DNS_TYPE_A, DNS_CLASS_IN, 60, 4) + socket.inet_aton(self.address)
+        return struct.pack("!HHHHHH", query_id, flags, 1, 1, 0, 0) + query[12:question_end] + answer
+
+    def serve_udp(self) -> None:
+        while True:
+            try:
+                query, client = self.udp.recvfrom(4096)
+            except OSError:
+                return  # closed
+            self.query_ids.append(struct.unpack_from("!H", query)[0])
+            if not self.silent:
+                self.udp.sendto(self.answer(query, self.truncate), client)
+
+    def serve_tcp(self) -> None:
+        while True:
+            try:
+                conn, _client = self.tcp.accept()
+            except OSError:
+                return  # closed
+            with conn:
+                data = conn.recv(4096)
+                response = self.answer(data[2:], False)
+                conn.sendall(struct.pack("!H", len(response)) + response)
+
+    def close(self) -> None:
+        self.udp.close()
+        self.tcp.close()
+
+class TestCheckNetworkServices(unittest.TestCase):
+    """
+    Unit tests for the check_network_services script.
+    """
+    def test_sysfs_link_states(self):
+        with tempfile.TemporaryDirectory() as root:
+            make_fake_sysfs(root, 4)
+            links = read_sysfs_link_states(root)
+        self.assertEqual(sorted(name for name, link in links.items() if is_link_active(link)), ["veth0000", "veth0002"])
+
+    def test_loopback_is_not_active(self):
+        self.assertFalse(is_link_active({"operstate": "unknown", "carrier": 1, "flags": IFF_UP | IFF_LOOPBACK}))
+
+    def test_netmask_to_prefix(self):
+        self.assertEqual(_netmask_to_prefix("0xffffff00"), 24)
+        self.assertEqual(_netmask_to_prefix("255.255.240.0"), 20)
+
+    def test_procfs_snapshot(self):
+        def route(interface, destination, gateway, flags, mask):
+            # /proc/net/route is in host byte order
+            fields = [f"{struct.unpack('=I', socket.inet_aton(ip))[0]:08X}" for ip in (destination, gateway)]
+            return f"{interface}\t{fields[0]}\t{fields[1]}\t{flags:04X}\t0\t0\t100\t{struct.unpack('=I', socket.inet_aton(mask))[0]:08X}\t0\t0\t0\n"
+
+        with tempfile.TemporaryDirectory() as root:
+            with open(os.path.join(root, "route"), "w") as file:
+                file.write("Iface\tDestination\tGateway \tFlags\tRefCnt\tUse\tMetric\tMask\t\tMTU\tWindow\tIRTT\n")
+                file.write(route("eth0", "0.0.0.0", "192.0.2.1", 0x1 | RTF_GATEWAY, "0.0.0.0"))
+                file.write(route("eth1", "0.0.0.0", "10.0.0.1", 0x1 | RTF_GATEWAY, "0.0.0.0"))
+                file.write(route("eth0", "192.0.2.0", "0.0.0.0", 0x1, "255.255.255.0"))
+                file.write(route("eth1", "10.0.0.0", "0.0.0.0", 0x1, "255.0.0.0"))
+                file.write(route("eth2", "10.1.0.0", "0.0.0.0", 0x1, "255.255.0.0"))
+                file.write(route("eth1", "198.51.100.0", "10.0.0.1", 0x1 | RTF_GATEWAY, "255.255.255.0"))
+            with open(os.path.join(root, "fib_trie"), "w") as file:
+                for table in ("Main", "Local"):
+                    file.write(f"{table}:\n  +-- 0.0.0.0/0 3 0 5\n")
+                    for address in ("192.0.2.2", "10.0.0.5", "10.1.2.3", "127.0.0.1"):
+                        file.write(f"     |-- {address}\n        /32 host LOCAL\n")
+                    file.write("     |-- 192.0.2.255\n        /32 link BROADCAST\n")
+            with open(os.path.join(root, "if_inet6"), "w") as file:
+                file.write("20010db8000000000000000000000002 02 40 00 00     eth0\n")
+                file.write("fe800000000000000000000000000002 02 40 20 80     eth0\n")
+            snapshot = read_procfs_snapshot(root)
+            os.remove(os.path.join(root, "if_inet6"))
+            self.assertEqual(read_procfs_snapshot(root)["eth0"]["ipv6"], [])
+        self.assertEqual(sorted(snapshot), ["eth0", "eth1", "eth2"])
+        self.assertEqual(snapshot["eth0"], {"ip": "192.0.2.2", "cidr": "24", "gateway": "192.0.2.1",
+                                            "addresses": ["192.0.2.2/24"], "ipv6": ["2001:db8::2/64", "fe80::2/64"]})
+        self.assertEqual(snapshot["eth1"], {"ip": "10.0.0.5", "cidr": "8", "gateway": "10.0.0.1", "addresses": ["10.0.0.5/8"], "ipv6": []})
+        # The longest matching connected route wins
+        self.assertEqual(snapshot["eth2"], {"ip": "10.1.2.3", "cidr": "16", "gateway": None, "addresses": ["10.1.2.3/16"], "ipv6": []})
+
+    def test_ifconfig_snapshot(self):
+        import subprocess
+        from unittest import mock
+
+        outputs = {
+            "ifconfig": (
+                "lo0: flags=8049<UP,LOOPBACK,RUNNING,MULTICAST> mtu 16384\n"
+                "\tinet 127.0.0.1 netmask 0xff000000\n"
+                "\tinet6 ::1 prefixlen 128\n"
+                "\tinet6 fe80::1%lo0 prefixlen 64 scopeid 0x1\n"
+                "en0: flags=8863<UP,BROADCAST,SMART,RUNNING,SIMPLEX,MULTICAST> mtu 1500\n"
+                "\tether a4:83:e7:00:00:01\n"
+                "\tinet6 fe80::1c2b:aaaa:bbbb:cccc%en0 prefixlen 64 secured scopeid 0x4\n"
+                "\tinet 192.168.1.20 netmask 0xffffff00 broadcast 192.168.1.255\n"
+                "\tinet 192.168.1.21 netmask 0xffffff00 broadcast 192.168.1.255\n"
+                "en1: flags=8822<BROADCAST,SMART,SIMPLEX,MULTICAST> mtu 1500\n"
+                "\tstatus: inactive\n"
+            ),
+            "netstat": (
+                "Routing tables\n\nInternet:\n"
+                "Destination        Gateway            Flags           Netif Expire\n"
+                "default            192.168.1.1        UGScg             en0\n"
+                "127                127.0.0.1          UCS               lo0\n"
+                "\nInternet6:\n"
+                "Destination                             Gateway                         Flags           Netif Expire\n"
+                "default                                 fe80::1%en0                     UGcg              en0\n"
+            ),
+        }
+        with mock.patch("subprocess.check_output", side_effect=lambda args, text: outputs[args[0]]):
+            snapshot = read_ifconfig_snapshot()
+        self.assertEqual(snapshot["lo0"], {"ip": "127.0.0.1", "cidr": "8", "gateway": None,
+                                           "addresses": ["127.0.0.1/8"], "ipv6": ["::1/128", "fe80::1/64"]})
+        self.assertEqual(snapshot["en0"], {"ip": "192.168.1.20", "cidr": "24", "gateway": "192.168.1.1",
+                                           "addresses": ["192.168.1.20/24", "192.168.1.21/24"], "ipv6": ["fe80::1c2b:aaaa:bbbb:cccc/64"]})
+        self.assertNotIn("en1", snapshot)
+
+        with mock.patch("subprocess.check_output", side_effect=subprocess.CalledProcessError(1, ["netstat", "-nr"])):
+            with self.assertRaises(OSError):
+                read_ifconfig_snapshot()
+
+    def test_dhclient_picks_latest_valid_lease(self):
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, "dhclient.eth0.leases")
+            make_dhclient_leases(path, 3)
+            with open(path, "a") as file:
+                file.write('lease {\n  interface "eth1";\n  option dhcp-server-identifier 198.51.100.1;\n  expire never;\n}\n')
+            leases = parse_lease_file(path)
+            self.assertIs(parse_lease_file(path), leases)
+        self.assertEqual(len(leases), 4)
+        self.assertEqual(select_lease(leases, "eth0")["server"], "10.0.0.2")
+        self.assertEqual(select_lease(leases, "eth1")["server"], "198.51.100.1")
+        self.assertIsNone(select_lease(leases[:2], "eth0"))
+
+    def test_dhcpcd_lease(self):
+        options = bytes([DHCP_OPTION_SERVER_IDENTIFIER, 4]) + socket.inet_aton("192.0.2.67") + bytes([DHCP_OPTION_LEASE_TIME, 4]) + struct.pack("!I", 600)
+        packet = bytes(BOOTP_OPTIONS_OFFSET - 4) + DHCP_MAGIC_COOKIE + bytes([DHCP_OPTION_PAD]) + options + bytes([DHCP_OPTION_END])
+        self.assertEqual(parse_dhcpcd_lease(packet, 1000.0), [{"interface": None, "server": "192.0.2.67", "expires": 1600.0}])
+
+    def test_networkd_lease(self):
+        leases = parse_networkd_lease("# This is private data. Do not parse.\nADDRESS=192.0.2.2\nSERVER_ADDRESS=192.0.2.1\nLIFETIME=3600\n", 1000.0)
+        self.assertEqual(leases, [{"interface": None, "server": "192.0.2.1", "expires": 4600.0}])
+
+    def test_fleet_collector(self):
+        calls = []
+        servers = []
+        for index in range(20):
+            server = make_agent_server("127.0.0.1:0", ResultsCache(None, ttl=60, collect=lambda index=index: calls.append(index) or {"interfaces": [], "dns": [], "index": index}))
+            threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+            servers.append(server)
+        agents = [f"127.0.0.1:{server.server_address[1]}" for server in servers]
+        with socket.socket() as unused:
+            unused.bind(("127.0.0.1", 0))
+            dead = f"127.0.0.1:{unused.getsockname()[1]}"
+        collector = FleetCollector(agents + [dead], timeout=1)
+        try:
+            first = collector.sweep()
+            connections = dict(collector.connections)
+            second = collector.sweep()
+        finally:
+            collector.close()
+            for server in servers:
+                server.shutdown()
+                server.server_close()
+        self.assertEqual(first["summary"]["ok"], 20)
+        self.assertEqual(first["summary"]["failed"], 1)
+        self.assertIn("error", first["hosts"][dead])
+        self.assertEqual(second["hosts"][agents[7]]["results"]["index"], 7)
+        self.assertEqual(collector.connections, {})
+        self.assertEqual(len(connections), 20)
+        self.assertEqual(sorted(calls), list(range(20)))
+
+    def test_fleet_fetch_retries_only_stale_connections(self):
+        listener = socket.create_server(("127.0.0.1", 0))
+        accepted = []
+
+        def serve():
+            while True:
+                try:
+                    conn, _client = listener.accept()
+                except OSError:
+                    return  # closed
+                accepted.append(conn)
+                stream = conn.makefile("rwb")
+                stream.readline()
+                stream.write(b'{"index": %d}\n' % len(accepted))
+                stream.flush()
+                if len(accepted) == 1:
+                    stream.close()
+                    conn.close()  # stale on the next fetch
+                # Later connections never answer a second request
+
+        threading.Thread(target=serve, daemon=True).start()
+        agent = f"127.0.0.1:{listener.getsockname()[1]}"
+        collector = FleetCollector([agent], timeout=0.3)
+        try:
+            self.assertEqual(collector.fetch(agent), {"index": 1})
+            self.assertEqual(collector.fetch(agent), {"index": 2})
+            start = time.perf_counter()
+            self.assertIn("error", collector.fetch(agent))
+            elapsed = time.perf_counter() - start
+        finally:
+            collector.close()
+            listener.close()
+            for conn in accepted:
+                conn.close()
+        self.assertEqual(len(accepted), 2)
+        self.assertLess(elapsed, 0.55)
+
+    def test_parse_fleet_address(self):
+        self.assertEqual(parse_fleet_address("unix:/tmp/agent.sock"), (socket.AF_UNIX, "/tmp/agent.sock"))
+        self.assertEqual(parse_fleet_address("192.0.2.1"), (socket.AF_INET, ("192.0.2.1", FLEET_PORT)))
+        self.assertEqual(parse_fleet_address("[2001:db8::1]:80"), (socket.AF_INET6, ("2001:db8::1", 80)))
+
+    def test_render_metrics(self):
+        results = {
+            "interfaces": [{"interface": "eth0", "ip": "192.0.2.2", "cidr": "24", "gateway": "192.0.2.1", "gateway_status": "OK", "dhcp_server": "192.0.2.67"}],
+            "dns": [{"nameserver": "192.0.2.53", "status": "Failure", "fqdn_queried": "example.com", "latency_ms": 12.0,
+                     "answers": {"A": {"rcode": 2, "latency_ms": 12.0, "transport": "udp", "addresses": []}}}],
+        }
+        links = {"eth1": {"operstate": "down", "carrier": 0, "flags": 0}, "lo": {"operstate": "unknown", "carrier": 1, "flags": IFF_UP | IFF_LOOPBACK}}
+        metrics = render_metrics(results, links).splitlines()
+        self.assertIn('check_network_services_interface_up{interface="eth0"} 1', metrics)
+        self.assertIn('check_network_services_interface_up{interface="eth1"} 0', metrics)
+        self.assertNotIn('check_network_services_interface_up{interface="lo"} 1', metrics)
+        self.assertIn('check_network_services_gateway_reachable{interface="eth0",gateway="192.0.2.1"} 1', metrics)
+        self.assertIn('check_network_services_dns_up{nameserver="192.0.2.53",fqdn="example.com"} 0', metrics)
+        self.assertIn('check_network_services_dns_latency_seconds{nameserver="192.0.2.53",fqdn="example.com",qtype="A"} 0.012', metrics)
+        self.assertIn('check_network_services_dhcp_server_info{interface="eth0",server="192.0.2.67"} 1', metrics)
+
+    def test_scrapes_are_served_from_cache(self):
+        calls = []
+        exporter = MetricsExporter(lambda: calls.append(1) or ({"interfaces": [], "dns": []}, None), interval=60)
+        exporter.start()
+        server = make_metrics_server("127.0.0.1:0", exporter)
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        try:
+            for _ in range(5):
+                with socket.create_connection(server.server_address, timeout=1) as sock:
+                    sock.sendall(b"GET /metrics HTTP/1.0\r\n\r\n")
+                    reply = sock.makefile("rb").read()
+                self.assertIn(b"check_network_services_collection_duration_seconds", reply)
+        finally:
+            exporter.stop()
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(len(calls), 1)
+
+    def test_query_nameserver(self):
+        server = StubDNSServer()
+        self.addCleanup(server.close)
+        result = query_nameserver("127.0.0.1", "example.com", port=server.port)
+        self.assertTrue(result["ok"])
+        self.assertEqual(result["answers"]["A"]["addresses"], ["192.0.2.53"])
+        self.assertEqual(result["answers"]["A"]["transport"], "udp")
+        self.assertEqual(result["answers"]["AAAA"]["addresses"], [])
+
+    def test_query_ids_differ(self):
+        from unittest import mock
+
+        server = StubDNSServer()
+        self.addCleanup(server.close)
+        with mock.patch("network_services.os.urandom", return_value=b"\xff\xff"):
+            result = query_nameserver("127.0.0.1", "example.com", port=server.port)
+        self.assertTrue(result["ok"])
+        self.assertEqual(sorted(server.query_ids), [0x0000, 0xFFFF])
+
+    def test_truncated_answer_falls_back_to_tcp(self):
+        server = StubDNSServer(truncate=True)
+        self.addCleanup(server.close)
+        result = query_nameserver("127.0.0.1", "example.com", qtypes=(DNS_TYPE_A,), port=server.port)
+        self.assertEqual(result["answers"]["A"]["transport"], "tcp")
+        self.assertEqual(result["answers"]["A"]["addresses"], ["192.0.2.53"])
+
+    def test_silent_nameserver_times_out(self):
+        server = StubDNSServer(silent=True)
+        self.addCleanup(server.close)
+        result = query_nameserver("127.0.0.1", "example.com", timeout=0.2, port=server.port)
+        self.assertFalse(result["ok"])
+        self.assertIsNone(result["latency_ms"])
+
+    def test_diff_results(self):
+        eth0 = {"interface": "eth0", "ip": "192.0.2.2", "cidr": "24", "gateway": "192.0.2.1", "gateway_status": "OK", "dhcp_server": None}
+        eth1 = dict(eth0, interface="eth1", ip="198.51.100.2")
+        dns = {"nameserver": "192.0.2.53", "status": "OK", "fqdn_queried": "example.com", "latency_ms": 3.0, "answers": {}}
+        previous = {"interfaces": [eth0, eth1], "dns": [dns]}
+        self.assertEqual(diff_results(previous, previous), {"interfaces": [], "dns": [], "removed": []})
+        # A new latency alone is not a change
+        self.assertEqual(diff_results(previous, {"interfaces": [eth0, eth1], "dns": [dict(dns, latency_ms=9.0)]})["dns"], [])
+
+        eth0_down = dict(eth0, gateway_status="Failure")
+        eth2 = dict(eth0, interface="eth2", ip="203.0.113.2")
+        dns2 = dict(dns, nameserver="192.0.2.54")
+        current = {"interfaces": [eth0_down, eth2], "dns": [dns2]}
+        self.assertEqual(diff_results(previous, current), {"interfaces": [eth0_down, eth2], "dns": [dns2], "removed": ["eth1", "192.0.2.53"]})
+
+    def test_watch_prints_only_changes(self):
+        import io
+        import json
+        from unittest import mock
+
+        eth0 = {"interface": "eth0", "ip": "192.0.2.2", "cidr": "24", "gateway": "192.0.2.1", "gateway_status": "OK", "dhcp_server": None}
+        ticks = [
+            {"interfaces": [eth0], "dns": []},
+            {"interfaces": [eth0], "dns": []},
+            {"interfaces": [dict(eth0, gateway_status="Failure")], "dns": []},
+            {"interfaces": [], "dns": []},
+        ]
+        sleeps = []
+
+        def sleep(seconds):
+            if len(sleeps) == len(ticks) - 1:
+                raise KeyboardInterrupt
+            sleeps.append(seconds)
+
+        module = network_services
+        args = argparse.Namespace(watch=5, dhcp=False, json=True, terse=False)
+        with mock.patch.object(module, "open_netlink_monitor", return_value=None), \
+                mock.patch.object(module, "get_active_network_interfaces", return_value=["eth0"]), \
+                mock.patch.object(module, "collect_network_snapshot", return_value={}), \
+                mock.patch.object(module, "read_nameservers", return_value=[]), \
+                mock.patch.object(module, "collect_results", side_effect=ticks), \
+                mock.patch("time.sleep", side_effect=sleep), \
+                mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            watch(args)
+        lines = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual([line["interfaces"] for line in lines], [ticks[0]["interfaces"], ticks[2]["interfaces"], []])
+        self.assertEqual(lines[-1]["removed"], ["eth0"])
+        self.assertTrue(all(0 < seconds <= 5 for seconds in sleeps))
+
+    def test_run_probes_honours_deadline(self):
+        def fail():
+            raise OSError("unreachable")
+
+        start = time.perf_counter()
+        results = run_probes({("fast",): lambda: True, ("failing",): fail, ("slow",): lambda: time.sleep(0.5)}, deadline=0.1)
+        self.assertLess(time.perf_counter() - start, 0.4)
+        self.assertEqual(results, {("fast",): True, ("failing",): None, ("slow",): None})
+        self.assertTrue(all(thread.daemon for thread in threading.enumerate() if thread is not threading.main_thread()))
+
+    def test_collect_results_probes_a_shared_gateway_once(self):
+        from unittest import mock
+
+        snapshot = {name: {"ip": f"192.0.2.{index + 2}", "cidr": "24", "gateway": "192.0.2.1", "addresses": [], "ipv6": []}
+                    for index, name in enumerate(("eth0", "eth1", "eth2"))}
+        args = argparse.Namespace(gateway=True, dns=False, dhcp=False, fqdn="example.com", terse=False, deadline=1)
+        with mock.patch.object(network_services, "probe_tcp", return_value=True) as probe_tcp:
+            results = collect_results(args, list(snapshot), snapshot, [])
+        probe_tcp.assert_called_once_with("192.0.2.1", 80)
+        self.assertEqual([iface["gateway_status"] for iface in results["interfaces"]], ["OK"] * 3)
+
+if __name__ == "__main__":
+    unittest.main()
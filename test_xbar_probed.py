@@ -0,0 +1,96 @@
+"""
+Unit tests for xbar_probed.py, run them with ./xbar_probed.py --self-test
+"""
+
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from xbar_probed import DEFAULT_DNS_DOMAIN, INTERVALS, PROBES, probe_dns, run, write_cache
+
+class TestProbeDaemon(unittest.TestCase):
+    """Unit tests for the probe daemon."""
+
+    def test_write_cache(self):
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, "new", "xbar-probed.json")
+            write_cache(path, {"ping": {"updated": 1.0, "interval": 2, "value": {"rtt": 3.5}}})
+            write_cache(path, {"ping": {"updated": 2.0, "interval": 2, "value": {"rtt": None}}})
+            with open(path) as f:
+                data = json.load(f)
+            self.assertEqual(os.listdir(os.path.dirname(path)), ["xbar-probed.json"])
+        self.assertEqual(data, {"version": 1, "probes": {"ping": {"updated": 2.0, "interval": 2, "value": {"rtt": None}}}})
+
+    def test_plugins_read_what_the_daemon_writes(self):
+        from xbar_common import read_probed_cache  # on the path xbar_probed sets up
+
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, "xbar-probed.json")
+            write_cache(path, {
+                "ping": {"updated": time.time() - 7, "interval": 2, "value": {"rtt": 3.5}},
+                "ssh": {"updated": time.time() - 5, "interval": 60, "value": {"reachable": {}, "active": []}},
+            })
+            self.assertIsNone(read_probed_cache("ping", path))  # missed more than three intervals
+            self.assertEqual(read_probed_cache("ssh", path), {"reachable": {}, "active": []})
+            self.assertIsNone(read_probed_cache("dns", path))
+            self.assertIsNone(read_probed_cache("ping", os.path.join(root, "missing.json")))
+
+    def test_run_once(self):
+        def fail(config):
+            raise RuntimeError("probe crashed")
+
+        probes = {"ping": lambda config: {"rtt": 1.0}, "dns": fail, "ssh": lambda config: {"reachable": {}, "active": []}}
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, "xbar-probed.json")
+            with mock.patch.dict(PROBES, probes, clear=True):
+                run(SimpleNamespace(cache=path), once=True)
+            with open(path) as f:
+                data = json.load(f)
+        self.assertEqual(sorted(data["probes"]), ["ping", "ssh"])
+        self.assertEqual(data["probes"]["ping"]["value"], {"rtt": 1.0})
+        self.assertEqual(data["probes"]["ssh"]["interval"], INTERVALS["ssh"])
+
+    def test_probe_dns_asks_every_server(self):
+        with mock.patch("xbar_probed.get_dns_servers", return_value=["192.0.2.53", "198.51.100.53"]), \
+                mock.patch("xbar_probed.query_dns", side_effect=lambda server, fqdn, timeout: server == "192.0.2.53") as query:
+            self.assertEqual(probe_dns(None), {"192.0.2.53": True, "198.51.100.53": False})
+        self.assertEqual(sorted(call.args[:2] for call in query.call_args_list),
+                         [("192.0.2.53", DEFAULT_DNS_DOMAIN), ("198.51.100.53", DEFAULT_DNS_DOMAIN)])
+
+    def test_query_dns_asks_the_given_server(self):
+        from xbar_common import query_dns
+
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(("127.0.0.1", 0))
+        self.addCleanup(server.close)
+        port = server.getsockname()[1]
+        questions = []
+
+        def answer():
+            # A stray datagram first, then NOERROR for example.com and NXDOMAIN for anything else
+            while True:
+                try:
+                    query, client = server.recvfrom(512)
+                except OSError:
+                    return  # closed
+                questions.append(query[12:-4])
+                rcode = 0 if query[12:-4] == b"\x07example\x03com\x00" else 3
+                server.sendto(b"\x00" * 12, client)
+                server.sendto(query[:2] + bytes([0x81, 0x80 | rcode]) + query[4:], client)
+
+        threading.Thread(target=answer, daemon=True).start()
+        self.assertTrue(query_dns("127.0.0.1", "example.com", timeout=1, port=port))
+        self.assertFalse(query_dns("127.0.0.1", "missing.example", timeout=1, port=port))
+        self.assertEqual(len(questions), 2)
+        server.close()
+        self.assertFalse(query_dns("127.0.0.1", "example.com", timeout=0.2, port=port))
+        self.assertFalse(query_dns("not an address", "example.com"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,7 +5,8 @@ import logging
 import os
 import re
 import subprocess
-import urllib.request
+
+from xbar_common import read_probed_cache
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -80,25 +81,39 @@ def initialize() -> None:
     logging.info(f"yellow_threshold: {yellow_threshold}")
     logging.info(f"colors: {colors}")
 
+def print_offline() -> None:
+    """
+    Print the offline status.
+    """
+    print(f"✧|color={colors['offline']} dropdown=false")
+    print("---")
+    print(f"No reply from {ping_address} within {ping_timeout} seconds")
+
 def main() -> None:
     """
     Main function to run the script logic.
     """
     initialize()
 
-    ping_output = perform_ping(ping_address, ping_timeout)
-    if ping_output is None:
-        print(f"✧|color={colors['offline']} dropdown=false")
-        print("---")
-        print(f"No reply from {ping_address} within {ping_timeout} seconds")
-        return
-
-    rtt = parse_rtt(ping_output)
-    if rtt is None:
-        print(f"‽|color={colors['error']} dropdown=false")
-        print("---")
-        print("Error parsing RTT")
-        return
+    # Use the daemon's ping if it's pinging the same address, rather than forking our own
+    cached = read_probed_cache("ping")
+    if cached is not None and cached["address"] == ping_address:
+        rtt = cached["rtt"]
+        if rtt is None:
+            print_offline()
+            return
+    else:
+        ping_output = perform_ping(ping_address, ping_timeout)
+        if ping_output is None:
+            print_offline()
+            return
+
+        rtt = parse_rtt(ping_output)
+        if rtt is None:
+            print(f"‽|color={colors['error']} dropdown=false")
+            print("---")
+            print("Error parsing RTT")
+            return
 
     color = get_color_for_rtt(rtt, yellow_threshold)
 
@@ -11,14 +11,33 @@ Description: This xbar script checks various network conditions and displays the
 import subprocess
 import socket
 import logging
-import urllib.request
 import json
 import atexit
 
+from xbar_common import query_dns, read_probed_cache
+
 RIPE_WHOIS_SERVER = "whois.ripe.net"
 CACHE_FILE = "whois_cache.json"
+DEFAULT_PING_TIMEOUT = 1
+DEFAULT_PING_ADDRESS = "1.1.1.1"
+DEFAULT_DNS_DOMAIN = "www.google.com"
+DEFAULT_HTTP_URL = "http://www.google.com"
 cache = {}
 
+TESTS = {
+    "ping_1": {"name": f"Ping {DEFAULT_PING_ADDRESS}"},
+    "ping_gateway": {"name": "Ping gateway"},
+    "dns_servers": {"name": "DNS"},
+    "http": {"name": "HTTP"},
+    "public_ip": {"name": "Public IP"},
+}
+
+STATUS_INDICATORS = {
+    "all_good": {"icon": "✦", "color": "Chartreuse"},
+    "mostly_bad": {"icon": "✧", "color": "Gold"},
+    "all_bad": {"icon": "✧", "color": "Crimson"},
+}
+
 # Load cache from file
 def load_cache():
     global cache
@@ -65,7 +84,32 @@ def query_ripe_whois(ip):
     return "Unknown"
 
 def check_network_conditions():
-    pass
+    # Every check comes from the probe daemon when it's running, and is done here otherwise
+    ping = read_probed_cache("ping")
+    if ping is not None and ping["address"] == DEFAULT_PING_ADDRESS:
+        ping_1 = ping["rtt"] is not None
+    else:
+        ping_1 = perform_ping(DEFAULT_PING_ADDRESS, DEFAULT_PING_TIMEOUT)
+
+    gateway = read_probed_cache("gateway")
+    ping_gateway = gateway["success"] if gateway is not None else perform_ping(get_default_gateway(), DEFAULT_PING_TIMEOUT)
+
+    servers = get_dns_servers()
+    dns = read_probed_cache("dns")
+    if dns is not None:
+        dns_servers = [dns.get(server, False) for server in servers]
+    else:
+        dns_servers = [query_dns(server, DEFAULT_DNS_DOMAIN, DEFAULT_PING_TIMEOUT) for server in servers]
+
+    http = read_probed_cache("http")
+    public_ip = read_probed_cache("public_ip")
+    return {
+        "ping_1": ping_1,
+        "ping_gateway": ping_gateway,
+        "dns_servers": dns_servers,
+        "http": http["success"] if http is not None else test_http(DEFAULT_HTTP_URL),
+        "public_ip": (public_ip["ip"], public_ip["owner"]) if public_ip is not None else get_public_ip_info(),
+    }
 
 def run_command(command):
     return subprocess.run(command, capture_output=True, text=True, check=True).stdout.strip()
@@ -97,16 +141,9 @@ def perform_ping(address, timeout):
         logging.error(f"Ping failed: {e}")
     return False
 
-def query_dns(server, domain):
-    try:
-        socket.setdefaulttimeout(DEFAULT_PING_TIMEOUT)
-        socket.gethostbyname_ex(domain)
-        return True
-    except socket.error as e:
-        logging.error(f"DNS query failed: {e}")
-    return False
-
 def test_http(url):
+    # urllib.request pulls in http.client, email and ssl; only pay for it when testing HTTP
+    import urllib.request
     try:
         response = urllib.request.urlopen(url, timeout=DEFAULT_PING_TIMEOUT)
         return response.status == 200
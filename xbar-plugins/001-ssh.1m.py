@@ -22,9 +22,10 @@ import logging
 from contextlib import contextmanager
 from concurrent.futures import ThreadPoolExecutor
 import configparser
-import subprocess
 import unittest
 
+from xbar_common import read_probed_cache
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -85,6 +86,7 @@ def check_ssh(ip):
 
 def check_active_ssh(host):
     """Check if there are any active SSH connections to the host."""
+    import subprocess
     try:
         result = subprocess.run(['ps', 'aux'], stdout=subprocess.PIPE)
         processes = result.stdout.decode('utf-8')
@@ -124,11 +126,19 @@ def display_results(hosts):
     """Display the SSH connectivity results."""
     output_lines = []
     any_success = False
+    # Hosts the probe daemon knows about need no connect or ps of our own
+    probed = read_probed_cache("ssh") or {"reachable": {}, "active": []}
 
     def process_host(host, ip):
         nonlocal any_success
-        if ip and check_ssh(ip):
-            status_icon = ICONS["active"] if check_active_ssh(host) else ICONS["green"]
+        if ip in probed["reachable"]:
+            reachable = probed["reachable"][ip]
+            active = host in probed["active"]
+        else:
+            reachable = bool(ip) and check_ssh(ip)
+            active = reachable and check_active_ssh(host)
+        if reachable:
+            status_icon = ICONS["active"] if active else ICONS["green"]
             color = COLORS["green"]
             any_success = True
         else:
@@ -0,0 +1,56 @@
+"""
+Helpers shared by the xbar plugins and xbar_probed.py: the reader for the results cache the
+daemon publishes, and the DNS check both of them run.
+
+Not a plugin itself, so it is not executable and xbar leaves it alone. The plugins import it
+from their own directory, so it must be installed next to them.
+"""
+
+import json
+import logging
+import os
+import time
+
+PROBED_CACHE = os.getenv('XBAR_PROBED_CACHE', os.path.expanduser("~/.cache/xbar-probed.json"))
+# A result is stale once the daemon has missed this many of the probe's intervals
+STALE_INTERVALS = 3
+
+def read_probed_cache(name, path=None):
+    """Return the latest result of a probe from xbar_probed.py's cache, or None if the daemon isn't keeping it fresh."""
+    try:
+        with open(path or PROBED_CACHE) as f:
+            entry = json.load(f)["probes"][name]
+    except (OSError, ValueError, KeyError):
+        return None
+    if time.time() - entry["updated"] > STALE_INTERVALS * entry["interval"]:
+        return None
+    return entry["value"]
+
+def query_dns(server, domain, timeout=1, port=53):
+    """Ask one nameserver for the A record of a domain, and return whether it answered without an error."""
+    # Only the DNS check needs these, plugins that just read the cache don't import them
+    import socket
+    import struct
+
+    try:
+        family, _type, _proto, _canonname, address = socket.getaddrinfo(server, port, type=socket.SOCK_DGRAM, flags=socket.AI_NUMERICHOST)[0]
+        query_id = int.from_bytes(os.urandom(2), "big")
+        question = b"".join(bytes([len(label)]) + label for label in domain.rstrip(".").encode("idna").split(b"."))
+        # Header with recursion desired and one question, then the name, type A and class IN
+        query = struct.pack("!HHHHHH", query_id, 0x0100, 1, 0, 0, 0) + question + b"\0" + struct.pack("!HH", 1, 1)
+        deadline = time.monotonic() + timeout
+        with socket.socket(family, socket.SOCK_DGRAM) as sock:
+            sock.connect(address)
+            sock.send(query)
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise socket.timeout("timed out")
+                sock.settimeout(remaining)
+                response = sock.recv(512)
+                # Skip stray datagrams, and read the rcode of the response to this query
+                if len(response) >= 12 and struct.unpack_from("!H", response)[0] == query_id and response[2] & 0x80:
+                    return response[3] & 0x0F == 0
+    except (OSError, UnicodeError) as e:
+        logging.error(f"DNS query to {server} failed: {e}")
+    return False
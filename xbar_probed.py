@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Probe daemon for the xbar plugins in xbar-plugins/
+
+Runs every network probe the plugins need (ping, gateway, DNS, HTTP, public IP, SSH hosts)
+on its own interval in one long-running process, and publishes the latest results to a shared
+JSON cache file. The plugins read that file and return in milliseconds without forking, and fall
+back to probing themselves when the daemon isn't running.
+
+Example usage:
+    ./xbar_probed.py &
+    ./xbar_probed.py --once --cache -
+"""
+
+import argparse
+import heapq
+import json
+import logging
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# The helpers the plugins share, the cache format and the DNS check among them
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "xbar-plugins"))
+from xbar_common import query_dns
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Default constants, the same environment variables as the plugins
+DEFAULT_CACHE_PATH = os.path.expanduser("~/.cache/xbar-probed.json")
+DEFAULT_SSH_CONFIG_PATH = os.path.expanduser("~/.ssh/config")
+DEFAULT_PING_TIMEOUT = 1
+DEFAULT_PING_ADDRESS = "1.1.1.1"
+DEFAULT_DNS_DOMAIN = "www.google.com"
+DEFAULT_HTTP_URL = "http://www.google.com"
+DEFAULT_PUBLIC_IP_URL = "https://icanhazip.com"
+RIPE_WHOIS_SERVER = "whois.ripe.net"
+whois_cache = {}
+
+ping_timeout = int(os.getenv('PING_TIMEOUT', DEFAULT_PING_TIMEOUT))
+ping_address = os.getenv('PING_ADDRESS', DEFAULT_PING_ADDRESS)
+cache_path = os.getenv('XBAR_PROBED_CACHE', DEFAULT_CACHE_PATH)
+
+# Seconds between runs of each probe, matching the refresh rate of the plugin that shows it
+INTERVALS = {
+    "ping": 2,
+    "gateway": 15,
+    "dns": 15,
+    "http": 15,
+    "public_ip": 300,
+    "ssh": 60,
+}
+
+def perform_ping(address, timeout):
+    """Ping an address once and return the RTT in ms, or None if there was no reply."""
+    try:
+        result = subprocess.run(["ping", "-c", "1", "-W", str(timeout), address],
+                                capture_output=True, text=True, check=False)
+    except (subprocess.SubprocessError, OSError) as e:
+        logging.error(f"Ping failed: {e}")
+        return None
+    if result.returncode != 0:
+        return None
+    match = re.search(r'time=(\d+(?:\.\d+)?)', result.stdout)
+    return float(match.group(1)) if match else None
+
+def get_default_gateway():
+    """Return the default gateway, from /proc on Linux and route(8) elsewhere."""
+    try:
+        with open("/proc/net/route") as f:
+            for line in f.readlines()[1:]:
+                fields = line.split()
+                if fields[1] == "00000000" and int(fields[3], 16) & 0x2:
+                    return socket.inet_ntoa(int(fields[2], 16).to_bytes(4, "little"))
+    except OSError:
+        pass
+    try:
+        result = subprocess.run(["route", "-n", "get", "default"], capture_output=True, text=True, check=True)
+        for line in result.stdout.splitlines():
+            if "gateway" in line:
+                return line.split(":")[-1].strip()
+    except (subprocess.SubprocessError, OSError) as e:
+        logging.error(f"Error getting default gateway: {e}")
+    return ""
+
+def get_dns_servers():
+    """Return the nameservers listed in /etc/resolv.conf."""
+    try:
+        with open('/etc/resolv.conf') as f:
+            return [line.split()[1] for line in f if line.strip().startswith('nameserver')]
+    except OSError as e:
+        logging.error(f"Error reading DNS servers: {e}")
+    return []
+
+def query_ripe_whois(ip):
+    """Return the first descr: line RIPE has for an IP."""
+    if ip in whois_cache:
+        return whois_cache[ip]
+    try:
+        with socket.create_connection((RIPE_WHOIS_SERVER, 43), timeout=5) as s:
+            s.sendall(f"-B {ip}\n".encode())
+            response = b""
+            while True:
+                data = s.recv(1024)
+                if not data:
+                    break
+                response += data
+        for line in response.decode('utf-8', errors='ignore').splitlines():
+            if line.startswith("descr:"):
+                whois_cache[ip] = line.split(":", 1)[1].strip()
+                return whois_cache[ip]
+    except OSError as e:
+        logging.error(f"RIPE WHOIS query failed: {e}")
+    return "Unknown"
+
+def parse_ssh_hosts(ssh_config_path):
+    """Return the Host -> HostName pairs of an ssh config, skipping wildcard hosts."""
+    hosts = {}
+    host = None
+    try:
+        with open(ssh_config_path) as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("Host "):
+                    host = line.split()[1]
+                    if "*" in host or "?" in host:
+                        host = None
+                    else:
+                        hosts[host] = ""
+                elif host and line.startswith("HostName "):
+                    hosts[host] = line.split()[1]
+    except OSError as e:
+        logging.error(f"Error reading SSH config: {e}")
+    return hosts
+
+def probe_ping(config):
+    return {"address": ping_address, "timeout": ping_timeout, "rtt": perform_ping(ping_address, ping_timeout)}
+
+def probe_gateway(config):
+    gateway = get_default_gateway()
+    return {"gateway": gateway, "success": bool(gateway) and perform_ping(gateway, ping_timeout) is not None}
+
+def probe_dns(config):
+    # Ask every server itself, the system resolver would report one answer for all of them
+    servers = get_dns_servers()
+    with ThreadPoolExecutor(max_workers=max(1, len(servers))) as executor:
+        answers = executor.map(lambda server: query_dns(server, DEFAULT_DNS_DOMAIN, ping_timeout), servers)
+        return dict(zip(servers, answers))
+
+def probe_http(config):
+    # urllib.request is slow to import, but the daemon only pays for it once
+    import urllib.request
+    try:
+        with urllib.request.urlopen(DEFAULT_HTTP_URL, timeout=ping_timeout) as response:
+            return {"url": DEFAULT_HTTP_URL, "success": response.status == 200}
+    except Exception as e:
+        logging.error(f"HTTP request failed: {e}")
+    return {"url": DEFAULT_HTTP_URL, "success": False}
+
+def probe_public_ip(config):
+    import urllib.request
+    try:
+        with urllib.request.urlopen(DEFAULT_PUBLIC_IP_URL, timeout=5) as response:
+            ip = response.read().decode().strip()
+    except Exception as e:
+        logging.error(f"Failed to get public IP: {e}")
+        return {"ip": "Unknown", "owner": "Unknown"}
+    return {"ip": ip, "owner": query_ripe_whois(ip)}
+
+def probe_ssh(config):
+    hosts = parse_ssh_hosts(config.ssh_config)
+    # One ps for all hosts instead of one per host
+    try:
+        processes = subprocess.run(['ps', 'aux'], capture_output=True, text=True).stdout
+    except OSError as e:
+        logging.error(f"Error checking active SSH connections: {e}")
+        processes = ""
+
+    def reachable(ip):
+        try:
+            with socket.create_connection((ip, 22), timeout=1):
+                return True
+        except OSError:
+            return False
+
+    targets = sorted({ip for ip in hosts.values() if ip})
+    with ThreadPoolExecutor(max_workers=max(1, min(32, len(targets)))) as executor:
+        status = dict(zip(targets, executor.map(reachable, targets)))
+    return {
+        "reachable": status,
+        "active": sorted(host for host in hosts if f"ssh {host}" in processes),
+    }
+
+PROBES = {
+    "ping": probe_ping,
+    "gateway": probe_gateway,
+    "dns": probe_dns,
+    "http": probe_http,
+    "public_ip": probe_public_ip,
+    "ssh": probe_ssh,
+}
+
+def write_cache(path, results):
+    """Atomically replace the cache file, so readers never see a partial write."""
+    data = json.dumps({"version": 1, "probes": results})
+    if path == "-":
+        print(data)
+        return
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".xbar-probed-")
+    with os.fdopen(fd, "w") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def run(config, once=False):
+    """Run every probe on its own interval, publishing results as they come in."""
+    results = {}
+    schedule = [(0.0, name) for name in PROBES]
+    running = {}
+    with ThreadPoolExecutor(max_workers=len(PROBES)) as executor:
+        while schedule or running:
+            # Start everything that is due; a probe still running from last time is not started twice
+            while schedule and schedule[0][0] <= time.monotonic():
+                _due, name = heapq.heappop(schedule)
+                if name not in running:
+                    running[name] = executor.submit(PROBES[name], config)
+            timeout = max(0.0, schedule[0][0] - time.monotonic()) if schedule else None
+            done, _pending = wait(running.values(), timeout=timeout, return_when=FIRST_COMPLETED)
+            for name in [name for name, future in running.items() if future in done]:
+                future = running.pop(name)
+                try:
+                    results[name] = {"updated": time.time(), "interval": INTERVALS[name], "value": future.result()}
+                except Exception as e:
+                    logging.error(f"Probe {name} failed: {e}")
+                if not once:
+                    heapq.heappush(schedule, (time.monotonic() + INTERVALS[name], name))
+            if done and not (once and running):
+                write_cache(config.cache, results)
+
+def main():
+    """Main function to handle command-line arguments and run the daemon."""
+    parser = argparse.ArgumentParser(description="Probe daemon publishing network status for the xbar plugins")
+    parser.add_argument('-c', '--cache', type=str, default=cache_path, help=f'Cache file to publish results to, "-" for stdout (default: {cache_path})')
+    parser.add_argument('-i', '--ssh-config', type=str, default=DEFAULT_SSH_CONFIG_PATH, help='Path to SSH config file')
+    parser.add_argument('--once', action='store_true', help='Run every probe once, publish and exit')
+    parser.add_argument('--self-test', action='store_true', help='Run unit tests')
+    config = parser.parse_args()
+
+    if config.self_test:
+        import unittest
+        unittest.main(module='test_xbar_probed', argv=[sys.argv[0]])
+
+    try:
+        run(config, once=config.once)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()